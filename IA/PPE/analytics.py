@@ -0,0 +1,320 @@
+"""
+Log analytics over honeypot_sessions.jsonl without rescanning it.
+
+An incremental ingester copies the event log (active file and rotated,
+compressed segments, see log_writer.py) into a SQLite table with one column
+per field we query on and indexes on ts, sid, ip, type and cmd. Questions
+are then answered by SQL aggregates running inside SQLite over the indexed
+columns, not by per-event Python loops.
+
+Ingestion is resumable: each source file is identified by a hash of its
+first line, and we remember how many lines (and, for the plain active file,
+how many bytes) were already loaded. A rotated segment therefore isn't
+loaded twice when the active file it came from was, and a fully ingested
+compressed segment is skipped without being decompressed.
+
+    python analytics.py summary --since 7d
+    python analytics.py top-ips --since 2026-01-01
+    python analytics.py llm-commands --top 20
+    python analytics.py sessions
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from log_writer import open_segment, read_index, segment_path
+from utils import LOG_DIR, EVENT_LOG
+
+DB_PATH = LOG_DIR / "analytics.sqlite"
+BATCH_SIZE = 5000
+
+# events of an LLM request (llm_adapter.py); their `cmd` is what the model was asked
+LLM_TYPES = ("llm_success", "llm_cache_hit", "llm_corpus_hit", "llm_empty", "llm_timeout",
+             "llm_connection_error", "llm_error", "llm_stream_interrupted")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts TEXT NOT NULL,
+    sid TEXT,
+    ip TEXT,
+    port INTEGER,
+    type TEXT NOT NULL,
+    cmd TEXT,
+    cwd TEXT,
+    code INTEGER,
+    ms REAL,
+    backend TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_sid ON events (sid, ts);
+CREATE INDEX IF NOT EXISTS events_ip ON events (ip, ts);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, ts);
+CREATE INDEX IF NOT EXISTS events_cmd ON events (cmd, type);
+CREATE TABLE IF NOT EXISTS sources (
+    fingerprint TEXT PRIMARY KEY,
+    name TEXT,
+    lines INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+def connect(path: Path = DB_PATH) -> sqlite3.Connection:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path))
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+# =========================
+# INGESTION
+# =========================
+def _row(line: str):
+    try:
+        e = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(e, dict) or "type" not in e:
+        return None
+    ms = e.get("total_ms")
+    return (e.get("ts", ""), e.get("sid"), e.get("ip"), e.get("port"), e["type"], e.get("cmd") or None,
+            e.get("cwd"), e.get("code"), ms, e.get("backend"))
+
+
+def _fingerprint(first_line: str) -> str:
+    return hashlib.blake2b(first_line.encode("utf-8", "surrogatepass"), digest_size=12).hexdigest()
+
+
+def _ingest_file(db: sqlite3.Connection, path: Path, known_events: int = None) -> int:
+    """Load the new lines of one source; returns the number of events added."""
+    plain = path.suffix == ".jsonl"
+    with open_segment(path) as f:
+        first = f.readline()
+    if not first.endswith("\n"):
+        return 0  # empty, or the writer is mid-line
+    fp = _fingerprint(first)
+    row = db.execute("SELECT lines, offset FROM sources WHERE fingerprint = ?", (fp,)).fetchone()
+    lines, offset = row if row else (0, 0)
+    if known_events is not None and lines >= known_events:
+        return 0  # rotated segment already loaded (from the active file)
+
+    if plain:
+        # the active file: resume at the byte offset
+        f = path.open("rb")
+        f.seek(offset)
+    else:
+        f = open_segment(path)
+        for _ in range(lines):
+            if not f.readline():
+                break
+    added, batch = 0, []
+    try:
+        for raw in f:
+            if plain:
+                if not raw.endswith(b"\n"):
+                    break  # partial last line: picked up next time
+                offset += len(raw)
+                raw = raw.decode("utf-8", "replace")
+            lines += 1
+            r = _row(raw)
+            if r is not None:
+                batch.append(r)
+            if len(batch) >= BATCH_SIZE:
+                added += _flush(db, batch, fp, path.name, lines, offset)
+                batch = []
+        added += _flush(db, batch, fp, path.name, lines, offset)
+    finally:
+        f.close()
+    return added
+
+
+def _flush(db, batch: list, fp: str, name: str, lines: int, offset: int) -> int:
+    with db:
+        db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (fp, name, lines, offset))
+    return len(batch)
+
+
+def ingest(db: sqlite3.Connection, log_path: Path = EVENT_LOG) -> dict:
+    """Bring the store up to date with the event log (rotated segments first)."""
+    log_path = Path(log_path)
+    t0 = time.perf_counter()
+    added = files = 0
+    for seg in read_index(log_path):
+        path = segment_path(log_path, seg)
+        if path.exists():
+            added += _ingest_file(db, path, seg.get("events"))
+            files += 1
+    if log_path.exists():
+        added += _ingest_file(db, log_path)
+        files += 1
+    return {"added": added, "files": files, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+# =========================
+# QUERIES
+# =========================
+def parse_since(value: str):
+    """"7d", "12h", "30m" (relative to now) or an ISO timestamp."""
+    if not value:
+        return None
+    units = {"d": "days", "h": "hours", "m": "minutes"}
+    if value[:-1].isdigit() and value[-1] in units:
+        t = datetime.now(timezone.utc) - timedelta(**{units[value[-1]]: int(value[:-1])})
+        return t.isoformat().replace("+00:00", "Z")
+    return value
+
+
+def _window(since, until, prefix: str = "WHERE") -> tuple[str, list]:
+    clauses, params = [], []
+    if since:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until:
+        clauses.append("ts <= ?")
+        params.append(until)
+    return (f"{prefix} " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _median(db, sql: str, params: list):
+    """Median of the single column returned by `sql`, computed in SQLite."""
+    n = db.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    if not n:
+        return None
+    row = db.execute(f"SELECT v FROM ({sql}) ORDER BY v LIMIT 1 OFFSET ?", params + [(n - 1) // 2]).fetchone()
+    return row[0]
+
+
+def summary(db, since=None, until=None) -> dict:
+    where, params = _window(since, until)
+    row = db.execute(f"""
+        SELECT COUNT(*), COUNT(DISTINCT sid), COUNT(DISTINCT ip), MIN(ts), MAX(ts),
+               SUM(type = 'command'), SUM(type IN ({",".join("?" * len(LLM_TYPES))}))
+        FROM events {where}""", list(LLM_TYPES) + params).fetchone()
+    return {"events": row[0], "sessions": row[1], "ips": row[2], "first_ts": row[3], "last_ts": row[4],
+            "commands": row[5] or 0, "llm_requests": row[6] or 0}
+
+
+def event_types(db, since=None, until=None, top: int = 50) -> list:
+    where, params = _window(since, until)
+    return db.execute(f"SELECT type, COUNT(*) n FROM events {where} GROUP BY type ORDER BY n DESC LIMIT ?",
+                      params + [top]).fetchall()
+
+
+def top_ips(db, since=None, until=None, top: int = 20) -> list:
+    """(ip, sessions, commands, first_ts, last_ts)."""
+    where, params = _window(since, until)
+    return db.execute(f"""
+        SELECT ip, COUNT(DISTINCT sid), SUM(type = 'command') c, MIN(ts), MAX(ts)
+        FROM events {where} GROUP BY ip ORDER BY c DESC, 2 DESC LIMIT ?""", params + [top]).fetchall()
+
+
+def top_commands(db, since=None, until=None, top: int = 20) -> list:
+    """(cmd, times typed, sessions)."""
+    where, params = _window(since, until, "AND")
+    return db.execute(f"""
+        SELECT cmd, COUNT(*) n, COUNT(DISTINCT sid) FROM events
+        WHERE type = 'command' {where} GROUP BY cmd ORDER BY n DESC LIMIT ?""", params + [top]).fetchall()
+
+
+def llm_commands(db, since=None, until=None, top: int = 20) -> list:
+    """(cmd, LLM requests, answered by the model, cache/corpus hits, failures, avg ms of model calls)."""
+    where, params = _window(since, until, "AND")
+    return db.execute(f"""
+        SELECT cmd, COUNT(*) n,
+               SUM(type = 'llm_success'),
+               SUM(type IN ('llm_cache_hit', 'llm_corpus_hit')),
+               SUM(type IN ('llm_empty', 'llm_timeout', 'llm_connection_error', 'llm_error')),
+               ROUND(AVG(CASE WHEN type = 'llm_success' THEN ms END), 1)
+        FROM events WHERE type IN ({",".join("?" * len(LLM_TYPES))}) AND cmd IS NOT NULL {where}
+        GROUP BY cmd ORDER BY n DESC LIMIT ?""", list(LLM_TYPES) + params + [top]).fetchall()
+
+
+def sessions(db, since=None, until=None) -> dict:
+    """Session count and medians of duration (s) and commands per session."""
+    where, params = _window(since, until)
+    per_session = f"""
+        SELECT sid, (julianday(MAX(ts)) - julianday(MIN(ts))) * 86400.0 AS duration,
+               SUM(type = 'command') AS commands
+        FROM events {where} GROUP BY sid"""
+    count = db.execute(f"SELECT COUNT(*) FROM ({per_session})", params).fetchone()[0]
+    duration = _median(db, f"SELECT duration AS v FROM ({per_session})", params)
+    commands = _median(db, f"SELECT commands AS v FROM ({per_session})", params)
+    return {"sessions": count,
+            "median_duration_s": round(duration, 1) if duration is not None else None,
+            "median_commands": commands}
+
+
+def llm_latency(db, since=None, until=None) -> dict:
+    """Model call latency percentiles (llm_success total_ms)."""
+    where, params = _window(since, until, "AND")
+    sql = f"SELECT ms AS v FROM events WHERE type = 'llm_success' AND ms IS NOT NULL {where}"
+    n = db.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    out = {"calls": n}
+    for name, p in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        row = db.execute(f"SELECT v FROM ({sql}) ORDER BY v LIMIT 1 OFFSET ?",
+                         params + [min(n - 1, int(n * p))]).fetchone() if n else None
+        out[name] = row[0] if row else None
+    return out
+
+
+def _print_rows(header: tuple, rows: list):
+    widths = [max(len(str(h)), *(len(str(r[i])[:48]) for r in rows)) if rows else len(str(h))
+              for i, h in enumerate(header)]
+    print("  ".join(f"{h:<{w}}" for h, w in zip(header, widths)))
+    for r in rows:
+        print("  ".join(f"{str(v)[:48]:<{w}}" for v, w in zip(r, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queries over the honeypot event log (indexed SQLite copy).")
+    parser.add_argument("query", nargs="?", default="summary",
+                        choices=("ingest", "summary", "types", "top-ips", "top-commands", "llm-commands",
+                                 "sessions", "llm-latency"))
+    parser.add_argument("--log", default=str(EVENT_LOG), metavar="EVENT_LOG")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--since", default=None, help="ISO timestamp or 7d / 12h / 30m")
+    parser.add_argument("--until", default=None, help="ISO timestamp")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--no-ingest", action="store_true", help="query the store as it is")
+    args = parser.parse_args()
+
+    db = connect(Path(args.db))
+    if not args.no_ingest:
+        info = ingest(db, Path(args.log))
+        if args.query == "ingest" or info["added"]:
+            print(f"ingested {info['added']} events from {info['files']} files in {info['ms']} ms")
+    since = parse_since(args.since)
+    t0 = time.perf_counter()
+    q = args.query
+    if q == "summary":
+        for k, v in summary(db, since, args.until).items():
+            print(f"{k:<14}{v}")
+    elif q == "types":
+        _print_rows(("type", "events"), event_types(db, since, args.until, args.top))
+    elif q == "top-ips":
+        _print_rows(("ip", "sessions", "commands", "first", "last"), top_ips(db, since, args.until, args.top))
+    elif q == "top-commands":
+        _print_rows(("cmd", "count", "sessions"), top_commands(db, since, args.until, args.top))
+    elif q == "llm-commands":
+        _print_rows(("cmd", "requests", "model", "cached", "failed", "avg_ms"),
+                    llm_commands(db, since, args.until, args.top))
+    elif q == "sessions":
+        for k, v in sessions(db, since, args.until).items():
+            print(f"{k:<18}{v}")
+    elif q == "llm-latency":
+        for k, v in llm_latency(db, since, args.until).items():
+            print(f"{k:<8}{v}")
+    if q != "ingest":
+        print(f"({(time.perf_counter() - t0) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Asyncio front end for the honeypot (``python honeypot_ssh.py --mode asyncio``).
+
+All sessions are multiplexed on a single event loop with asyncssh instead of
+one paramiko thread per connection. Local commands run inline on the loop;
+only the blocking LLM call is pushed to a small, bounded thread pool.
+The number of concurrent sessions is capped: once the cap is reached the
+accept loop stops accepting and new clients wait in the kernel backlog.
+"""
+import asyncio
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncssh
+
+import ssh_handshake
+from utils import log_event
+from fs_engine import SessionState
+from line_input import AsyncLineReader
+from shell import execute
+from llm_adapter import prefetch_next, prefetch_session_end
+from honeypot_ssh import (
+    FAKE_USER,
+    FAKE_HOSTNAME,
+    HOME_DIR,
+    HOSTKEY_TYPES,
+    LLM_WORKERS,
+    DRAIN_SIGNAL,
+    DRAIN_TIMEOUT,
+    banner_text,
+    shell_prompt,
+    run_llm_request,
+    save_session,
+    checkpoint_session,
+    check_password,
+    record_line,
+    set_nodelay,
+    OutputStream,
+    CONNECTIONS,
+    SESSIONS,
+    SESSIONS_ACTIVE,
+    log,
+)
+
+# Seconds a client gets to authenticate / open its shell before we drop it
+LOGIN_TIMEOUT = 20
+SHELL_TIMEOUT = 10
+
+
+# =========================
+# ASYNCSSH SERVER
+# =========================
+class AsyncHoneypotServer(asyncssh.SSHServer):
+    def __init__(self, client_addr):
+        self.client_addr = client_addr
+        self.conn = None
+        self.auth_failures = 0
+
+    def connection_made(self, conn):
+        self.conn = conn
+
+    def begin_auth(self, username):
+        # always require a password, like the paramiko server
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        if check_password(self.client_addr, username, password):
+            return True
+        self.auth_failures += 1
+        if self.auth_failures >= ssh_handshake.AUTH_MAX_ATTEMPTS and self.conn is not None:
+            self.conn.close()  # out of attempts: don't wait for the login timeout
+        return False
+
+
+# =========================
+# SHELL SESSION
+# =========================
+async def send(process, text: str):
+    process.stdout.write(text.encode("utf-8"))
+    await process.stdout.drain()
+
+
+async def run_line(st: SessionState, cmd: str, session_id: str, addr, llm_pool: ThreadPoolExecutor,
+                   stream: OutputStream) -> tuple[str, int]:
+    """Async driver for shell.execute(): emulated stages run inline on the
+    loop, each LLM request on the pool."""
+    loop = asyncio.get_running_loop()
+    gen = execute(st, cmd, stream.write)
+    try:
+        req = next(gen)
+        while True:
+            answer = await loop.run_in_executor(llm_pool, run_llm_request, st, req, session_id, addr, stream)
+            req = gen.send(answer)
+    except StopIteration as done:
+        return done.value
+
+
+async def run_shell(process, session_id: str, addr, llm_pool: ThreadPoolExecutor, started: asyncio.Event):
+    started.set()
+    loop = asyncio.get_running_loop()
+    st = SessionState(user=FAKE_USER, home_dir=HOME_DIR, hostname=FAKE_HOSTNAME)
+    st.remote_ip = addr[0]
+    reader = AsyncLineReader(process)
+
+    try:
+        await send(process, banner_text())
+    except Exception as e:
+        log_event(session_id, addr, "send_failed", {"stage": "banner", "error": repr(e)})
+        process.exit(0)
+        return
+
+    SESSIONS.inc()
+    SESSIONS_ACTIVE.inc()
+    while True:
+        try:
+            await send(process, shell_prompt(st))
+            prompt_at = time.monotonic()
+        except Exception as e:
+            log_event(session_id, addr, "send_failed", {"stage": "prompt", "error": repr(e)})
+            break
+
+        try:
+            cmd = await reader.read_line()
+        except Exception as e:
+            log_event(session_id, addr, "read_failed", {"error": repr(e)})
+            break
+
+        if cmd is None:
+            break
+
+        cmd = cmd.strip()
+        if cmd == "":
+            continue
+
+        st.record_think_time(time.monotonic() - prompt_at)
+        st.add_history(cmd)
+        log_event(session_id, addr, "command", {"cmd": cmd, "cwd": st.cwd})
+
+        # output may come from an executor thread (streamed tokens): always
+        # hand it back to the loop so local and LLM output keep their order
+        stream = OutputStream(
+            lambda data: loop.call_soon_threadsafe(process.stdout.write, data.encode("utf-8"))
+        )
+        t0 = time.perf_counter()
+        output, exit_code = await run_line(st, cmd, session_id, addr, llm_pool, stream)
+        stream.close()
+        # local output was queued with call_soon_threadsafe too: let it go out
+        # before the next prompt, which is written directly
+        await asyncio.sleep(0)
+        record_line(st, time.perf_counter() - t0)
+
+        if stream.error is not None:
+            log_event(session_id, addr, "send_failed", {"stage": "output", "error": repr(stream.error)})
+            break
+        try:
+            await process.stdout.drain()
+        except Exception as e:
+            log_event(session_id, addr, "send_failed", {"stage": "output", "error": repr(e)})
+            break
+
+        log_event(session_id, addr, "output", {"output": output[:1000], "exit_code": exit_code,
+                                               "routes": st.routes})
+        if st.exited:
+            break
+        checkpoint_session(st, session_id)
+        prefetch_next(st, session_id)
+
+    SESSIONS_ACTIVE.dec()
+    log_event(session_id, addr, "session_end", {})
+    prefetch_session_end(session_id)
+    save_session(st, session_id, addr)
+
+    try:
+        process.exit(0)
+    except Exception:
+        pass
+    try:
+        process.get_extra_info("connection").close()
+    except Exception:
+        pass
+
+
+async def handle_connection(client_sock, addr, host_keys, llm_pool: ThreadPoolExecutor, fast: bool = False):
+    session_id = str(uuid.uuid4())
+    log_event(session_id, addr, "session_start", {})
+    CONNECTIONS.inc()
+    started = asyncio.Event()
+
+    def process_factory(process):
+        return run_shell(process, session_id, addr, llm_pool, started)
+
+    try:
+        conn = await asyncssh.run_server(
+            client_sock,
+            server_host_keys=host_keys,
+            kex_algs=ssh_handshake.async_kex_algs(fast),
+            server_factory=lambda: AsyncHoneypotServer(addr),
+            process_factory=process_factory,
+            encoding=None,
+            line_editor=False,
+            login_timeout=LOGIN_TIMEOUT,
+        )
+    except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+        log_event(session_id, addr, "ssh_negotiation_failed", {"error": repr(e)})
+        try:
+            client_sock.close()
+        except Exception:
+            pass
+        return
+
+    try:
+        await asyncio.wait_for(started.wait(), SHELL_TIMEOUT)
+    except asyncio.TimeoutError:
+        log_event(session_id, addr, "no_shell_request", {})
+        conn.close()
+
+    await conn.wait_closed()
+
+
+# =========================
+# ACCEPT LOOP
+# =========================
+async def _serve(sock: socket.socket, max_sessions: int, key_types: tuple, fast: bool):
+    loop = asyncio.get_running_loop()
+    sock.setblocking(False)
+    ssh_handshake.load_host_keys(key_types)  # generates missing ones
+    host_keys = [asyncssh.read_private_key(str(ssh_handshake.HOSTKEY_FILES[t])) for t in key_types]
+    llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+    slots = asyncio.Semaphore(max_sessions)
+    tasks = set()
+
+    async def guarded(client, addr):
+        try:
+            await handle_connection(client, addr, host_keys, llm_pool, fast)
+        finally:
+            slots.release()
+
+    # DRAIN_SIGNAL: stop accepting, return once the open sessions have ended
+    draining = asyncio.Event()
+    loop.add_signal_handler(DRAIN_SIGNAL, draining.set)
+    drain = asyncio.ensure_future(draining.wait())
+
+    while True:
+        # backpressure: don't accept more than max_sessions at once
+        await slots.acquire()
+        accept = asyncio.ensure_future(loop.sock_accept(sock))
+        await asyncio.wait((accept, drain), return_when=asyncio.FIRST_COMPLETED)
+        if not accept.done():
+            accept.cancel()
+            slots.release()
+            break
+        try:
+            client, addr = accept.result()
+        except Exception:
+            slots.release()
+            raise
+        if not ssh_handshake.throttle.allowed(addr[0]):
+            client.close()
+            slots.release()
+            continue
+        set_nodelay(client)
+        task = asyncio.create_task(guarded(client, addr))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    sock.close()
+    if tasks:
+        await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT)
+    log.info("drained, %d sessions left", len(tasks))
+
+
+def serve_asyncio(sock: socket.socket, max_sessions: int, key_types: tuple = HOSTKEY_TYPES, fast: bool = False):
+    try:
+        asyncio.run(_serve(sock, max_sessions, key_types, fast))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,407 @@
+"""
+End-to-end benchmark: replay real attacker sessions against a local honeypot.
+
+Starts honeypot_ssh.py in a scratch directory with the stub LLM backend, then
+a pool of paramiko clients replays session histories taken from
+logs/sessions/ (session_store.py) and the `command` events of the event log,
+one command at a time, waiting for the prompt before sending the next one.
+
+Reports connections/s, commands/s, per-command latency (p50/p95/p99) split
+by routing path (local = no LLM involved; taken from the server's own
+`output` events), server memory per session and CPU. Results are written as
+JSON (with the git commit) so runs can be compared across commits:
+
+    python bench_e2e.py --sessions 200 --concurrency 50
+    python bench_e2e.py --compare logs/bench/e2e-20260101T120000Z-abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.request import urlopen
+
+import paramiko
+
+import metrics
+from log_writer import iter_events
+from session_store import SESSIONS_DIR, iter_sessions
+from utils import EVENT_LOG
+
+HERE = Path(__file__).resolve().parent
+RESULTS_DIR = HERE / "logs" / "bench"
+
+MAX_COMMANDS = 40          # commands replayed per session (bots can paste hundreds)
+COMMAND_TIMEOUT = 60.0     # seconds to wait for the prompt after a command
+
+# used when there are no recorded sessions yet: a typical recon bot
+DEFAULT_SESSIONS = [
+    ["uname -a", "whoami", "id", "cat /proc/cpuinfo | grep name | wc -l", "free -m", "w",
+     "ls -la", "cd /tmp", "crontab -l", "cat /etc/passwd | head -5", "nproc", "uptime"],
+    ["cd ~", "ls -la .ssh", "cat .ssh/authorized_keys", "echo ssh-rsa AAAA > .ssh/authorized_keys",
+     "ps aux | grep -v grep | head", "netstat -tulpn", "history"],
+]
+
+PROMPT_RE = re.compile(rb"[\w.-]+@[\w.-]+:[^\r\n]*[$#] $")
+_WORKER_LABELS_RE = re.compile(r',?(?:worker|generation)="[^"]*"')   # added by supervisor.py
+
+
+# =========================
+# SESSION SOURCES
+# =========================
+def load_histories(sessions_dir: Path, event_log: Path, since: str = None) -> list:
+    """Command lists of past sessions: saved session histories, plus the
+    `command` events of sessions that have no saved state."""
+    histories = {}
+    for dump in iter_sessions(sessions_dir):
+        if dump.get("history") and dump.get("sid"):
+            histories[dump["sid"]] = list(dump["history"])
+    from_log = defaultdict(list)
+    if Path(event_log).exists():
+        for e in iter_events(Path(event_log), since=since):
+            if e.get("type") == "command" and e.get("sid") not in histories:
+                from_log[e.get("sid")].append(e.get("cmd", ""))
+    histories.update(from_log)
+    out = []
+    for cmds in histories.values():
+        cmds = [c for c in cmds if c.strip() and c.strip() not in ("exit", "logout")][:MAX_COMMANDS]
+        if cmds:
+            out.append(cmds)
+    return out
+
+
+# =========================
+# SERVER
+# =========================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"honeypot did not start on port {port}")
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def proc_sample(pid: int) -> tuple[int, float]:
+    """(RSS in KiB, user+system CPU seconds) of `pid` and its worker
+    processes, if any (Linux /proc)."""
+    rss = 0
+    cpu = 0.0
+    for p in [pid] + _children(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+                        break
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            pass
+    return rss, cpu
+
+
+def merge_workers(samples: dict) -> dict:
+    """Sum the per-worker series of a multi-process server's /metrics."""
+    out = defaultdict(float)
+    for (name, labels), v in samples.items():
+        out[(name, _WORKER_LABELS_RE.sub("", labels).strip(","))] += v
+    return dict(out)
+
+
+class Sampler(threading.Thread):
+    """Peak RSS of the server and the number of sessions open at that time."""
+
+    def __init__(self, pid: int, active):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.active = active
+        self.peak_rss = 0
+        self.sessions_at_peak = 0
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(0.1):
+            rss, _ = proc_sample(self.pid)
+            if rss > self.peak_rss:
+                self.peak_rss, self.sessions_at_peak = rss, self.active()
+
+
+# =========================
+# CLIENT
+# =========================
+class ShellClient:
+    """One SSH session driven command by command."""
+
+    def __init__(self, port: int, user: str, password: str):
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect("127.0.0.1", port, username=user, password=password,
+                            look_for_keys=False, allow_agent=False, timeout=COMMAND_TIMEOUT,
+                            banner_timeout=COMMAND_TIMEOUT, auth_timeout=COMMAND_TIMEOUT)
+        self.chan = self.client.invoke_shell(term="xterm")
+        self.chan.settimeout(COMMAND_TIMEOUT)
+        self._buf = b""
+        self.read_prompt()
+
+    def read_prompt(self) -> bytes:
+        """Output up to (not including) the next prompt."""
+        while True:
+            m = PROMPT_RE.search(self._buf)
+            if m is not None:
+                out, self._buf = self._buf[:m.start()], b""
+                return out
+            data = self.chan.recv(65536)
+            if not data:
+                raise EOFError("session closed")
+            self._buf += data
+
+    def run(self, cmd: str) -> float:
+        t0 = time.perf_counter()
+        self.chan.sendall((cmd + "\n").encode("utf-8"))
+        self.read_prompt()
+        return time.perf_counter() - t0
+
+    def close(self):
+        try:
+            self.chan.sendall(b"exit\n")
+        except Exception:
+            pass
+        self.client.close()
+
+
+def replay(port: int, cmds: list, user: str, password: str, active: list, lock: threading.Lock) -> dict:
+    t0 = time.perf_counter()
+    result = {"connect": None, "commands": [], "error": None}
+    try:
+        sh = ShellClient(port, user, password)
+    except Exception as e:
+        result["error"] = type(e).__name__
+        return result
+    result["connect"] = time.perf_counter() - t0
+    with lock:
+        active[0] += 1
+    try:
+        for cmd in cmds:
+            result["commands"].append((cmd, sh.run(cmd)))
+    except Exception as e:
+        result["error"] = type(e).__name__
+    finally:
+        with lock:
+            active[0] -= 1
+        sh.close()
+    return result
+
+
+# =========================
+# REPORT
+# =========================
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    n = len(values)
+
+    def pct(p):
+        return round(values[min(n - 1, int(n * p))] * 1000, 2) if n else 0.0
+
+    return {"n": n, "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+def command_paths(event_log: Path) -> dict:
+    """cmd -> "llm" / "local", from the `routes` of the server's output events."""
+    votes = defaultdict(Counter)
+    pending = {}  # sid -> last command line
+    if Path(event_log).exists():
+        for e in iter_events(Path(event_log)):
+            if e.get("type") == "command":
+                pending[e.get("sid")] = e.get("cmd", "")
+            elif e.get("type") == "output" and "routes" in e and e.get("sid") in pending:
+                llm = any(r.get("route") == "llm" for r in e["routes"])
+                votes[pending.pop(e["sid"])]["llm" if llm else "local"] += 1
+    return {cmd: v.most_common(1)[0][0] for cmd, v in votes.items()}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def compare(current: dict, previous: dict):
+    """Relative change of the headline numbers against an earlier result."""
+    def walk(cur, prev, prefix=""):
+        for k, v in cur.items():
+            p = prev.get(k) if isinstance(prev, dict) else None
+            if isinstance(v, dict):
+                walk(v, p, f"{prefix}{k}.")
+            elif isinstance(v, (int, float)) and isinstance(p, (int, float)) and p and k != "n":
+                print(f"  {prefix + k:<40}{p:>12.2f} -> {v:>12.2f}  ({(v - p) / p:+.1%})")
+
+    print(f"vs {previous.get('commit')} ({previous.get('ts')}):")
+    walk({k: current[k] for k in ("throughput", "latency", "server")}, previous)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--sessions", type=int, default=100, help="sessions to replay in total")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions in flight")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="server-side session cap")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (supervisor.py)")
+    parser.add_argument("--source-sessions", default=str(SESSIONS_DIR), help="saved sessions to replay")
+    parser.add_argument("--source-log", default=str(EVENT_LOG), help="event log whose command events are replayed")
+    parser.add_argument("--since", default=None, help="only replay events after this ISO timestamp")
+    parser.add_argument("--stub-latency", default="lognormal:-1.0,0.5", help="stub LLM time-to-first-token")
+    parser.add_argument("--user", default="user")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="result JSON (default: logs/bench/e2e-<ts>-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result JSON to compare with")
+    args = parser.parse_args()
+
+    histories = load_histories(Path(args.source_sessions), Path(args.source_log), args.since)
+    source = "recorded"
+    if not histories:
+        histories, source = DEFAULT_SESSIONS, "built-in"
+    rng = random.Random(args.seed)
+    plan = [rng.choice(histories) for _ in range(args.sessions)]
+    print(f"replaying {args.sessions} sessions ({sum(map(len, plan))} commands) from {len(histories)} "
+          f"{source} histories, concurrency={args.concurrency}, mode={args.mode}, workers={args.workers}")
+
+    port, metrics_port = free_port(), free_port()
+    workdir = Path(tempfile.mkdtemp(prefix="honeypot-e2e-"))
+    shutil.copy(HERE / "hostkey_rsa", workdir / "hostkey_rsa")
+    server = subprocess.Popen(
+        [sys.executable, str(HERE / "honeypot_ssh.py"),
+         "--mode", args.mode, "--host", "127.0.0.1", "--port", str(port),
+         "--max-sessions", str(args.max_sessions), "--llm-backend", "stub",
+         "--stub-latency", args.stub_latency, "--no-prefetch", "--corpus", "",
+         "--metrics-port", str(metrics_port), "--log-level", "WARNING", "--workers", str(args.workers)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        if args.workers > 1:
+            time.sleep(2)  # the port answers as soon as the first worker listens
+        idle_rss, cpu0 = proc_sample(server.pid)
+        active, lock = [0], threading.Lock()
+        sampler = Sampler(server.pid, lambda: active[0])
+        sampler.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda cmds: replay(port, cmds, args.user, args.password, active, lock), plan))
+        elapsed = time.perf_counter() - t0
+        sampler.stop.set()
+        _, cpu1 = proc_sample(server.pid)
+        try:
+            with urlopen(f"http://127.0.0.1:{metrics_port}/metrics", timeout=5) as r:
+                server_metrics = merge_workers(metrics.parse_exposition(r.read().decode("utf-8")))
+        except OSError:
+            server_metrics = {}
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    # the server's event log says which commands involved the model
+    paths = command_paths(workdir / EVENT_LOG)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    by_path = defaultdict(list)
+    connects, errors, n_commands = [], Counter(), 0
+    for res in results:
+        if res["connect"] is not None:
+            connects.append(res["connect"])
+        if res["error"]:
+            errors[res["error"]] += 1
+        for cmd, seconds in res["commands"]:
+            by_path[paths.get(cmd, "unknown")].append(seconds)
+            by_path["all"].append(seconds)
+            n_commands += 1
+
+    server_p95 = {}
+    for path in ("local", "llm"):
+        q = metrics.bucket_quantile(server_metrics, "honeypot_command_seconds", 0.95, f'path="{path}"')
+        if q is not None:
+            server_p95[path] = round(q * 1000, 2)
+    memory_per_session = ((sampler.peak_rss - idle_rss) / sampler.sessions_at_peak
+                          if sampler.sessions_at_peak else 0.0)
+    report = {
+        "ts": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        "commit": git_commit(),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+        "config": {k: getattr(args, k) for k in ("mode", "workers", "sessions", "concurrency",
+                                                 "max_sessions", "stub_latency", "seed")} | {"source": source},
+        "throughput": {
+            "elapsed_s": round(elapsed, 3),
+            "connections_per_s": round(len(connects) / elapsed, 2) if elapsed else 0.0,
+            "commands_per_s": round(n_commands / elapsed, 2) if elapsed else 0.0,
+            "sessions_ok": sum(1 for r in results if r["connect"] is not None and not r["error"]),
+            "errors": dict(errors),
+        },
+        "latency": {
+            "connect": percentiles(connects),
+            **{path: percentiles(v) for path, v in sorted(by_path.items())},
+            "server_p95_ms": server_p95,
+        },
+        "server": {
+            "rss_idle_mib": round(idle_rss / 1024, 1),
+            "rss_peak_mib": round(sampler.peak_rss / 1024, 1),
+            "kib_per_session": round(memory_per_session, 1),
+            "cpu_s": round(cpu1 - cpu0, 2),
+            "cpu_pct": round((cpu1 - cpu0) / elapsed * 100, 1) if elapsed else 0.0,
+        },
+    }
+
+    t, lat, srv = report["throughput"], report["latency"], report["server"]
+    print(f"elapsed={t['elapsed_s']}s connections/s={t['connections_per_s']} commands/s={t['commands_per_s']} "
+          f"ok={t['sessions_ok']}/{args.sessions} errors={t['errors'] or 0}")
+    for path in ("connect", "local", "llm", "unknown", "all"):
+        if path in lat:
+            p = lat[path]
+            print(f"{path:<8} n={p['n']:<6} p50={p['p50_ms']:>9.2f}ms p95={p['p95_ms']:>9.2f}ms "
+                  f"p99={p['p99_ms']:>9.2f}ms")
+    print(f"server RSS idle={srv['rss_idle_mib']}MiB peak={srv['rss_peak_mib']}MiB "
+          f"(~{srv['kib_per_session']} KiB/session), CPU {srv['cpu_s']}s ({srv['cpu_pct']}%)")
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"e2e-{report['ts']}-{report['commit']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"-> {out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
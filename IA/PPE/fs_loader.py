@@ -0,0 +1,296 @@
+"""
+Mount a real filesystem template as the honeypot's base image.
+
+Accepted sources:
+  - a directory tree, e.g. classic/cowrie/fs_template (Cowrie's honeyfs),
+  - a tar archive, plain or compressed (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz),
+  - a Cowrie fs.pickle (contents taken from each entry's realfile, or from
+    a honeyfs directory given alongside).
+
+The tree is loaded once at startup; file contents are not: every file node
+gets a Blob (path, offset, size) that is read on first access (large files
+on every access, they aren't kept in memory). The built tree is pickled into CACHE_DIR keyed on the
+source's path, size and mtime, so a restart only unpickles it. A directory
+source is only re-scanned when its top-level mtime changes (or --rebuild).
+
+    python fs_loader.py ../../classic/cowrie/fs_template
+    python honeypot_ssh.py --fs-template ../../classic/cowrie/fs_template
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import stat
+import tarfile
+import time
+from pathlib import Path
+
+from fs_engine import FSImage, Node, split_path, join_path
+from utils import LOG_DIR
+
+CACHE_DIR = LOG_DIR / "fs_cache"
+KEEP_MAX_BYTES = 256 * 1024   # bigger files are read again on each access, never kept in memory
+LOADER_VERSION = 2            # bump when the cached image layout changes
+
+# Cowrie fs.pickle entry layout (cowrie.shell.fs)
+A_NAME, A_TYPE, A_UID, A_GID, A_SIZE, A_MODE, A_CTIME, A_CONTENTS, A_TARGET, A_REALFILE = range(10)
+T_LINK, T_DIR, T_FILE = 0, 1, 2
+
+
+class Blob:
+    """Bytes [offset, offset + size) of a file on disk, decoded on demand."""
+
+    __slots__ = ("path", "offset", "size")
+
+    def __init__(self, path: str, offset: int = 0, size: int = 0):
+        self.path = path
+        self.offset = offset
+        self.size = size
+
+    def __getstate__(self):
+        return (self.path, self.offset, self.size)
+
+    def __setstate__(self, state):
+        self.path, self.offset, self.size = state
+
+    @property
+    def large(self) -> bool:
+        return self.size >= KEEP_MAX_BYTES
+
+    def read(self) -> str:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(self.size)
+        except (OSError, ValueError):
+            return ""
+        return data.decode("utf-8-sig", "replace")  # templates generated on Windows carry a BOM
+
+
+class _Builder:
+    """Collects (path, node) pairs in any order and links them into a tree."""
+
+    def __init__(self):
+        self.root = Node("", "dir", mode=0o755)
+        self.index = {"/": self.root}
+        self.skipped = 0
+
+    def _dir(self, path: str) -> Node:
+        node = self.index.get(path)
+        if node is None:
+            parent_path, name = split_path(path)
+            parent = self._dir(parent_path)
+            node = Node(name, "dir", mtime=parent.mtime)
+            parent.children[name] = node
+            self.index[path] = node
+        return node
+
+    def add(self, path: str, type: str, mode: int, uid: int, gid: int, mtime: float,
+            blob: Blob = None, size: int = 0):
+        if path == "/":
+            self.root.mode, self.root.uid, self.root.gid, self.root.mtime = mode, uid, gid, mtime
+            return
+        parent_path, name = split_path(path)
+        parent = self._dir(parent_path)
+        if not parent.is_dir:
+            self.skipped += 1
+            return
+        existing = self.index.get(path)
+        if type == "dir" and existing is not None and existing.is_dir:
+            existing.mode, existing.uid, existing.gid, existing.mtime = mode, uid, gid, mtime
+            return
+        node = Node(name, type, "", mode=mode, mtime=mtime, uid=uid, gid=gid, blob=blob, size=size)
+        parent.children[name] = node
+        self.index[path] = node
+
+    def image(self) -> FSImage:
+        return FSImage(self.root, self.index)
+
+
+def _clean(name: str):
+    """Archive member name -> absolute virtual path, or None if it escapes the root."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if ".." in parts:
+        return None
+    return "/" + "/".join(parts)
+
+
+# =========================
+# SOURCES
+# =========================
+def scan_dir(root: Path) -> _Builder:
+    b = _Builder()
+    root = Path(root).resolve()
+    st = os.lstat(root)
+    b.add("/", "dir", stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid, st.st_mtime)
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        base = "/" if rel == "." else "/" + rel.replace(os.sep, "/")
+        for name in dirnames + filenames:
+            full = os.path.join(dirpath, name)
+            st = os.lstat(full)
+            path = join_path(base, name)
+            if stat.S_ISDIR(st.st_mode):
+                b.add(path, "dir", stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid, st.st_mtime)
+            elif stat.S_ISREG(st.st_mode):
+                b.add(path, "file", stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid, st.st_mtime,
+                      blob=Blob(full, 0, st.st_size), size=st.st_size)
+            else:
+                b.skipped += 1  # symlinks, devices, sockets
+    return b
+
+
+def _is_compressed(path: Path) -> bool:
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    return magic[:2] == b"\x1f\x8b" or magic[:3] == b"BZh" or magic == b"\xfd7zXZ\x00"
+
+
+def scan_tar(path: Path, blob_path: Path) -> _Builder:
+    """Plain tars are read in place (member offsets); compressed ones are
+    unpacked once into `blob_path` so contents can still be read lazily."""
+    b = _Builder()
+    compressed = _is_compressed(path)
+    out = open(blob_path, "wb") if compressed else None
+    try:
+        with tarfile.open(path, "r:*") as tf:
+            for m in tf:
+                vpath = _clean(m.name)
+                if vpath is None:
+                    b.skipped += 1
+                    continue
+                mode = stat.S_IMODE(m.mode)
+                if m.isdir():
+                    b.add(vpath, "dir", mode, m.uid, m.gid, m.mtime)
+                elif m.isreg():
+                    if compressed:
+                        offset = out.tell()
+                        src = tf.extractfile(m)
+                        while chunk := src.read(1 << 20):
+                            out.write(chunk)
+                        blob = Blob(str(blob_path), offset, m.size)
+                    else:
+                        blob = Blob(str(path), m.offset_data, m.size)
+                    b.add(vpath, "file", mode, m.uid, m.gid, m.mtime, blob=blob, size=m.size)
+                else:
+                    b.skipped += 1
+    finally:
+        if out is not None:
+            out.close()
+    return b
+
+
+class _CowrieUnpickler(pickle.Unpickler):
+    # fs.pickle is nothing but nested lists of str/int/float/None
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"unexpected object in Cowrie pickle: {module}.{name}")
+
+
+def scan_cowrie_pickle(path: Path, honeyfs: Path = None) -> _Builder:
+    b = _Builder()
+    with open(path, "rb") as f:
+        tree = _CowrieUnpickler(f).load()
+
+    def content_blob(vpath, entry):
+        candidates = []
+        if honeyfs is not None:
+            candidates.append(Path(honeyfs) / vpath.lstrip("/"))
+        if len(entry) > A_REALFILE and entry[A_REALFILE]:
+            candidates.append(Path(entry[A_REALFILE]))
+        for c in candidates:
+            if c.is_file():
+                return Blob(str(c), 0, c.stat().st_size)
+        return None
+
+    stack = [("/", tree)]
+    while stack:
+        vpath, entry = stack.pop()
+        kind = entry[A_TYPE]
+        mode = stat.S_IMODE(entry[A_MODE] or 0)
+        uid, gid, mtime = entry[A_UID] or 0, entry[A_GID] or 0, entry[A_CTIME] or 0
+        if kind == T_DIR:
+            b.add(vpath, "dir", mode, uid, gid, mtime)
+            for child in entry[A_CONTENTS] or ():
+                stack.append((join_path(vpath, child[A_NAME]), child))
+        elif kind == T_FILE:
+            blob = content_blob(vpath, entry)
+            size = blob.size if blob is not None else entry[A_SIZE] or 0
+            b.add(vpath, "file", mode, uid, gid, mtime, blob=blob, size=size)
+        else:
+            b.skipped += 1
+    return b
+
+
+# =========================
+# PRECOMPILED IMAGE CACHE
+# =========================
+def _cache_stem(source: Path, honeyfs: Path = None) -> str:
+    st = os.stat(source)
+    h = hashlib.blake2b(digest_size=8)
+    for part in (LOADER_VERSION, source.resolve(), st.st_size, st.st_mtime_ns, honeyfs and Path(honeyfs).resolve()):
+        h.update(str(part).encode("utf-8", "surrogatepass") + b"\x00")
+    return f"{source.name}-{h.hexdigest()}"
+
+
+def load_template(source, honeyfs=None, cache_dir: Path = CACHE_DIR, rebuild: bool = False):
+    """Return (FSImage, info) for `source`, from the precompiled cache when possible.
+
+    `info` has: nodes, files, skipped, cached (bool), ms.
+    """
+    t0 = time.perf_counter()
+    source = Path(source)
+    cache_dir = Path(cache_dir) if cache_dir else None
+    stem = _cache_stem(source, honeyfs)
+    img_path = cache_dir / f"{stem}.img" if cache_dir else None
+
+    if img_path is not None and img_path.exists() and not rebuild:
+        try:
+            with open(img_path, "rb") as f:
+                image, skipped = pickle.load(f)
+            return image, _info(image, skipped, True, t0)
+        except Exception:
+            pass  # stale or truncated cache: rebuild below
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    if source.is_dir():
+        builder = scan_dir(source)
+    elif tarfile.is_tarfile(source):
+        if cache_dir is None:
+            raise ValueError("a cache directory is required to mount a tar archive")
+        builder = scan_tar(source, cache_dir / f"{stem}.blob")
+    else:
+        builder = scan_cowrie_pickle(source, honeyfs)
+    image = builder.image()
+
+    if img_path is not None:
+        tmp = img_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((image, builder.skipped), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, img_path)
+    return image, _info(image, builder.skipped, False, t0)
+
+
+def _info(image: FSImage, skipped: int, cached: bool, t0: float) -> dict:
+    files = sum(1 for n in image.index.values() if n.type == "file")
+    return {"nodes": len(image), "files": files, "skipped": skipped, "cached": cached,
+            "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory, tar(.gz) archive or Cowrie fs.pickle")
+    parser.add_argument("--honeyfs", default=None, help="file contents for a Cowrie pickle")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--rebuild", action="store_true", help="ignore the precompiled image")
+    args = parser.parse_args()
+
+    image, info = load_template(args.source, args.honeyfs, Path(args.cache_dir), args.rebuild)
+    print(f"[+] {args.source}: {info['nodes']} nodes ({info['files']} files, {info['skipped']} skipped) "
+          f"{'from cache' if info['cached'] else 'built'} in {info['ms']} ms")
+    for name in sorted(image.root.children):
+        print(f"    /{name}")
+
+
+if __name__ == "__main__":
+    main()
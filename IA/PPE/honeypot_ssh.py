@@ -1,30 +1,44 @@
+import argparse
+import os
+import signal
 import socket
+import sys
 import threading
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-import json
 import uuid
-import requests
 import paramiko
-import shlex
 import re
 import time
 
 # Externalized helpers (will override local implementations)
-from utils import utc_now, log_event, to_crlf
+from utils import utc_now, log_event, CrlfStream, configure_logging, get_logger, LOG_LEVEL
 from fs_engine import (
     SessionState,
     fs_exists,
-    fs_is_dir,
-    fs_list_dir,
-    fs_read_file,
     fs_write_file,
-    fs_mkdir,
-    fs_rm,
     norm_path,
     fs_snapshot,
+    mount_template,
 )
-from llm_adapter import ollama_shell_reply
+from llm_adapter import (
+    llm_shell_reply,
+    configure_backend,
+    configure_corpus,
+    configure_prefetch,
+    prefetch_next,
+    prefetch_session_end,
+)
+from llm_prefetch import MODEL_PATH
+from session_store import get_store
+from llm_corpus import CORPUS_PATH
+from line_input import ChannelLineReader
+from shell import LLMRequest, run_sync
+import http_pool
+import metrics
+import routing
+import ssh_handshake
+from ssh_handshake import HoneypotTransport, load_host_keys
 
 # =========================
 # CONFIG
@@ -35,28 +49,47 @@ LISTEN_PORT = 2222
 FAKE_USER = "user"
 FAKE_PASS = "password"
 
-HOSTKEY_PATH = Path("hostkey_rsa")
+HOSTKEY_PATH = ssh_handshake.HOSTKEY_FILES["rsa"]
+# Host keys offered to clients (ssh_handshake.py): Ed25519 is much cheaper to
+# sign with than RSA, RSA stays for old clients and for the known fingerprint
+HOSTKEY_TYPES = ssh_handshake.HOSTKEY_TYPES
 FAKE_HOSTNAME = "honeypot"
 
 LOG_DIR = Path("logs")
 HOME_DIR = f"/home/{FAKE_USER}"
 
+# "thread" (paramiko, one thread per session) or "asyncio" (asyncssh, see async_server.py)
+SERVER_MODE = "thread"
+# Max concurrent SSH sessions; beyond that, clients wait in the listen backlog
+MAX_SESSIONS = 500
+LISTEN_BACKLOG = 100
+# Threads used by the asyncio mode for blocking LLM calls. Most of them just
+# wait on the LLM scheduler (llm_adapter.LLM_SCHEDULER_WORKERS does the real work).
+LLM_WORKERS = 64
+
+# Only cheap key exchanges, and refuse addresses that keep failing auth
+# (ssh_handshake.py); for sensors under brute-force floods
+FAST_HANDSHAKE = False
+CHANNEL_WAIT = 20      # seconds a client gets to log in and open its session channel
+
+# Worker processes (supervisor.py): more than 1 to use more than one core
+WORKERS = 1
+# Graceful stop: stop accepting, let the open sessions end, exit. Sent by the
+# supervisor to the old workers on reload; works on a single process too.
+DRAIN_SIGNAL = signal.SIGUSR1
+DRAIN_TIMEOUT = 300    # seconds the open sessions get before the process exits anyway
+
+# Real filesystem to mount under the built-in nodes (see fs_loader.py): a
+# directory such as ../../classic/cowrie/fs_template, a tar(.gz) or a Cowrie
+# fs.pickle. None keeps the small built-in tree only.
+FS_TEMPLATE = None
+
 # =========================
-# BLACKLIST & HYBRID MODE
+# ROUTING
 # =========================
-# Commandes qui sont trop longues/complexes pour répondre directement
-COMMAND_BLACKLIST = [
-    "curl", "wget", "nc", "ncat", "socat", "telnet",  # Network tools
-    "sed", "awk", "perl", "python", "ruby", "bash",   # Interpreters/scripting
-    "find", "locate", "updatedb",                      # Search tools
-    "tar", "gzip", "bzip2", "zip", "unzip",           # Compression
-    "gcc", "make", "cmake", "g++",                     # Compilation
-    "docker", "kubectl", "systemctl", "journalctl",   # System admin
-    "ssh", "scp", "rsync",                             # Remote tools
-    "gcc", "nm", "objdump", "strings",                # Binary analysis
-]
-
-
+# Per-deployment routing file (see routing.py); None = built-in table:
+# emulated commands local, the rest to the LLM (nothing denied unless the file says so)
+ROUTES_PATH = None
 
 # =========================
 # OLLAMA CONFIG
@@ -64,15 +97,37 @@ COMMAND_BLACKLIST = [
 OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
 OLLAMA_MODEL = "mistral:latest"
 
+# Backend: "ollama", "openai" (/v1/chat/completions), "llamacpp" (/completion)
+# or "stub" (canned answers, no model needed). See llm_backends.py.
+LLM_BACKEND = "ollama"
+LLM_URL = OLLAMA_URL
+LLM_MODEL = OLLAMA_MODEL
+STUB_LATENCY = "lognormal:-1.0,0.5"   # stub time-to-first-token, seconds
+
+# =========================
+# METRICS / LOGGING
+# =========================
+# /metrics endpoint (metrics.py); console output goes through `log`, leveled
+# and rate-limited per call site (utils.configure_logging)
+METRICS_HOST = metrics.METRICS_HOST
+METRICS_PORT = metrics.METRICS_PORT
+
+log = get_logger("ssh")
+
+CONNECTIONS = metrics.counter("honeypot_connections_total", "TCP connections accepted")
+AUTH_ATTEMPTS = metrics.counter("honeypot_auth_attempts_total", "Password attempts", ("result",))
+SESSIONS = metrics.counter("honeypot_sessions_total", "Shell sessions opened")
+SESSIONS_ACTIVE = metrics.gauge("honeypot_sessions_active", "Shell sessions currently open")
+COMMANDS = metrics.counter("honeypot_commands_total", "Command lines run")
+ROUTES = metrics.counter("honeypot_routes_total", "Commands by routing decision (routing.py)", ("route",))
+LINE_SECONDS = metrics.histogram("honeypot_command_seconds",
+                                 "Time to answer a command line, by whether the LLM was involved", ("path",))
+
 # =========================
 # SSH KEY
 # =========================
 def load_or_create_hostkey():
-    if HOSTKEY_PATH.exists():
-        return paramiko.RSAKey(filename=str(HOSTKEY_PATH))
-    key = paramiko.RSAKey.generate(2048)
-    key.write_private_key_file(str(HOSTKEY_PATH))
-    return key
+    return load_host_keys(("rsa",))[0]
 
 # =========================
 # PARAMIKO SERVER
@@ -81,11 +136,19 @@ class HoneypotServer(paramiko.ServerInterface):
     def __init__(self, client_addr):
         self.client_addr = client_addr
         self.shell_event = threading.Event()
+        self.auth_failures = 0
+        self.auth_exhausted = False
+        # set on a session channel request, on the last allowed auth failure
+        # and when the transport thread ends (HoneypotTransport)
+        self.wakeup = threading.Event()
 
     def check_auth_password(self, username, password):
-        print(f"[{utc_now()}] Auth attempt from {self.client_addr} user={username} pass={password}")
-        if username == FAKE_USER and password == FAKE_PASS:
+        if check_password(self.client_addr, username, password):
             return paramiko.AUTH_SUCCESSFUL
+        self.auth_failures += 1
+        if self.auth_failures >= ssh_handshake.AUTH_MAX_ATTEMPTS:
+            self.auth_exhausted = True  # handle_client closes the connection
+            self.wakeup.set()
         return paramiko.AUTH_FAILED
 
     def get_allowed_auths(self, username):
@@ -93,6 +156,7 @@ class HoneypotServer(paramiko.ServerInterface):
 
     def check_channel_request(self, kind, chanid):
         if kind == "session":
+            self.wakeup.set()
             return paramiko.OPEN_SUCCEEDED
         return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
 
@@ -103,161 +167,168 @@ class HoneypotServer(paramiko.ServerInterface):
         self.shell_event.set()
         return True
 
+
 # =========================
-# READ LINE (SSH INPUT)
+# DISPATCH (shared by thread & asyncio modes)
 # =========================
-def read_line(chan):
-    buf = ""
-    while True:
-        data = chan.recv(1)
-        if not data:
-            return None
-        ch = data.decode("utf-8", errors="ignore")
+def check_password(addr, username: str, password: str) -> bool:
+    ok = username == FAKE_USER and password == FAKE_PASS
+    AUTH_ATTEMPTS.labels("success" if ok else "failure").inc()
+    log.info("auth attempt from %s user=%s pass=%s", addr, username, password)
+    if not ok and ssh_handshake.throttle.failed(addr[0]):
+        log_event(None, addr, "auth_throttled", {"seconds": ssh_handshake.throttle.block})
+    return ok
+
+
+def set_nodelay(sock: socket.socket):
+    """Output and prompt are separate small writes: without this the prompt
+    waits for the client's delayed ACK (~40 ms per command)."""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
 
-        if ch in ("\r", "\n"):
-            try:
-                chan.send("\r\n")
-            except Exception:
-                pass
-            return buf
-
-        if ch in ("\x7f", "\x08"):
-            if buf:
-                buf = buf[:-1]
-                try:
-                    chan.send("\b \b")
-                except Exception:
-                    pass
-            continue
 
-        if ord(ch) < 32 and ch not in ("\t",):
-            continue
+def record_line(st: SessionState, seconds: float):
+    """Metrics for one answered command line (st.routes is set by shell.execute)."""
+    COMMANDS.inc()
+    llm = False
+    for r in st.routes:
+        ROUTES.labels(r["route"]).inc()
+        llm = llm or r["route"] == routing.LLM
+    LINE_SECONDS.labels("llm" if llm else "local").observe(seconds)
 
-        try:
-            chan.send(ch)
-        except Exception:
-            return None
-
-        buf += ch
-
-
-def quick_command(st: SessionState, cmd: str) -> tuple[str | None, int | None]:
-    """Handle trivial, stateless commands that don't need FS context."""
-    c = cmd.strip()
-    if c == "whoami":
-        return st.user + "\n", 0
-    if c == "hostname":
-        return st.hostname + "\n", 0
-    if c == "pwd":
-        return st.cwd + "\n", 0
-    if c == "id":
-        return f"uid={st.uid}({st.user}) gid={st.gid}({st.user}) groups={st.gid}({st.user})\n", 0
-    if c == "date":
-        return st.now_local_str() + "\n", 0
-    if c in ("clear", "reset"):
-        # We can't actually clear the client terminal, but we can send the escape code
-        return "\x1b[H\x1b[2J", 0
-    return None, None
-
-
-def handle_fs_ops(st: SessionState, cmd: str) -> tuple[str | None, int | None]:
-    """Handle commands that read or mutate the virtual filesystem."""
-    try:
-        parts = shlex.split(cmd)
-    except ValueError:
-        return "bash: unclosed quote\n", 1
-
-    if not parts:
-        return "", 0
-
-    command = parts[0]
-    args = parts[1:]
-
-    if command == "cd":
-        path = args[0] if args else "~"
-        new_path = norm_path(st, path)
-        if not fs_exists(st, new_path):
-            return f"bash: cd: {path}: No such file or directory\n", 1
-        if not fs_is_dir(st, new_path):
-            return f"bash: cd: {path}: Not a directory\n", 1
-        st.cwd = new_path
-        return "", 0
-
-    if command == "ls":
-        path = args[0] if args else "."
-        target_path = norm_path(st, path)
-        if not fs_exists(st, target_path) or not fs_is_dir(st, target_path):
-            return f"ls: cannot access '{path}': No such file or directory\n", 2
-        
-        children = fs_list_dir(st, target_path)
-        if children is None:
-             return f"ls: cannot access '{path}': Not a directory\n", 2
-
-        return "  ".join(sorted(children)) + "\n", 0
-
-    if command == "cat":
-        if not args:
-            return "", 0  # cat without args waits for stdin, we just return nothing
-        path = args[0]
-        target_path = norm_path(st, path)
-        
-        if fs_exists(st, target_path):
-            if fs_is_dir(st, target_path):
-                return f"cat: {path}: Is a directory\n", 1
-            content = fs_read_file(st, target_path)
-            return content + "\n" if not content.endswith("\n") else content, 0
-        else:
-            # file does not exist, let LLM handle it
-            return None, None
-
-
-    if command == "mkdir":
-        if not args:
-            return "mkdir: missing operand\n", 1
-        path = args[0]
-        target_path = norm_path(st, path)
-        success, err = fs_mkdir(st, target_path)
-        if not success:
-            return f"mkdir: cannot create directory ‘{path}’: {err}\n", 1
-        return "", 0
-
-    if command == "touch":
-        if not args:
-            return "touch: missing file operand\n", 1
-        path = args[0]
-        target_path = norm_path(st, path)
+
+def banner_text() -> str:
+    return (
+        "Welcome to Ubuntu 22.04.4 LTS (GNU/Linux 5.15.0-xx-generic x86_64)\r\n"
+        f"Last login: {utc_now()}\r\n\r\n"
+    )
+
+
+def shell_prompt(st: SessionState) -> str:
+    return f"{st.user}@{st.hostname}:{st.cwd}$ "
+
+
+class OutputStream:
+    """Sink for streamed LLM output: converts to CRLF on the fly and sends it.
+
+    `started` tells the caller the output is already on the client's screen
+    and `written` counts the characters fed so far; a send failure is
+    remembered in `error` instead of aborting the generation.
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._crlf = CrlfStream()
+        self.started = False
+        self.written = 0
+        self.error = None
+
+    def write(self, text: str):
+        self.written += len(text)
+        data = self._crlf.feed(text)
+        if data and self.error is None:
+            self.started = True
+            try:
+                self._send(data)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        tail = self._crlf.flush()
+        if tail and self.error is None:
+            try:
+                self._send(tail)
+            except Exception as e:
+                self.error = e
+
+
+def run_llm(st: SessionState, cmd: str, session_id: str, addr, stream: OutputStream = None,
+            argv: list = None) -> tuple[str, int]:
+    """Ask the LLM for the output of `cmd` (blocking, may take several seconds).
+
+    With `stream`, the answer is forwarded to the client while it is generated.
+    `argv` is the command as split by the router (None for a pipeline).
+    """
+    is_cat_on_nonexistent = False
+    cat_path = None
+    if argv and argv[0] == 'cat' and len(argv) > 1:
+        target_path = norm_path(st, argv[1])
         if not fs_exists(st, target_path):
-             # create empty file
-             success, err = fs_write_file(st, target_path, "")
-             if not success:
-                 return f"touch: cannot touch '{path}': {err}\n", 1
+            is_cat_on_nonexistent = True
+            cat_path = target_path
+
+    log.debug("LLM for: %r", cmd)
+    out, code = llm_shell_reply(st, cmd, session_id, addr,
+                                on_chunk=stream.write if stream is not None else None)
+    if stream is not None:
+        stream.close()
+
+    if is_cat_on_nonexistent and out and code == 0:
+        # The LLM returned content for a file that didn't exist. Let's create it.
+        log.debug("LLM generated content for non-existent file %r, creating it", cat_path)
+        fs_write_file(st, cat_path, out.strip())
+
+    log.debug("LLM result: %r", out[:50])
+    return out, code
+
+
+def run_llm_request(st: SessionState, req: LLMRequest, session_id: str, addr,
+                    stream: OutputStream) -> tuple[str, int]:
+    """Answer one shell.LLMRequest; terminal-bound answers end up on `stream`."""
+    if not req.to_terminal:
+        return run_llm(st, req.cmd, session_id, addr, argv=req.argv)
+    mark = stream.written
+    out, code = run_llm(st, req.cmd, session_id, addr, stream, req.argv)
+    if stream.written == mark:
+        stream.write(out)  # cache hit or non-streaming backend
+    return out, code
+
+
+def run_line(st: SessionState, cmd: str, session_id: str, addr, stream: OutputStream) -> tuple[str, int]:
+    """Run a command line (operators, pipes, redirects): emulated stages are
+    answered locally, the rest by the LLM. All output is written to `stream`."""
+    return run_sync(st, cmd, stream.write, lambda req: run_llm_request(st, req, session_id, addr, stream))
+
+
+def save_session(st: SessionState, session_id: str, addr):
+    """Queue the final session record: history + FS diff against the base
+    image, compressed and written off the session thread (session_store.py)."""
+    def saved(path, error):
+        if error is None:
+            log_event(session_id, addr, "session_saved", {"path": str(path)})
         else:
-            # TODO: update timestamp if file exists
-            pass
-        return "", 0
+            log_event(session_id, addr, "session_save_failed", {"error": repr(error)})
 
-    if command == "rm":
-        if not args:
-            return "rm: missing operand\n", 1
-        path = args[0]
-        target_path = norm_path(st, path)
-        success, err = fs_rm(st, target_path)
-        if not success:
-            return f"rm: cannot remove '{path}': {err}\n", 1
-        return "", 0
+    if not get_store().finish(st, session_id, saved):
+        log_event(session_id, addr, "session_save_failed", {"error": "session store queue full"})
 
-    return None, None
+
+def checkpoint_session(st: SessionState, session_id: str):
+    """Mid-session checkpoint every few commands, so a crash loses little."""
+    get_store().after_command(st, session_id)
 
 
 # =========================
 # HANDLE CLIENT (CORE)
 # =========================
-def handle_client(client_sock, addr, host_key):
-    transport = paramiko.Transport(client_sock)
-    transport.add_server_key(host_key)
+def wait_for_channel(transport: paramiko.Transport, server: HoneypotServer, timeout: float = CHANNEL_WAIT):
+    """transport.accept(), but give up as soon as the client is gone or out of
+    password attempts, so bots don't hold a session slot for `timeout`."""
+    if not server.wakeup.wait(timeout) or server.auth_exhausted or not transport.is_active():
+        return None
+    # the channel is being opened: paramiko queues it right after check_channel_request
+    return transport.accept(timeout)
+
+
+def handle_client(client_sock, addr, host_keys, fast: bool = FAST_HANDSHAKE):
+    set_nodelay(client_sock)
+    transport = HoneypotTransport(client_sock, host_keys, fast)
 
     session_id = str(uuid.uuid4())
     log_event(session_id, addr, "session_start", {})
+    CONNECTIONS.inc()
 
     server = HoneypotServer(addr)
     try:
@@ -270,9 +341,9 @@ def handle_client(client_sock, addr, host_key):
             pass
         return
 
-    chan = transport.accept(20)
+    chan = wait_for_channel(transport, server)
     if chan is None:
-        log_event(session_id, addr, "no_channel", {})
+        log_event(session_id, addr, "no_channel", {"auth_failures": server.auth_failures})
         try:
             transport.close()
         except Exception:
@@ -293,15 +364,12 @@ def handle_client(client_sock, addr, host_key):
         return
 
     st = SessionState(user=FAKE_USER, home_dir=HOME_DIR, hostname=FAKE_HOSTNAME)
-    http = requests.Session()
-
-    def prompt():
-        return f"{st.user}@{st.hostname}:{st.cwd}$ "
+    st.remote_ip = addr[0]
+    reader = ChannelLineReader(chan)
 
     # banner
     try:
-        chan.send("Welcome to Ubuntu 22.04.4 LTS (GNU/Linux 5.15.0-xx-generic x86_64)\r\n")
-        chan.send(f"Last login: {utc_now()}\r\n\r\n")
+        chan.send(banner_text())
     except Exception as e:
         log_event(session_id, addr, "send_failed", {"stage": "banner", "error": repr(e)})
         try:
@@ -314,17 +382,20 @@ def handle_client(client_sock, addr, host_key):
             pass
         return
 
+    SESSIONS.inc()
+    SESSIONS_ACTIVE.inc()
     while True:
         try:
             if chan.closed or not transport.is_active():
                 break
-            chan.send(prompt())
+            chan.send(shell_prompt(st))
+            prompt_at = time.monotonic()
         except Exception as e:
             log_event(session_id, addr, "send_failed", {"stage": "prompt", "error": repr(e)})
             break
 
         try:
-            cmd = read_line(chan)
+            cmd = reader.read_line()
         except Exception as e:
             log_event(session_id, addr, "read_failed", {"error": repr(e)})
             break
@@ -336,87 +407,32 @@ def handle_client(client_sock, addr, host_key):
         if cmd == "":
             continue
 
+        st.record_think_time(time.monotonic() - prompt_at)
         st.add_history(cmd)
         log_event(session_id, addr, "command", {"cmd": cmd, "cwd": st.cwd})
 
-        if cmd in ("exit", "logout"):
-            output = "logout\r\n"
-            try:
-                if not chan.closed and transport.is_active():
-                    chan.send(output)
-            except Exception:
-                pass
-            log_event(session_id, addr, "output", {"output": output, "exit_code": 0})
-            break
-
-        exit_code = 0
-        output = ""
+        stream = OutputStream(chan.sendall)
+        t0 = time.perf_counter()
+        output, exit_code = run_line(st, cmd, session_id, addr, stream)
+        stream.close()
+        record_line(st, time.perf_counter() - t0)
 
-        qout, qcode = quick_command(st, cmd)
-        
-        if qout is not None:
-            output, exit_code = qout, qcode
-        else:
-            fout, fcode = handle_fs_ops(st, cmd)
-            if fout is not None:
-                output, exit_code = fout, fcode
-            else:
-                # 3) everything else -> LLM (but state-aware + guardrails)
-                is_cat_on_nonexistent = False
-                cat_path = None
-                try:
-                    parts = shlex.split(cmd)
-                    if parts and parts[0] == 'cat' and len(parts) > 1:
-                        path = parts[1]
-                        target_path = norm_path(st, path)
-                        if not fs_exists(st, target_path):
-                            is_cat_on_nonexistent = True
-                            cat_path = target_path
-                except ValueError:
-                    pass
-
-                print(f"[DEBUG] Using LLM for: '{cmd}'")
-                out, code = ollama_shell_reply(st, cmd, http, session_id, addr, OLLAMA_URL, OLLAMA_MODEL)
-                
-                if is_cat_on_nonexistent and out and code == 0:
-                    # The LLM returned content for a file that didn't exist. Let's create it.
-                    print(f"[DEBUG] LLM generated content for non-existent file '{cat_path}'. Creating it.")
-                    fs_write_file(st, cat_path, out.strip())
-
-                output, exit_code = out, code
-                print(f"[DEBUG] LLM result: {output[:50]}")
-
-        # send output safely (CRLF)
-        try:
-            if chan.closed or not transport.is_active():
-                break
-            chan.send(to_crlf(output))
-        except Exception as e:
-            log_event(session_id, addr, "send_failed", {"stage": "output", "error": repr(e)})
+        if stream.error is not None:
+            log_event(session_id, addr, "send_failed", {"stage": "output", "error": repr(stream.error)})
             break
 
-        log_event(session_id, addr, "output", {"output": output[:1000], "exit_code": exit_code})
+        log_event(session_id, addr, "output", {"output": output[:1000], "exit_code": exit_code,
+                                               "routes": st.routes})
+        if st.exited:
+            break
+        checkpoint_session(st, session_id)
+        prefetch_next(st, session_id)
 
+    SESSIONS_ACTIVE.dec()
     log_event(session_id, addr, "session_end", {})
+    prefetch_session_end(session_id)
 
-    # Persist session state for demo / analysis
-    try:
-        sess_dir = LOG_DIR / "sessions"
-        sess_dir.mkdir(parents=True, exist_ok=True)
-        sess_file = sess_dir / f"{session_id}.json"
-        with sess_file.open("w", encoding="utf-8") as f:
-            json.dump({
-                "ts": utc_now(),
-                "sid": session_id,
-                "user": st.user,
-                "hostname": st.hostname,
-                "cwd": st.cwd,
-                "history": st.history,
-                "fs": st.fs,
-            }, f, ensure_ascii=False, indent=2)
-        log_event(session_id, addr, "session_saved", {"path": str(sess_file)})
-    except Exception as e:
-        log_event(session_id, addr, "session_save_failed", {"error": repr(e)})
+    save_session(st, session_id, addr)
 
     try:
         chan.close()
@@ -426,32 +442,175 @@ def handle_client(client_sock, addr, host_key):
         transport.close()
     except Exception:
         pass
-    try:
-        http.close()
-    except Exception:
-        pass
 
 # =========================
 # MAIN
 # =========================
-def main():
-    host_key = load_or_create_hostkey()
-
+def make_listen_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind((LISTEN_HOST, LISTEN_PORT))
-    sock.listen(100)
+    if reuse_port:
+        # one listening socket per worker process, the kernel spreads the connections
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    return sock
 
-    print(f"[+] SSH honeypot listening on {LISTEN_HOST}:{LISTEN_PORT}")
-    print(f"[i] Login: {FAKE_USER} / {FAKE_PASS}")
-    print(f"[i] Hostkey saved at: {HOSTKEY_PATH.resolve()}")
-    print(f"[i] Ollama: {OLLAMA_URL}")
-    print(f"[i] model={OLLAMA_MODEL}")
 
-    while True:
-        client, addr = sock.accept()
-        t = threading.Thread(target=handle_client, args=(client, addr, host_key), daemon=True)
+def serve_threaded(sock: socket.socket, host_keys, max_sessions: int, fast: bool = FAST_HANDSHAKE):
+    """One thread per session, but never more than `max_sessions` at once.
+
+    When the cap is reached we simply stop calling accept(): new clients wait
+    in the kernel backlog instead of spawning yet another thread. Throttled
+    addresses (ssh_handshake.AuthThrottle) are closed before the key exchange.
+    DRAIN_SIGNAL closes the listening socket; we return once the open sessions
+    have ended (DRAIN_TIMEOUT at most).
+    """
+    slots = threading.BoundedSemaphore(max_sessions)
+    draining = threading.Event()
+
+    def drain(signum, frame):
+        draining.set()
+        sock.close()  # the pending accept() fails
+
+    signal.signal(DRAIN_SIGNAL, drain)
+
+    def run(client, addr):
+        try:
+            handle_client(client, addr, host_keys, fast)
+        finally:
+            slots.release()
+
+    while not draining.is_set():
+        slots.acquire()
+        try:
+            client, addr = sock.accept()
+        except Exception:
+            slots.release()
+            if draining.is_set():
+                break
+            raise
+        if not ssh_handshake.throttle.allowed(addr[0]):
+            client.close()
+            slots.release()
+            continue
+        t = threading.Thread(target=run, args=(client, addr), daemon=True)
         t.start()
 
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    left = max_sessions
+    while left and slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        left -= 1
+    log.info("drained, %d sessions left", left)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SSH honeypot (LLM-backed shell)")
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default=SERVER_MODE,
+                        help="thread = paramiko, one thread per session; asyncio = asyncssh event loop")
+    parser.add_argument("--host", default=LISTEN_HOST)
+    parser.add_argument("--port", type=int, default=LISTEN_PORT)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS,
+                        help="concurrent session cap (extra clients wait in the accept backlog)")
+    parser.add_argument("--llm-backend", choices=("ollama", "openai", "llamacpp", "stub"), default=LLM_BACKEND)
+    parser.add_argument("--llm-url", default=LLM_URL)
+    parser.add_argument("--llm-model", default=LLM_MODEL)
+    parser.add_argument("--stub-latency", default=STUB_LATENCY,
+                        help="stub backend latency, e.g. fixed:0.2, uniform:0.1,0.5, lognormal:-1.0,0.5")
+    parser.add_argument("--llm-pool-size", type=int, default=http_pool.POOL_SIZE,
+                        help="keep-alive connections to the LLM server, shared by all sessions")
+    parser.add_argument("--llm-connect-timeout", type=float, default=http_pool.CONNECT_TIMEOUT)
+    parser.add_argument("--llm-read-timeout", type=float, default=http_pool.READ_TIMEOUT)
+    parser.add_argument("--stub-responses", default=None, help="JSON file {command: output} for the stub backend")
+    parser.add_argument("--fs-template", default=FS_TEMPLATE,
+                        help="directory, tar(.gz) or Cowrie fs.pickle mounted as the base filesystem")
+    parser.add_argument("--fs-honeyfs", default=None, help="file contents for a Cowrie fs.pickle template")
+    parser.add_argument("--fs-rebuild", action="store_true", help="ignore the precompiled filesystem image")
+    parser.add_argument("--corpus", default=str(CORPUS_PATH),
+                        help="canned-response corpus from llm_corpus.py --build ('' to disable)")
+    parser.add_argument("--prefetch-model", default=str(MODEL_PATH),
+                        help="next-command model from llm_prefetch.py --train")
+    parser.add_argument("--no-prefetch", action="store_true", help="no speculative LLM generations")
+    parser.add_argument("--routes", default=ROUTES_PATH,
+                        help="JSON routing table (local / canned / deny / llm per command), see routing.py")
+    parser.add_argument("--host-keys", default=",".join(HOSTKEY_TYPES),
+                        help="host key types offered, comma separated: ed25519, ecdsa, rsa (generated if missing)")
+    parser.add_argument("--fast-handshake", action="store_true", default=FAST_HANDSHAKE,
+                        help="offer only cheap key exchanges and refuse addresses that keep failing auth")
+    parser.add_argument("--auth-max-attempts", type=int, default=ssh_handshake.AUTH_MAX_ATTEMPTS,
+                        help="failed passwords before a connection is closed")
+    parser.add_argument("--metrics-host", default=METRICS_HOST)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Prometheus /metrics endpoint, e.g. 9180 (default 0: disabled)")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        type=str.upper, help="console diagnostics (DEBUG shows every LLM call)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="worker processes behind a supervisor (supervisor.py); kill -HUP reloads them")
+    # set by the supervisor for its workers
+    parser.add_argument("--worker-index", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--listen-fd", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level)
+    worker = args.worker_index is not None
+    if args.workers > 1 and not worker:
+        from supervisor import run_supervisor
+        run_supervisor(args, sys.argv[1:] if argv is None else argv)
+        return
+    key_types = tuple(t.strip() for t in args.host_keys.split(",") if t.strip())
+    host_keys = load_host_keys(key_types)
+    ssh_handshake.configure(args.fast_handshake, args.auth_max_attempts)
+    http_pool.configure(args.llm_pool_size, args.llm_connect_timeout, args.llm_read_timeout)
+    if args.llm_backend == "stub":
+        configure_backend("stub", "stub://", "stub", latency=args.stub_latency, responses_path=args.stub_responses)
+    else:
+        configure_backend(args.llm_backend, args.llm_url, args.llm_model)
+    if args.fs_template:
+        from fs_loader import load_template
+        image, info = load_template(args.fs_template, args.fs_honeyfs, rebuild=args.fs_rebuild)
+        mount_template(image)
+        print(f"[i] FS template: {args.fs_template} ({info['nodes']} nodes, "
+              f"{'cached' if info['cached'] else 'built'} in {info['ms']} ms)")
+    corpus = configure_corpus(args.corpus)
+    if corpus is not None:
+        print(f"[i] Corpus: {len(corpus)} canned answers from {args.corpus}")
+    prefetcher = configure_prefetch(args.prefetch_model, not args.no_prefetch)
+    if prefetcher is not None:
+        print(f"[i] Prefetch: {len(prefetcher.model.counts)} contexts from {args.prefetch_model}")
+    table = routing.configure(args.routes)
+    print(f"[i] Routing: {len(table.exact)} commands{' from ' + args.routes if args.routes else ''}")
+    # turn SIGTERM (docker stop) into a normal exit so atexit hooks flush the logs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if args.listen_fd is not None:
+        sock = socket.socket(fileno=args.listen_fd)  # shared by the supervisor
+    else:
+        sock = make_listen_socket(args.host, args.port, reuse_port=worker)
+    # a worker's /metrics takes any free port, the supervisor's endpoint includes it
+    metrics_server = metrics.serve(args.metrics_host, None if worker and args.metrics_port else args.metrics_port)
+    if metrics_server is not None and not worker:
+        print(f"[i] Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
+    if worker:
+        log_event(None, (args.host, args.port), "worker_ready", {
+            "worker": args.worker_index, "pid": os.getpid(),
+            "metrics_port": metrics_server.server_address[1] if metrics_server else None})
+
+    print(f"[+] SSH honeypot listening on {args.host}:{args.port} (mode={args.mode}, max_sessions={args.max_sessions})")
+    print(f"[i] Login: {FAKE_USER} / {FAKE_PASS}")
+    print(f"[i] Host keys: {', '.join(k.get_name() for k in host_keys)}"
+          f"{' (fast handshake)' if args.fast_handshake else ''}")
+    print(f"[i] LLM: {args.llm_backend} {args.llm_url}")
+    print(f"[i] model={args.llm_model}")
+
+    if args.mode == "asyncio":
+        # imported lazily: asyncssh is only required for this mode
+        from async_server import serve_asyncio
+        serve_asyncio(sock, args.max_sessions, key_types, args.fast_handshake)
+    else:
+        serve_threaded(sock, host_keys, args.max_sessions, args.fast_handshake)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+"""
+Process-wide pooled HTTP client for the LLM path.
+
+Every backend and every session share one requests.Session, so a short bot
+session reuses an already-open keep-alive connection to the model server
+instead of paying a new TCP handshake. Timeouts are split into connect and
+read; the pool blocks (rather than opening throwaway connections) when all
+POOL_SIZE connections are busy.
+"""
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 16           # keep-alive connections kept per host
+CONNECT_TIMEOUT = 3.05   # seconds to establish a TCP connection
+READ_TIMEOUT = 35        # seconds between bytes (per token when streaming)
+
+
+class PooledHTTPClient:
+    def __init__(self, pool_size: int = POOL_SIZE, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    @contextmanager
+    def post(self, url: str, **kw):
+        """POST and yield the response; the connection goes back to the pool on exit."""
+        kw.setdefault("timeout", self.timeout)
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            r = self.session.post(url, **kw)
+            try:
+                r.raise_for_status()
+                yield r
+            finally:
+                r.close()
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _connections_opened(self) -> int:
+        pools = self._adapter.poolmanager.pools
+        total = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            total += getattr(pool, "num_connections", 0) if pool is not None else 0
+        return total
+
+    def stats(self) -> dict:
+        opened = self._connections_opened()
+        return {
+            "pool_size": self.pool_size,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": round(self.in_flight / self.pool_size, 3) if self.pool_size else 0.0,
+            "requests": self.requests,
+            "connections_opened": opened,
+            "connections_reused": max(0, self.requests - opened),
+            "errors": self.errors,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> PooledHTTPClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient()
+    return _client
+
+
+def configure(pool_size: int = POOL_SIZE, connect_timeout: float = CONNECT_TIMEOUT,
+              read_timeout: float = READ_TIMEOUT) -> PooledHTTPClient:
+    """Replace the shared client (call at startup, before any request)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = PooledHTTPClient(pool_size, connect_timeout, read_timeout)
+    return _client
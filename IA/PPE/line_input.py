@@ -0,0 +1,103 @@
+"""
+Buffered, line-oriented terminal input.
+
+`LineEditor` is a pure state machine: feed it whatever bytes arrived from the
+client and it returns the text to echo back plus any completed lines. It
+decodes UTF-8 incrementally (a multi-byte character split across two reads is
+kept until complete) and handles backspace editing.
+
+`ChannelLineReader` (paramiko) and `AsyncLineReader` (asyncssh) wrap it so a
+pasted script costs one recv() and one echo packet per chunk instead of one
+per character.
+"""
+import codecs
+from collections import deque
+
+RECV_SIZE = 4096
+
+BACKSPACES = ("\x7f", "\x08")
+
+
+class LineEditor:
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._buf = []
+        self._lines = deque()
+        self._after_cr = False
+
+    def feed(self, data: bytes) -> str:
+        """Consume raw input, return the echo to send (may be empty)."""
+        echo = []
+        for ch in self._decoder.decode(data):
+            if ch == "\n" and self._after_cr:
+                # CRLF from a paste: the CR already ended the line
+                self._after_cr = False
+                continue
+            self._after_cr = ch == "\r"
+
+            if ch in ("\r", "\n"):
+                echo.append("\r\n")
+                self._lines.append("".join(self._buf))
+                self._buf.clear()
+                continue
+
+            if ch in BACKSPACES:
+                if self._buf:
+                    self._buf.pop()
+                    echo.append("\b \b")
+                continue
+
+            if ord(ch) < 32 and ch != "\t":
+                continue
+
+            echo.append(ch)
+            self._buf.append(ch)
+        return "".join(echo)
+
+    def has_line(self) -> bool:
+        return bool(self._lines)
+
+    def pop_line(self) -> str:
+        return self._lines.popleft()
+
+
+class ChannelLineReader:
+    """Blocking reader on top of a paramiko channel."""
+
+    def __init__(self, chan, recv_size: int = RECV_SIZE):
+        self.chan = chan
+        self.recv_size = recv_size
+        self.editor = LineEditor()
+
+    def read_line(self):
+        """Next complete line, or None when the client went away."""
+        while not self.editor.has_line():
+            data = self.chan.recv(self.recv_size)
+            if not data:
+                return None
+            echo = self.editor.feed(data)
+            if echo:
+                try:
+                    self.chan.send(echo)
+                except Exception:
+                    return None
+        return self.editor.pop_line()
+
+
+class AsyncLineReader:
+    """Same as ChannelLineReader for an asyncssh process opened with encoding=None."""
+
+    def __init__(self, process, recv_size: int = RECV_SIZE):
+        self.process = process
+        self.recv_size = recv_size
+        self.editor = LineEditor()
+
+    async def read_line(self):
+        while not self.editor.has_line():
+            data = await self.process.stdin.read(self.recv_size)
+            if not data:
+                return None
+            echo = self.editor.feed(data)
+            if echo:
+                self.process.stdout.write(echo.encode("utf-8"))
+        return self.editor.pop_line()
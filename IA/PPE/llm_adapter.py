@@ -1,25 +1,102 @@
+import hashlib
+import itertools
+import json
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+
 import requests
+import metrics
 from fs_engine import fs_snapshot
-from utils import log_event
+from utils import log_event, LOG_DIR
+from llm_cache import ResponseCache, cache_key
+from llm_corpus import CORPUS_PATH, Corpus
+from llm_prefetch import MODEL_PATH, PREFETCH_ENABLED, PREFETCH_MAX_INFLIGHT, NextCommandModel, Prefetcher
+from llm_backends import LLMBackend, make_backend
+from http_pool import get_client
 
-def build_shell_prompt(st, cmd: str) -> str:
-    # On donne juste le strict minimum + des exemples pour forcer le format
-    snap = fs_snapshot(st)
-    return f"""You are a Linux Shell. Behave exactly like a terminal.
+# Stream tokens to the SSH channel as they arrive (when the caller asks for it)
+LLM_STREAM = True
+
+# Sampling options (Ollama names; other backends map them, see llm_backends.py)
+LLM_OPTIONS = {
+    "temperature": 0.3,
+    "num_predict": 200,
+    "top_k": 20,
+    "top_p": 0.85,
+    "repeat_penalty": 1.05,
+}
+
+# Prompt budget for the FS context (fs_engine.fs_snapshot), in estimated tokens
+FS_CONTEXT_TOKENS = 300
+
+# Reuse the model's context from the session's previous LLM command (Ollama
+# `context`), so follow-ups only prefill the new suffix. The session starts
+# over from the system prompt once its context grows past LLM_CONTEXT_MAX tokens.
+LLM_CONTEXT_REUSE = True
+LLM_CONTEXT_MAX = 2048
+
+# =========================
+# METRICS
+# =========================
+LLM_SECONDS = metrics.histogram("honeypot_llm_seconds", "Time to answer an LLM-routed command", ("source",))
+LLM_TTFB = metrics.histogram("honeypot_llm_ttfb_seconds", "Time to the model's first token")
+LLM_RESULTS = metrics.counter("honeypot_llm_requests_total", "LLM-routed commands by outcome", ("result",))
+LLM_QUEUE_WAIT = metrics.histogram("honeypot_llm_queue_wait_seconds", "Time a generation waited for a scheduler worker")
+
+# =========================
+# RESPONSE CACHE
+# =========================
+CACHE_ENABLED = True
+CACHE_MAX_ENTRIES = 4096
+CACHE_TTL = 24 * 3600                       # seconds
+CACHE_DB_PATH = LOG_DIR / "llm_cache.sqlite"  # None = memory only
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB_PATH) if CACHE_ENABLED else None
+
+# =========================
+# CANNED-RESPONSE CORPUS
+# =========================
+# Answers mined from past sessions (python llm_corpus.py --build), served
+# before the cache and the model. A missing file is an empty corpus.
+CORPUS_ENABLED = True
+
+corpus = Corpus.load(CORPUS_PATH) if CORPUS_ENABLED else None
+
+
+def configure_corpus(path) -> Corpus:
+    """Load another corpus file (--corpus); None disables the lookup."""
+    global corpus
+    corpus = Corpus.load(path) if path else None
+    return corpus
+
+# =========================
+# SCHEDULER
+# =========================
+LLM_SCHEDULER_WORKERS = 2    # concurrent generate calls against the model; 0 = call inline
+LLM_QUEUE_TIMEOUT = 90       # seconds a command may wait for a worker + generation
+HUMAN_THINK_TIME = 0.8       # median pause before a command above which we assume a human
+
+PRIORITY_INTERACTIVE = 0     # human-looking session
+PRIORITY_DEFAULT = 1         # not enough history to tell
+PRIORITY_BULK = 2            # bot pasting / scripting commands back to back
+PRIORITY_SPECULATIVE = 3     # prefetch of a predicted command (llm_prefetch.py)
+
+# Identical for every request and placed first, so the model server can keep
+# it evaluated (KV cache) and only prefill the per-command suffix.
+SYSTEM_PROMPT = """You are a Linux Shell. Behave exactly like a terminal.
 RULES:
 1. Do NOT explain. Do NOT chat.
 2. Output ONLY the standard stdout/stderr.
 3. If the command is silent (like 'cd', 'mkdir', 'export'), output nothing.
-4. If the command is not found, output 'bash: {cmd}: command not found'.
-
-CONTEXT:
-User: {st.user}
-Dir: {st.cwd}
-Files: {snap}
+4. If the command is not found, output 'bash: <command>: command not found'.
+5. Use the CONTEXT given with each command (user, host, directory, files).
 
 EXAMPLES:
-Cmd: whoami
-Out: {st.user}
+Cmd: echo hello
+Out: hello
 
 Cmd: cd /tmp
 Out:
@@ -30,9 +107,28 @@ Out: /tmp
 Cmd: notarealcommand
 Out: bash: notarealcommand: command not found
 
+"""
+
+
+def build_command_prompt(st, cmd: str) -> str:
+    """Per-command suffix: session state, FS context and the command."""
+    snap = fs_snapshot(st, cmd, FS_CONTEXT_TOKENS)
+    return f"""CONTEXT:
+User: {st.user}
+Host: {st.hostname}
+Dir: {st.cwd}
+Files: {snap}
+
 CURRENT COMMAND:
 Cmd: {cmd}
 Out:"""
+
+
+def build_shell_prompt(st, cmd: str) -> str:
+    # On donne juste le strict minimum + des exemples pour forcer le format
+    return SYSTEM_PROMPT + build_command_prompt(st, cmd)
+
+
 def post_validate_output(st, cmd: str, output: str) -> str:
     c = cmd.strip()
     if c == "whoami":
@@ -48,40 +144,495 @@ def post_validate_output(st, cmd: str, output: str) -> str:
     cleaned = output.replace("```", "").strip("\n")
     return cleaned + ("\n" if not cleaned.endswith("\n") else "")
 
-def ollama_shell_reply(st, cmd: str, session: requests.Session, session_id: str, addr, ollama_url: str, ollama_model: str) -> tuple[str, int]:
-    prompt = build_shell_prompt(st, cmd)
-    payload = {
-        "model": ollama_model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.3,
-            "num_predict": 200,
-            "top_k": 20,
-            "top_p": 0.85,
-            "repeat_penalty": 1.05,
+class StreamCleaner:
+    """Incremental version of post_validate_output's cleanup for streamed tokens.
+
+    Drops ``` fences and leading blank lines, and holds back a trailing run of
+    backticks / newlines until we know whether more text follows, so the bytes
+    forwarded to `emit` match the final post-validated output.
+    """
+
+    def __init__(self, emit):
+        self._emit = emit
+        self.started = False
+        self.emitted = []
+        self._pending = ""
+
+    def emit(self, text: str):
+        self.emitted.append(text)
+        self._emit(text)
+
+    def feed(self, token: str):
+        text = (self._pending + token).replace("```", "")
+        if not self.started:
+            text = text.lstrip("\n")
+        cut = len(text.rstrip("`\n"))
+        self._pending = text[cut:]
+        if cut:
+            self.started = True
+            self.emit(text[:cut])
+
+    def finish(self):
+        tail = self._pending.replace("```", "").rstrip("\n")
+        self._pending = ""
+        if tail:
+            self.started = True
+            self.emit(tail)
+        if self.started:
+            self.emit("\n")
+
+
+def session_priority(st) -> int:
+    """Interactive humans first, scripted bots last (by median think time)."""
+    times = list(getattr(st, "think_times", ()))
+    if len(times) < 2:
+        return PRIORITY_DEFAULT
+    return PRIORITY_INTERACTIVE if statistics.median(times) >= HUMAN_THINK_TIME else PRIORITY_BULK
+
+
+_JOB_DONE = object()
+
+
+class _Job:
+    """One generation, possibly shared by several identical requests."""
+
+    def __init__(self, key: str, backend: LLMBackend, prompt: str, options: dict, priority: int,
+                 system: str = "", context: list = None):
+        self.key = key
+        self.backend = backend
+        self.prompt = prompt
+        self.system = system
+        self.context = context
+        self.options = options
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.tokens = []
+        self.subscribers = []  # one token queue per waiter that streams
+        self.waiters = 0
+        self.timing = {}
+        self.result = None
+        self.error = None
+
+    def feed(self, token: str):
+        # called by the worker for every streamed token: only queued here, each
+        # waiter sends its copy from its own thread (a client that stops reading
+        # must not hold the worker)
+        with self.lock:
+            self.tokens.append(token)
+            for q in self.subscribers:
+                q.put(token)
+
+    def finish(self):
+        with self.lock:
+            self.done.set()
+            for q in self.subscribers:
+                q.put(_JOB_DONE)
+
+    def subscribe(self) -> queue.SimpleQueue:
+        """Token queue replaying what was generated so far, then live tokens
+        and _JOB_DONE."""
+        q = queue.SimpleQueue()
+        with self.lock:
+            for token in self.tokens:
+                q.put(token)
+            if self.done.is_set():
+                q.put(_JOB_DONE)
+            self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: queue.SimpleQueue):
+        with self.lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+
+
+class LLMScheduler:
+    """Bounded pool of workers in front of the model.
+
+    - at most `workers` generate calls run at once; the rest wait in a
+      priority queue (interactive sessions before bulk bot traffic),
+    - identical prompts already queued or running are coalesced: the new
+      caller subscribes to the existing job (and its token stream, which it
+      sends from its own thread: the worker never waits on a client),
+    - queue depth and wait times are tracked for stats().
+    """
+
+    def __init__(self, workers: int, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._waits = deque(maxlen=1000)
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.abandoned = 0
+        self.max_queue_depth = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    @staticmethod
+    def job_key(backend: LLMBackend, prompt: str, options: dict, system: str = "", context: list = None) -> str:
+        blob = json.dumps([backend.key_parts(), system, context, prompt, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def run(self, backend: LLMBackend, prompt: str, options: dict, cleaner, timing: dict,
+            priority: int = PRIORITY_DEFAULT, system: str = "", context: list = None) -> str:
+        """Queue (or join) a generation and wait for its raw response text."""
+        self._ensure_started()
+        key = self.job_key(backend, prompt, options, system, context)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is None:
+                job = self._inflight[key] = _Job(key, backend, prompt, options, priority, system, context)
+                self.submitted += 1
+                self._queue.put((priority, next(self._seq), job))
+            else:
+                self.coalesced += 1
+                if job.started is None and priority < job.priority:
+                    # re-queue with the better priority; the stale entry is skipped
+                    job.priority = priority
+                    self._queue.put((priority, next(self._seq), job))
+            job.waiters += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        if cleaner is None:
+            finished = job.done.wait(self.queue_timeout)
+        else:
+            finished = self._stream(job, cleaner)
+        with self._lock:
+            job.waiters -= 1
+        if not finished:
+            raise requests.exceptions.Timeout("LLM queue wait exceeded")
+
+        timing.update(job.timing)
+        timing["queued"] = job.started
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _stream(self, job: _Job, cleaner) -> bool:
+        """Wait for `job`, feeding its tokens to `cleaner` on the caller's thread;
+        False on queue_timeout."""
+        tokens = job.subscribe()
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while True:
+                try:
+                    token = tokens.get(timeout=max(deadline - time.monotonic(), 0.0))
+                except queue.Empty:
+                    return False
+                if token is _JOB_DONE:
+                    return True
+                cleaner.feed(token)
+        finally:
+            job.unsubscribe(tokens)
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                if job.started is not None or job.done.is_set():
+                    continue  # duplicate entry from a priority bump
+                if job.waiters == 0:
+                    # everybody gave up while it was queued
+                    self._inflight.pop(job.key, None)
+                    self.abandoned += 1
+                    job.finish()
+                    continue
+                job.started = time.perf_counter()
+            self._waits.append(job.started - job.enqueued)
+            LLM_QUEUE_WAIT.observe(job.started - job.enqueued)
+            try:
+                # always stream: subscribers that want tokens get them live
+                job.result = job.backend.generate(job.prompt, job.options, job.feed, job.timing,
+                                                  system=job.system, context=job.context)
+                self.completed += 1
+            except Exception as e:
+                job.error = e
+                self.failed += 1
+            finally:
+                with self._lock:
+                    self._inflight.pop(job.key, None)
+                job.finish()
+
+    def idle(self) -> bool:
+        """Nothing queued and a worker free: room for speculative work."""
+        with self._lock:
+            running = sum(1 for job in self._inflight.values() if job.started is not None)
+            return self._queue.qsize() == 0 and running < self.workers
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 1) if waits else 0.0
+
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "inflight": len(self._inflight),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p95": pct(0.95),
         }
+
+
+scheduler = LLMScheduler(LLM_SCHEDULER_WORKERS) if LLM_SCHEDULER_WORKERS else None
+
+metrics.gauge("honeypot_llm_queue_depth", "Generations waiting for a scheduler worker",
+              fn=lambda: scheduler._queue.qsize() if scheduler is not None else None)
+metrics.gauge("honeypot_llm_inflight", "Generations queued or running (after coalescing)",
+              fn=lambda: len(scheduler._inflight) if scheduler is not None else None)
+metrics.gauge("honeypot_llm_cache_entries", "Entries in the LLM response cache",
+              fn=lambda: response_cache.stats().get("entries") if response_cache is not None else None)
+
+
+def llm_stats() -> dict:
+    """Cache, scheduler and HTTP pool counters in one place."""
+    return {
+        "cache": response_cache.stats() if response_cache is not None else None,
+        "corpus": corpus.stats() if corpus is not None else None,
+        "prefetch": prefetcher.stats() if prefetcher is not None else None,
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "http_pool": get_client().stats(),
     }
+
+
+def _timing_fields(t0: float, timing: dict) -> dict:
+    now = time.perf_counter()
+    fields = {"total_ms": round((now - t0) * 1000, 1)}
+    if "ttfb" in timing:
+        fields["ttfb_ms"] = round(max(0.0, timing["ttfb"] - t0) * 1000, 1)
+    if timing.get("queued"):
+        fields["queue_ms"] = round(max(0.0, timing["queued"] - t0) * 1000, 1)
+    stats = timing.get("stats") or {}
+    for k in ("prompt_eval_count", "eval_count"):
+        if k in stats:
+            fields[k] = stats[k]
+    return fields
+
+
+backend = None  # set once at startup by configure_backend()
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def configure_backend(kind: str, url: str, model: str, **kw) -> LLMBackend:
+    """Select the process-wide default backend (see llm_backends.BACKENDS)."""
+    global backend
+    backend = get_backend(kind, url, model, **kw)
+    return backend
+
+
+def get_backend(kind: str, url: str, model: str, **kw) -> LLMBackend:
+    """Backends are shared so their connection pools are too."""
+    key = (kind, url, model, tuple(sorted(kw.items())))
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = make_backend(kind, url, model, **kw)
+        return _backends[key]
+
+
+def ollama_shell_reply(st, cmd: str, session: requests.Session, session_id: str, addr, ollama_url: str, ollama_model: str,
+                       on_chunk=None) -> tuple[str, int]:
+    """Historical entry point: llm_shell_reply() against an Ollama server.
+
+    `session` is ignored: requests go through the shared pool (http_pool.py).
+    """
+    return llm_shell_reply(st, cmd, session_id, addr, on_chunk=on_chunk,
+                           llm=get_backend("ollama", ollama_url, ollama_model))
+
+
+def llm_shell_reply(st, cmd: str, session_id: str, addr, on_chunk=None, llm: LLMBackend = None) -> tuple[str, int]:
+    """Ask the model for the output of `cmd`.
+
+    If `on_chunk` is given, output is streamed to it (already cleaned, LF line
+    endings) as tokens arrive; the returned text is the same output, for logging.
+    Callers can tell whether anything was streamed by watching `on_chunk` calls.
+    Requests go through the shared `scheduler` (unless LLM_SCHEDULER_WORKERS
+    is 0) and the process-wide HTTP pool.
+    """
+    llm = llm or backend
+    if llm is None:
+        raise RuntimeError("no LLM backend configured (call configure_backend first)")
+    t0 = time.perf_counter()
+    if corpus is not None:
+        canned = corpus.lookup(st, cmd)
+        if canned is not None:
+            out = post_validate_output(st, cmd, canned)
+            log_event(session_id, addr, "llm_corpus_hit", {"cmd": cmd, "response_preview": out[:200]})
+            LLM_RESULTS.labels("corpus_hit").inc()
+            LLM_SECONDS.labels("corpus").observe(time.perf_counter() - t0)
+            return out, 0
+    key = None
+    if response_cache is not None:
+        key = cache_key(st, cmd)
+        cached = response_cache.get(key)
+        if prefetcher is not None:
+            (prefetcher.on_cache_hit if cached is not None else prefetcher.on_cache_miss)(key)
+        if cached is not None:
+            out = post_validate_output(st, cmd, cached)
+            log_event(session_id, addr, "llm_cache_hit", {"cmd": cmd, "response_preview": out[:200]})
+            LLM_RESULTS.labels("cache_hit").inc()
+            LLM_SECONDS.labels("cache").observe(time.perf_counter() - t0)
+            return out, 0
+
+    prompt = build_command_prompt(st, cmd)
+    context = st.llm_context if LLM_CONTEXT_REUSE and llm.supports_context else None
+    cleaner = StreamCleaner(on_chunk) if on_chunk is not None and LLM_STREAM else None
+    timing = {}
+    t0 = time.perf_counter()
     try:
-        r = session.post(ollama_url, json=payload, timeout=35)
-        r.raise_for_status()
-        data = r.json()
-        response = (data.get("response") or "").strip()
+        if scheduler is not None:
+            response = scheduler.run(llm, prompt, LLM_OPTIONS, cleaner, timing, session_priority(st),
+                                     system=SYSTEM_PROMPT, context=context)
+        else:
+            response = llm.generate(prompt, LLM_OPTIONS, cleaner.feed if cleaner else None, timing,
+                                    system=SYSTEM_PROMPT, context=context)
+        if LLM_CONTEXT_REUSE and llm.supports_context:
+            new_context = timing.get("context")
+            st.llm_context = new_context if new_context and len(new_context) <= LLM_CONTEXT_MAX else None
+        response = response.strip()
         if response:
+            if cleaner is not None:
+                cleaner.finish()
+            if key is not None:
+                response_cache.put(key, response)
             out = post_validate_output(st, cmd, response)
-            log_event(session_id, addr, "llm_success", {"cmd": cmd, "response_preview": out[:200]})
+            log_event(session_id, addr, "llm_success", {
+                "cmd": cmd, "response_preview": out[:200], "streamed": cleaner is not None,
+                "backend": llm.name, "context_reused": bool(context), **_timing_fields(t0, timing),
+            })
+            LLM_RESULTS.labels("success").inc()
+            LLM_SECONDS.labels("model").observe(time.perf_counter() - t0)
+            if "ttfb" in timing:
+                LLM_TTFB.observe(max(0.0, timing["ttfb"] - t0))
             return out, 0
-        log_event(session_id, addr, "llm_empty", {"cmd": cmd})
+        log_event(session_id, addr, "llm_empty", {"cmd": cmd, **_timing_fields(t0, timing)})
+        LLM_RESULTS.labels("empty").inc()
         return (f"bash: {cmd}: command not found\n", 127)
-    except requests.exceptions.Timeout:
-        log_event(session_id, addr, "llm_timeout", {"cmd": cmd})
+    except Exception as e:
+        if cleaner is not None and cleaner.started:
+            # part of the answer is already on the attacker's screen: end it cleanly
+            cleaner.finish()
+            log_event(session_id, addr, "llm_stream_interrupted", {
+                "cmd": cmd, "error": type(e).__name__, **_timing_fields(t0, timing),
+            })
+            LLM_RESULTS.labels("stream_interrupted").inc()
+            return "".join(cleaner.emitted), 0
+        return _llm_failure(session_id, addr, cmd, e, _timing_fields(t0, timing))
+
+
+# =========================
+# SPECULATIVE PREFETCH
+# =========================
+class SpeculativeRequest:
+    __slots__ = ("llm", "key", "prompt", "context")
+
+    def __init__(self, llm: LLMBackend, key: str, prompt: str, context):
+        self.llm = llm
+        self.key = key
+        self.prompt = prompt
+        self.context = context
+
+
+def speculative_request(st, cmd: str, llm: LLMBackend = None):
+    """(cache key, request) for what llm_shell_reply(st, cmd) would send,
+    built now from the session as it is; None if there is nothing to gain."""
+    llm = llm or backend
+    if llm is None or response_cache is None:
+        return None
+    if corpus is not None and corpus.covers(st, cmd):
+        return None
+    key = cache_key(st, cmd)
+    if key in response_cache:
+        return None
+    context = st.llm_context if LLM_CONTEXT_REUSE and llm.supports_context else None
+    return key, SpeculativeRequest(llm, key, build_command_prompt(st, cmd), context)
+
+
+def speculative_generate(req: SpeculativeRequest) -> bool:
+    """Run a prefetch at the lowest priority and cache the raw answer. The
+    session's model context is left alone: the guess may be wrong."""
+    if scheduler is not None:
+        response = scheduler.run(req.llm, req.prompt, LLM_OPTIONS, None, {}, PRIORITY_SPECULATIVE,
+                                 system=SYSTEM_PROMPT, context=req.context)
+    else:
+        response = req.llm.generate(req.prompt, LLM_OPTIONS, None, {}, system=SYSTEM_PROMPT, context=req.context)
+    response = response.strip()
+    if response:
+        response_cache.put(req.key, response)
+    return bool(response)
+
+
+def configure_prefetch(model_path=MODEL_PATH, enabled: bool = True):
+    """Load the next-command model and start prefetching (None = off)."""
+    global prefetcher
+    if not enabled or response_cache is None:
+        prefetcher = None
+        return None
+    # keep a scheduler worker free for real requests
+    max_inflight = min(PREFETCH_MAX_INFLIGHT, scheduler.workers - 1) if scheduler is not None else PREFETCH_MAX_INFLIGHT
+    if max_inflight < 1:
+        prefetcher = None
+        return None
+    prefetcher = Prefetcher(NextCommandModel.load(model_path), speculative_request, speculative_generate,
+                            scheduler.idle if scheduler is not None else (lambda: True), max_inflight=max_inflight)
+    return prefetcher
+
+
+def prefetch_next(st, session_id):
+    """Called once a line is answered: guess the next one while the attacker types."""
+    if prefetcher is None:
+        return
+    try:
+        prefetcher.after_command(st, session_id)
+    except Exception as e:
+        log_event(session_id, (st.remote_ip, 0), "prefetch_error", {"error": repr(e)})
+
+
+def prefetch_session_end(session_id):
+    if prefetcher is not None:
+        prefetcher.session_end(session_id)
+
+
+prefetcher = None
+configure_prefetch(MODEL_PATH, PREFETCH_ENABLED)
+
+
+def _llm_failure(session_id: str, addr, cmd: str, exc: Exception, timing_fields: dict) -> tuple[str, int]:
+    if isinstance(exc, requests.exceptions.Timeout):
+        LLM_RESULTS.labels("timeout").inc()
+        log_event(session_id, addr, "llm_timeout", {"cmd": cmd, **timing_fields})
         # deterministic fallback when LLM times out
         return (f"bash: {cmd}: LLM unavailable (timeout)\n", 127)
-    except requests.exceptions.ConnectionError as e:
-        log_event(session_id, addr, "llm_connection_error", {"cmd": cmd, "error": str(e)})
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        LLM_RESULTS.labels("connection_error").inc()
+        log_event(session_id, addr, "llm_connection_error", {"cmd": cmd, "error": str(exc), **timing_fields})
         # deterministic fallback when LLM can't be reached
         return (f"bash: {cmd}: LLM unavailable (connection)\n", 127)
-    except Exception as e:
-        log_event(session_id, addr, "llm_error", {"cmd": cmd, "error": type(e).__name__, "details": str(e)})
-        # generic deterministic fallback
-        return (f"bash: {cmd}: LLM error ({type(e).__name__})\n", 127)
+    LLM_RESULTS.labels("error").inc()
+    log_event(session_id, addr, "llm_error", {"cmd": cmd, "error": type(exc).__name__, "details": str(exc), **timing_fields})
+    # generic deterministic fallback
+    return (f"bash: {cmd}: LLM error ({type(exc).__name__})\n", 127)
@@ -0,0 +1,348 @@
+"""
+LLM backends behind one small interface.
+
+Every backend takes a prompt plus Ollama-style options (temperature,
+num_predict, top_k, top_p, repeat_penalty), optionally streams tokens to a
+callback, and fills `timing` with "ttfb" (perf_counter of the first token)
+and "stats" (prompt_eval_count / eval_count, whatever the server reports).
+
+The prompt comes in two parts: `system`, a prefix identical for every
+request (so servers can keep its KV cache), and `prompt`, the per-command
+suffix. Backends with `supports_context` also accept the `context` returned
+by the previous call of the same session (timing["context"]); the server
+then only evaluates the new suffix.
+
+- OllamaBackend    POST /api/generate            (NDJSON stream)
+- OpenAIBackend    POST /v1/chat/completions     (SSE stream; vLLM, LM Studio, ...)
+- LlamaCppBackend  POST /completion              (llama.cpp server, SSE stream)
+- StubBackend      in-process canned responses with configurable latency
+
+HTTP backends go through the process-wide pooled client (http_pool.py), so
+connections to the model server are reused (keep-alive) across sessions.
+`StubModel` is also served over HTTP by llm_stub_server.py.
+"""
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from http_pool import PooledHTTPClient, get_client
+
+
+class LLMBackend:
+    name = "base"
+    supports_context = False
+
+    def __init__(self, url: str, model: str, client: PooledHTTPClient = None):
+        self.url = url
+        self.model = model
+        self._client = client
+        self.headers = {}
+
+    @property
+    def client(self) -> PooledHTTPClient:
+        return self._client or get_client()
+
+    def key_parts(self) -> list:
+        """What, besides the prompt, makes two requests interchangeable."""
+        return [self.name, self.url, self.model]
+
+    def generate(self, prompt: str, options: dict, on_token=None, timing: dict = None,
+                 system: str = "", context: list = None) -> str:
+        raise NotImplementedError
+
+    # helper shared by the HTTP backends
+    def _post(self, body: dict, stream: bool):
+        return self.client.post(self.url, json=body, headers=self.headers, stream=stream)
+
+    @staticmethod
+    def _sse_events(r):
+        """Yield decoded JSON objects from a text/event-stream response."""
+        for line in r.iter_lines():
+            if not line or not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                return
+            yield json.loads(data)
+
+
+class OllamaBackend(LLMBackend):
+    name = "ollama"
+    supports_context = True
+
+    def generate(self, prompt, options, on_token=None, timing=None, system="", context=None):
+        timing = timing if timing is not None else {}
+        body = {"model": self.model, "prompt": prompt, "stream": on_token is not None, "options": options}
+        if context:
+            body["context"] = context  # system prompt and earlier turns are already in there
+        elif system:
+            body["system"] = system
+        if on_token is None:
+            with self._post(body, stream=False) as r:
+                data = r.json()
+            timing["ttfb"] = time.perf_counter()
+            timing["stats"] = data
+            timing["context"] = data.get("context")
+            return data.get("response") or ""
+
+        parts = []
+        with self._post(body, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                token = data.get("response") or ""
+                if token:
+                    timing.setdefault("ttfb", time.perf_counter())
+                    parts.append(token)
+                    on_token(token)
+                if data.get("done"):
+                    timing["stats"] = data
+                    timing["context"] = data.get("context")
+                    break
+        return "".join(parts)
+
+
+class OpenAIBackend(LLMBackend):
+    """Any OpenAI-compatible /v1/chat/completions server."""
+    name = "openai"
+
+    def __init__(self, url, model, api_key: str = None, **kw):
+        super().__init__(url, model, **kw)
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+    @staticmethod
+    def _stats(usage: dict) -> dict:
+        usage = usage or {}
+        return {"prompt_eval_count": usage.get("prompt_tokens"), "eval_count": usage.get("completion_tokens")}
+
+    def generate(self, prompt, options, on_token=None, timing=None, system="", context=None):
+        timing = timing if timing is not None else {}
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        body = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": options.get("temperature"),
+            "top_p": options.get("top_p"),
+            "max_tokens": options.get("num_predict"),
+            "stream": on_token is not None,
+        }
+        if on_token is None:
+            with self._post(body, stream=False) as r:
+                data = r.json()
+            timing["ttfb"] = time.perf_counter()
+            timing["stats"] = self._stats(data.get("usage"))
+            choices = data.get("choices") or [{}]
+            return (choices[0].get("message") or {}).get("content") or ""
+
+        parts = []
+        with self._post(body, stream=True) as r:
+            for event in self._sse_events(r):
+                if event.get("usage"):
+                    timing["stats"] = self._stats(event["usage"])
+                for choice in event.get("choices") or ():
+                    token = (choice.get("delta") or {}).get("content") or ""
+                    if token:
+                        timing.setdefault("ttfb", time.perf_counter())
+                        parts.append(token)
+                        on_token(token)
+        return "".join(parts)
+
+
+class LlamaCppBackend(LLMBackend):
+    """llama.cpp `server` native /completion endpoint."""
+    name = "llamacpp"
+
+    def generate(self, prompt, options, on_token=None, timing=None, system="", context=None):
+        timing = timing if timing is not None else {}
+        body = {
+            "prompt": system + prompt,   # cache_prompt keeps the shared prefix evaluated
+            "n_predict": options.get("num_predict"),
+            "temperature": options.get("temperature"),
+            "top_k": options.get("top_k"),
+            "top_p": options.get("top_p"),
+            "repeat_penalty": options.get("repeat_penalty"),
+            "cache_prompt": True,
+            "stream": on_token is not None,
+        }
+
+        def stats(data):
+            return {"prompt_eval_count": data.get("tokens_evaluated"), "eval_count": data.get("tokens_predicted")}
+
+        if on_token is None:
+            with self._post(body, stream=False) as r:
+                data = r.json()
+            timing["ttfb"] = time.perf_counter()
+            timing["stats"] = stats(data)
+            return data.get("content") or ""
+
+        parts = []
+        with self._post(body, stream=True) as r:
+            for event in self._sse_events(r):
+                token = event.get("content") or ""
+                if token:
+                    timing.setdefault("ttfb", time.perf_counter())
+                    parts.append(token)
+                    on_token(token)
+                if event.get("stop"):
+                    timing["stats"] = stats(event)
+                    break
+        return "".join(parts)
+
+
+# =========================
+# STUB MODEL
+# =========================
+DEFAULT_RESPONSES = {
+    "uname": "Linux honeypot 5.15.0-91-generic #101-Ubuntu SMP Tue Nov 14 13:30:08 UTC 2023 x86_64 x86_64 x86_64 GNU/Linux",
+    "uptime": " 10:42:17 up 12 days,  3:04,  1 user,  load average: 0.08, 0.03, 0.01",
+    "free": (
+        "               total        used        free      shared  buff/cache   available\n"
+        "Mem:         2014136      612340      401228        1080     1000568     1231604\n"
+        "Swap:        2097148           0     2097148"
+    ),
+    "cat /proc/cpuinfo": (
+        "processor\t: 0\nvendor_id\t: GenuineIntel\nmodel name\t: Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz\n"
+        "cpu MHz\t\t: 2399.998\ncache size\t: 35840 KB\ncpu cores\t: 2"
+    ),
+    "ps": "    PID TTY          TIME CMD\n   1187 pts/0    00:00:00 bash\n   1203 pts/0    00:00:00 ps",
+    "w": " 10:42:17 up 12 days,  3:04,  1 user,  load average: 0.08, 0.03, 0.01",
+    "nproc": "2",
+}
+
+_CMD_RE = re.compile(r"Cmd: (.*)\nOut:\s*$")
+
+
+def parse_latency(spec: str):
+    """'fixed:0.2' | 'uniform:0.1,0.5' | 'normal:0.3,0.05' | 'lognormal:-1.2,0.4' (seconds)."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    vals = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+    if kind == "fixed":
+        return lambda rng: vals[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(vals[0], vals[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(vals[0], vals[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(vals[0], vals[1])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class StubModel:
+    """Deterministic fake model: same command in, same text out.
+
+    The command is recovered from the trailing `Cmd: ... Out:` of the prompt
+    and looked up (exact line first, then first word) in the canned table;
+    unknown commands get bash's "command not found". Time to first token and
+    per-token delay follow the configured distributions, plus
+    `prefill_latency` per prompt token evaluated (what context reuse saves).
+    """
+
+    def __init__(self, responses: dict = None, latency: str = "fixed:0.2",
+                 token_latency: str = "fixed:0.01", seed: int = 0, prefill_latency: float = 0.0):
+        self.responses = dict(DEFAULT_RESPONSES)
+        self.responses.update(responses or {})
+        self._first = parse_latency(latency)
+        self._per_token = parse_latency(token_latency)
+        self.prefill_latency = prefill_latency   # extra seconds per evaluated prompt token
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kw):
+        with Path(path).open("r", encoding="utf-8") as f:
+            return cls(json.load(f), **kw)
+
+    def answer(self, prompt: str) -> str:
+        m = _CMD_RE.search(prompt)
+        cmd = m.group(1).strip() if m else prompt.strip().splitlines()[-1] if prompt.strip() else ""
+        if cmd in self.responses:
+            return self.responses[cmd]
+        first = cmd.split()[0] if cmd.split() else ""
+        if first in self.responses:
+            return self.responses[first]
+        return f"bash: {first}: command not found"
+
+    def delays(self, n_tokens: int) -> list:
+        with self._lock:
+            return [self._first(self._rng)] + [self._per_token(self._rng) for _ in range(n_tokens - 1)]
+
+    @staticmethod
+    def tokenize(text: str) -> list:
+        # rough word-piece split: keeps whitespace attached, like real tokens
+        return re.findall(r"\S+\s*|\s+", text) or [""]
+
+    def stream(self, prompt: str, evaluated: int = 0):
+        """Yield tokens with realistic pacing (blocking sleeps).
+
+        `evaluated` is the number of prompt tokens the model had to prefill.
+        """
+        tokens = self.tokenize(self.answer(prompt))
+        delays = self.delays(len(tokens))
+        delays[0] += evaluated * self.prefill_latency
+        for token, delay in zip(tokens, delays):
+            if delay > 0:
+                time.sleep(delay)
+            yield token
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def evaluate(self, prompt: str, system: str = "", context: list = None) -> tuple[int, list]:
+        """(tokens to prefill, context after this prompt): with a context,
+        only `prompt` is new; without one the system prefix is evaluated too."""
+        n = self.count_tokens(prompt) + (0 if context else self.count_tokens(system) if system else 0)
+        return n, list(context or ()) + [0] * n
+
+
+class StubBackend(LLMBackend):
+    """StubModel in-process: no HTTP, no model, same interface."""
+    name = "stub"
+
+    supports_context = True
+
+    def __init__(self, url: str = "stub://", model: str = "stub", responses_path=None,
+                 latency: str = "fixed:0.2", token_latency: str = "fixed:0.01", seed: int = 0,
+                 prefill_latency: float = 0.0, **kw):
+        super().__init__(url, model, **kw)
+        stub_kw = {"latency": latency, "token_latency": token_latency, "seed": seed, "prefill_latency": prefill_latency}
+        if responses_path:
+            self.stub = StubModel.from_file(responses_path, **stub_kw)
+        else:
+            self.stub = StubModel(**stub_kw)
+
+    def generate(self, prompt, options, on_token=None, timing=None, system="", context=None):
+        timing = timing if timing is not None else {}
+        evaluated, new_context = self.stub.evaluate(prompt, system, context)
+        parts = []
+        for token in self.stub.stream(prompt, evaluated):
+            timing.setdefault("ttfb", time.perf_counter())
+            parts.append(token)
+            if on_token is not None:
+                on_token(token)
+        text = "".join(parts)
+        timing["stats"] = {"prompt_eval_count": evaluated, "eval_count": len(parts)}
+        timing["context"] = new_context + [0] * len(parts)
+        return text
+
+
+BACKENDS = {
+    "ollama": OllamaBackend,
+    "openai": OpenAIBackend,
+    "llamacpp": LlamaCppBackend,
+    "stub": StubBackend,
+}
+
+
+def make_backend(kind: str, url: str, model: str, **kw) -> LLMBackend:
+    try:
+        cls = BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"unknown LLM backend '{kind}' (choose from {', '.join(BACKENDS)})")
+    return cls(url, model, **kw)
@@ -0,0 +1,240 @@
+"""
+Response cache for LLM-generated shell output.
+
+Bots replay the same recon commands thousands of times, so we keep the raw
+model answer keyed on:
+  - the normalized command line,
+  - the session slice the answer depends on (user, hostname, cwd),
+  - a hash of the FS nodes the command touches (path arguments + cwd listing:
+    names, sizes and where the content comes from, never the content),
+so a session that changed the relevant files never gets a stale answer.
+
+Two tiers: an in-memory LRU with TTL, and an optional SQLite file that
+survives restarts. Callers must still run the cached text through
+`post_validate_output` so per-session values stay correct.
+"""
+import atexit
+import hashlib
+import queue
+import shlex
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from fs_engine import fs_stat, norm_path
+
+_STOP = object()
+
+
+def normalize_cmd(cmd: str) -> str:
+    """Collapse whitespace / quoting differences (`ls  -la` == `ls -la`)."""
+    try:
+        return " ".join(shlex.split(cmd))
+    except ValueError:
+        return " ".join(cmd.split())
+
+
+def _touched_paths(st, cmd: str) -> list:
+    try:
+        parts = shlex.split(cmd)
+    except ValueError:
+        parts = cmd.split()
+    paths = [st.cwd]
+    for arg in parts[1:]:
+        if arg.startswith("-") or "://" in arg:
+            continue
+        paths.append(norm_path(st, arg))
+    return paths
+
+
+def fs_fingerprint(st, cmd: str) -> str:
+    """Hash of the FS nodes `cmd` can see (missing nodes count too).
+
+    Files are identified, not read: a lookup must stay cheap next to the
+    local work it saves, and template files are only loaded on demand.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for p in _touched_paths(st, cmd):
+        h.update(p.encode("utf-8", "surrogatepass"))
+        node = fs_stat(st, p)
+        if node is None:
+            h.update(b"\x00missing")
+        elif node.is_dir:
+            h.update(b"\x00dir\x00" + "\x00".join(sorted(node.children)).encode("utf-8", "surrogatepass"))
+        elif p in st.fs.upper:
+            # written by this session: every write sets a new mtime
+            h.update(f"\x00upper\x00{node.size}\x00{node.mtime}\x00{node.mode:o}".encode())
+        elif node.blob is not None:
+            # template file: its source position, size and mtime survive a restart
+            blob = node.blob
+            h.update(f"\x00blob\x00{blob.path}\x00{blob.offset}\x00{node.size}\x00{node.mtime}".encode(
+                "utf-8", "surrogatepass"))
+        else:
+            # built-in file: its text only changes with the code (mtime is the start time)
+            h.update(f"\x00base\x00{node.size}\x00{node.mode:o}".encode())
+    return h.hexdigest()
+
+
+def cache_key(st, cmd: str) -> str:
+    return "\x1f".join((normalize_cmd(cmd), st.user, st.hostname, st.cwd, fs_fingerprint(st, cmd)))
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 4096, ttl: float = 24 * 3600, db_path: Path = None,
+                 write_queue: int = 10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = Path(db_path) if db_path else None
+        self._mem = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()  # the LRU only: SQLite is never touched under it
+        self._local = threading.local()  # per-thread read connection
+        self._writes = queue.Queue(maxsize=write_queue)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.write_dropped = 0
+
+    # --- persistent tier -------------------------------------------------
+    # Reads run on the caller's thread with its own connection (WAL: readers
+    # don't wait for the writer); inserts and deletes are queued to one
+    # writer thread that commits in batches.
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.db_path))
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, expires REAL)")
+        return db
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None and self.db_path is not None:
+            db = self._local.db = self._connect()
+        return db
+
+    def _disk_get(self, key: str, now: float):
+        db = self._conn()
+        if db is None:
+            return None
+        row = db.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self._queue_write(("DELETE FROM responses WHERE key = ?", (key,)))
+            return None
+        return row
+
+    def _queue_write(self, op):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="llm-cache-db", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.close)
+        try:
+            self._writes.put_nowait(op)
+        except queue.Full:
+            with self._lock:
+                self.write_dropped += 1
+
+    def _write_loop(self):
+        try:
+            db = self._connect()
+        except sqlite3.Error:
+            db = None
+        while True:
+            op = self._writes.get()
+            ops = [op]
+            while op is not _STOP:
+                try:
+                    op = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                ops.append(op)
+            if db is not None:
+                try:
+                    for sql in ops:
+                        if sql is not _STOP:
+                            db.execute(*sql)
+                    db.commit()
+                except sqlite3.Error:
+                    pass
+            if ops[-1] is _STOP:
+                break
+        if db is not None:
+            db.close()
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued and stop the writer thread."""
+        if self._writer is not None and self._writer.is_alive():
+            try:
+                self._writes.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._writer.join(timeout)
+
+    # --- API -------------------------------------------------------------
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                if item[0] >= now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._mem[key]
+                self.expired += 1
+        try:
+            row = self._disk_get(key, now)
+        except sqlite3.Error:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, row[0], row[1])
+        return row[0]
+
+    def __contains__(self, key: str) -> bool:
+        """Fresh in memory (no stats, no disk read): for speculative callers."""
+        with self._lock:
+            item = self._mem.get(key)
+            return item is not None and item[0] >= time.time()
+
+    def put(self, key: str, response: str):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._store(key, response, expires)
+        if self.db_path is not None:
+            self._queue_write(("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, expires)))
+
+    def _store(self, key: str, response: str, expires: float):
+        self._mem[key] = (expires, response)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._mem),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "write_queue": self._writes.qsize(),
+            "write_dropped": self.write_dropped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
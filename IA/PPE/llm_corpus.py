@@ -0,0 +1,311 @@
+"""
+Canned-response corpus mined from past sessions.
+
+The model has already answered most of what bots type. `python llm_corpus.py
+--build` walks the event log (and the per-session dumps in logs/sessions/ for
+user and hostname), pairs every `command` event answered by the LLM with its
+`output` event, replaces the session-specific values with placeholders
+
+    {user} {hostname} {cwd} {home} {remote_ip}
+
+and keeps, per normalized command, the answer seen most often. The result is
+a single JSON file indexed by command, loaded at startup; llm_adapter looks a
+command up there before calling the model (a dict lookup + placeholder fill).
+
+Commands whose path arguments exist in the session's FS are left to the model
+(their answer depends on state the corpus doesn't know), and so is anything
+seen fewer than MIN_SUPPORT times, with no clear majority answer, echoing
+the prompt, or routed away from the LLM by now (routing.py).
+
+`python llm_corpus.py --report` shows the corpus age and which logged LLM
+requests it covers, with the commands that still need the model.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from fs_engine import fs_exists, norm_path
+from llm_cache import normalize_cmd
+from routing import LLM, TABLE
+from session_store import SESSIONS_DIR, iter_sessions
+from utils import LOG_DIR, EVENT_LOG, utc_now
+
+CORPUS_PATH = LOG_DIR / "llm_corpus.json"
+MIN_SUPPORT = 2        # times an answer must have been seen
+MIN_AGREEMENT = 0.5    # share of the samples the kept answer must represent
+STALE_DAYS = 30        # report entries not seen since as stale
+LOGGED_OUTPUT_MAX = 500  # utils.log_event truncation: longer outputs are unusable
+
+# events carrying a model answer (llm_adapter), and every event of an LLM request
+ANSWER_EVENTS = {"llm_success", "llm_cache_hit"}
+LLM_EVENTS = ANSWER_EVENTS | {"llm_corpus_hit", "llm_empty", "llm_timeout", "llm_connection_error",
+                              "llm_error", "llm_stream_interrupted"}
+
+PLACEHOLDERS = ("user", "hostname", "cwd", "home", "remote_ip")
+
+# Their names also own system files and processes (`root root /etc/shadow`,
+# `uid=0(root)`): never turned into {user}, and their answers are kept
+# apart, replayed to the same account only
+SYSTEM_ACCOUNTS = frozenset({
+    "root", "daemon", "bin", "sys", "sync", "games", "man", "lp", "mail", "news", "uucp", "proxy",
+    "www-data", "backup", "list", "irc", "nobody", "sshd", "systemd-network", "messagebus",
+})
+
+# the model sometimes echoes its prompt back: never replay that
+_PROMPT_ECHO_RE = re.compile(r"RULES:|CONTEXT|Filesystem snapshot|Recent commands:|session state|^Cmd: ", re.M)
+
+
+# =========================
+# TEMPLATES
+# =========================
+def templatize(text: str, user: str, hostname: str, cwd: str, home: str, remote_ip: str) -> str:
+    """Session values -> {placeholders} (paths first, longest first). A
+    system account's name and home stay literal."""
+    system = user in SYSTEM_ACCOUNTS
+    paths = [(cwd, "{cwd}"), (home, "{home}")] if cwd != home else [(home, "{home}")]
+    if system:
+        paths = [(v, mark) for v, mark in paths if v != home]
+    for value, mark in sorted(paths, key=lambda p: -len(p[0])):
+        if value and value != "/":
+            text = re.sub(re.escape(value) + r"(?![\w.-])", mark, text)
+    for value, mark in ((remote_ip, "{remote_ip}"), (hostname, "{hostname}"), (None if system else user, "{user}")):
+        if value:
+            text = re.sub(r"(?<![\w.-])" + re.escape(value) + r"(?![\w.-])", mark, text)
+    return text
+
+
+def corpus_key(key: str, user: str) -> str:
+    """Entry of a normalized command for this account (see SYSTEM_ACCOUNTS)."""
+    return f"{key}\0{user}" if user in SYSTEM_ACCOUNTS else key
+
+
+def render(template: str, st) -> str:
+    values = {"user": st.user, "hostname": st.hostname, "cwd": st.cwd, "home": st.home,
+              "remote_ip": st.remote_ip}
+    for k in PLACEHOLDERS:
+        template = template.replace("{" + k + "}", values[k])
+    return template
+
+
+# =========================
+# MINING
+# =========================
+def _normalize_event(e: dict) -> dict:
+    """Old log lines ({"event_type", "session_id", "data"}) -> current layout."""
+    if "event_type" not in e:
+        return e
+    data = e.get("data") or {}
+    out = {"ts": e.get("timestamp", ""), "sid": e.get("session_id"), "ip": e.get("client_ip"),
+           "type": e["event_type"], **data}
+    if out["type"] == "output":
+        out["out"] = data.get("output", "")
+        out["code"] = data.get("exit_code", 0)
+    return out
+
+
+def load_session_info(sessions_dir: Path) -> dict:
+    """sid -> (user, hostname) from the saved sessions (session_store.py)."""
+    return {dump["sid"]: (dump.get("user", "user"), dump.get("hostname", "honeypot"))
+            for dump in iter_sessions(sessions_dir) if dump.get("sid")}
+
+
+def _goes_to_llm(key: str) -> bool:
+    name = key.split(" ", 1)[0].rsplit("/", 1)[-1]
+    return TABLE.lookup(name)[0] == LLM
+
+
+def mine(events, sessions: dict = None, user: str = "user", hostname: str = "honeypot") -> dict:
+    """Events -> {normalized command: Counter(template)} plus seen timestamps."""
+    sessions = sessions or {}
+    samples = defaultdict(Counter)
+    seen = {}
+    pending = {}  # sid -> [cmd, cwd, ts, model answer or None]
+    for e in events:
+        e = _normalize_event(e)
+        sid, kind = e.get("sid"), e.get("type")
+        if kind == "command":
+            pending[sid] = [e.get("cmd", "").strip(), e.get("cwd", ""), e.get("ts", ""), None]
+        elif kind in ANSWER_EVENTS and sid in pending:
+            p = pending[sid]
+            # the whole line went to the model as a single request
+            if normalize_cmd(e.get("cmd", "")) == normalize_cmd(p[0]):
+                p[3] = e.get("response_preview", "")  # old logs have no preview
+        elif kind == "output" and sid in pending:
+            cmd, cwd, ts, preview = pending.pop(sid)
+            if preview is None or e.get("code", 0) != 0:
+                continue
+            out = (e.get("out") or "").replace("\r\n", "\n")
+            if len(out) >= LOGGED_OUTPUT_MAX:
+                if len(preview) >= 200:
+                    continue  # both truncated
+                out = preview
+            if not out.strip() or _PROMPT_ECHO_RE.search(out):
+                continue
+            s_user, s_host = sessions.get(sid, (user, hostname))
+            home = "/root" if s_user == "root" else f"/home/{s_user}"
+            key = normalize_cmd(cmd)
+            if not _goes_to_llm(key):
+                continue  # answered locally by now
+            key = corpus_key(key, s_user)
+            samples[key][templatize(out, s_user, s_host, cwd or home, home, e.get("ip", ""))] += 1
+            first, last = seen.get(key, (ts, ts))
+            seen[key] = (min(first, ts), max(last, ts))
+    return {"samples": samples, "seen": seen}
+
+
+def build_corpus(mined: dict, min_support: int = MIN_SUPPORT, min_agreement: float = MIN_AGREEMENT) -> dict:
+    entries = {}
+    for key, counter in mined["samples"].items():
+        template, n = counter.most_common(1)[0]
+        total = sum(counter.values())
+        if n < min_support or n / total < min_agreement:
+            continue
+        first, last = mined["seen"][key]
+        entries[key] = {"out": template, "n": n, "agree": round(n / total, 3), "first": first, "last": last}
+    return {"version": 1, "built": utc_now(), "entries": dict(sorted(entries.items()))}
+
+
+def save_corpus(corpus: dict, path: Path = CORPUS_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False, separators=(",", ":"))
+    tmp.replace(path)
+
+
+# =========================
+# RUNTIME
+# =========================
+class Corpus:
+    """In-memory index of a built corpus; lookup() is a dict hit + fill."""
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        self.built = data.get("built")
+        self.meta = data.get("entries", {})
+        self.entries = {k: v["out"] for k, v in self.meta.items()}
+        self.hits = 0
+        self.misses = 0
+        self.fs_skips = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path = CORPUS_PATH) -> "Corpus":
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def covers(self, st, cmd: str) -> bool:
+        return corpus_key(normalize_cmd(cmd), st.user) in self.entries
+
+    def lookup(self, st, cmd: str):
+        """Rendered answer for `cmd` in this session, or None."""
+        key = normalize_cmd(cmd)
+        template = self.entries.get(corpus_key(key, st.user))
+        if template is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        for arg in key.split()[1:]:
+            if not arg.startswith("-") and "://" not in arg and fs_exists(st, norm_path(st, arg)):
+                with self._lock:
+                    self.fs_skips += 1
+                return None
+        with self._lock:
+            self.hits += 1
+        return render(template, st)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.fs_skips
+        return {
+            "entries": len(self.entries),
+            "built": self.built,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fs_skips": self.fs_skips,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# =========================
+# REPORT
+# =========================
+def coverage_report(corpus: Corpus, events, stale_days: int = STALE_DAYS) -> dict:
+    """Which logged LLM requests the corpus answers, and how old it is."""
+    requests = Counter()
+    served = now_local = 0
+    for e in events:
+        e = _normalize_event(e)
+        if e.get("type") not in LLM_EVENTS or not e.get("cmd"):
+            continue
+        key = normalize_cmd(e["cmd"])
+        if not _goes_to_llm(key):
+            now_local += 1
+            continue
+        requests[key] += 1
+        served += e["type"] == "llm_corpus_hit"
+    total = sum(requests.values())
+    commands = {k.split("\0", 1)[0] for k in corpus.entries}  # any account
+    covered = sum(n for k, n in requests.items() if k in commands)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=stale_days)).isoformat().replace("+00:00", "Z")
+    lasts = sorted(m["last"] for m in corpus.meta.values())
+    return {
+        "entries": len(corpus),
+        "built": corpus.built,
+        "oldest_last_seen": lasts[0] if lasts else None,
+        "newest_last_seen": lasts[-1] if lasts else None,
+        "stale": sum(1 for t in lasts if t < cutoff),
+        "llm_requests": total,
+        "covered": covered,
+        "coverage": round(covered / total, 4) if total else 0.0,
+        "served_from_corpus": served,
+        "now_local": now_local,
+        "uncovered": [(k, n) for k, n in requests.most_common() if k not in commands],
+    }
+
+
+def main():
+    from log_writer import iter_events
+
+    parser = argparse.ArgumentParser(description="Mine past LLM answers into a canned-response corpus.")
+    parser.add_argument("--build", action="store_true", help="mine the event log and write the corpus")
+    parser.add_argument("--report", action="store_true", help="corpus freshness and coverage of the event log")
+    parser.add_argument("--log", default=str(EVENT_LOG), metavar="EVENT_LOG")
+    parser.add_argument("--sessions", default=str(SESSIONS_DIR), help="saved sessions (session_store.py)")
+    parser.add_argument("--out", default=str(CORPUS_PATH))
+    parser.add_argument("--since", default=None, help="ISO timestamp")
+    parser.add_argument("--min-support", type=int, default=MIN_SUPPORT)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.build:
+        t0 = time.perf_counter()
+        mined = mine(iter_events(Path(args.log), since=args.since), load_session_info(Path(args.sessions)))
+        corpus = build_corpus(mined, args.min_support)
+        save_corpus(corpus, Path(args.out))
+        print(f"corpus: {len(corpus['entries'])}/{len(mined['samples'])} commands kept -> {args.out} "
+              f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    if args.report or not args.build:
+        r = coverage_report(Corpus.load(Path(args.out)), iter_events(Path(args.log), since=args.since))
+        print(f"corpus: {r['entries']} entries, built {r['built']}, last seen {r['oldest_last_seen']} .. "
+              f"{r['newest_last_seen']}, {r['stale']} stale (> {STALE_DAYS} days)")
+        print(f"coverage: {r['covered']}/{r['llm_requests']} LLM requests ({r['coverage']:.1%}), "
+              f"{r['served_from_corpus']} served from the corpus, {r['now_local']} routed locally since")
+        print(f"{'still needs the model':<40}{'requests':>10}")
+        for cmd, n in r["uncovered"][:args.top]:
+            print(f"{cmd[:39]:<40}{n:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Speculative prefetch of the likely next command's LLM answer.
+
+Attack scripts are predictable: `uname -a` is followed by `cat /proc/cpuinfo`,
+`cd /tmp` by `wget ...`. NextCommandModel is a small n-gram model (up to
+ORDER previous commands, backing off to shorter contexts) trained from the
+`command` events of the log (`python llm_prefetch.py --train`) and updated
+online by live sessions.
+
+After each line, Prefetcher predicts the top PREFETCH_TOP_K next commands
+and, for those the LLM would have to answer, queues a speculative generation
+while the attacker types. The answer lands in the response cache
+(llm_cache.py) under the key the real request will use, so a correct guess
+turns into a cache hit.
+
+Speculation must never starve real requests, so a prediction only runs when
+  - it is likely enough (PREFETCH_MIN_PROB),
+  - the LLM scheduler has no queue and a free worker,
+  - fewer than PREFETCH_MAX_INFLIGHT speculative generations are running,
+  - the per-minute budget (PREFETCH_PER_MINUTE) isn't spent,
+and it runs at the lowest scheduler priority. Stale predictions (the session
+moved on, or waited more than PREFETCH_MAX_AGE) are dropped.
+
+stats() reports prediction accuracy, prefetch hits, late hits (the real
+request arrived while the guess was still generating) and wasted generations.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from pathlib import Path
+
+from llm_cache import normalize_cmd
+from routing import LLM, route
+from shell import needs_whole_line, parse, ShellSyntaxError
+from utils import LOG_DIR, EVENT_LOG
+
+MODEL_PATH = LOG_DIR / "next_cmd_model.json"
+ORDER = 2                  # previous commands used as context
+MAX_CONTEXTS = 50000       # contexts kept by the model (least seen dropped on save)
+SAVE_TOP = 8               # successors kept per context on save
+
+PREFETCH_ENABLED = True
+PREFETCH_TOP_K = 2
+PREFETCH_MIN_PROB = 0.2
+PREFETCH_MAX_INFLIGHT = 1
+PREFETCH_PER_MINUTE = 30
+PREFETCH_MAX_AGE = 10.0    # seconds a queued guess stays useful
+PREFETCH_QUEUE = 16
+TRACKED_KEYS = 4096        # prefetched cache keys remembered for hit accounting
+
+
+# =========================
+# NEXT-COMMAND MODEL
+# =========================
+class NextCommandModel:
+    """Counts of next command per context of 0..ORDER previous commands."""
+
+    def __init__(self, order: int = ORDER):
+        self.order = order
+        self.counts = {}  # tuple of previous commands -> Counter(next command)
+        self._lock = threading.Lock()
+
+    def observe(self, previous: list, cmd: str):
+        previous = tuple(previous[-self.order:]) if self.order else ()
+        with self._lock:
+            for n in range(len(previous) + 1):
+                ctx = previous[len(previous) - n:]
+                counter = self.counts.get(ctx)
+                if counter is None:
+                    if len(self.counts) >= MAX_CONTEXTS:
+                        continue
+                    counter = self.counts[ctx] = Counter()
+                counter[cmd] += 1
+
+    def predict(self, previous: list, k: int = PREFETCH_TOP_K) -> list:
+        """[(command, probability)] from the longest context seen enough."""
+        previous = tuple(previous[-self.order:]) if self.order else ()
+        with self._lock:
+            for n in range(len(previous), -1, -1):
+                counter = self.counts.get(previous[len(previous) - n:])
+                if counter and (n == 0 or sum(counter.values()) >= 2):
+                    total = sum(counter.values())
+                    return [(c, round(v / total, 4)) for c, v in counter.most_common(k)]
+        return []
+
+    def train(self, events):
+        """Fit on the `command` events of a log, session by session."""
+        sessions = {}
+        for e in events:
+            if e.get("type") != "command" or not e.get("cmd"):
+                continue
+            cmd = normalize_cmd(e["cmd"].strip())
+            history = sessions.setdefault(e.get("sid"), deque(maxlen=self.order))
+            self.observe(list(history), cmd)
+            history.append(cmd)
+        return self
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            items = sorted(self.counts.items(), key=lambda kv: -sum(kv[1].values()))[:MAX_CONTEXTS]
+            return {"order": self.order,
+                    "contexts": [[list(ctx), dict(c.most_common(SAVE_TOP))] for ctx, c in items]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NextCommandModel":
+        model = cls(data.get("order", ORDER))
+        for ctx, nexts in data.get("contexts", []):
+            model.counts[tuple(ctx)] = Counter(nexts)
+        return model
+
+    def save(self, path: Path = MODEL_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = MODEL_PATH) -> "NextCommandModel":
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def is_llm_bound(st, line: str) -> bool:
+    """A single command the router would send to the model."""
+    if needs_whole_line(line):
+        return False
+    try:
+        pipelines = parse(line)
+    except ShellSyntaxError:
+        return False
+    if len(pipelines) != 1 or len(pipelines[0].stages) != 1 or pipelines[0].stages[0].redirects:
+        return False
+    return route(st, pipelines[0].stages[0].text).route == LLM
+
+
+# =========================
+# PREFETCHER
+# =========================
+class _Guess:
+    __slots__ = ("session_id", "cmd", "key", "request", "queued")
+
+    def __init__(self, session_id, cmd: str, key: str, request):
+        self.session_id = session_id
+        self.cmd = cmd
+        self.key = key
+        self.request = request
+        self.queued = time.monotonic()
+
+
+class Prefetcher:
+    """Predicts, budgets and runs speculative generations on its own thread.
+
+    `prepare(st, cmd)` snapshots what the real request would send (None if
+    there is nothing to prefetch), `generate(request)` runs it at the lowest
+    priority and fills the cache, `is_idle()` tells whether the scheduler
+    has spare capacity. All three come from llm_adapter.
+    """
+
+    def __init__(self, model: NextCommandModel, prepare, generate, is_idle,
+                 top_k: int = PREFETCH_TOP_K, min_prob: float = PREFETCH_MIN_PROB,
+                 max_inflight: int = PREFETCH_MAX_INFLIGHT, per_minute: int = PREFETCH_PER_MINUTE):
+        self.model = model
+        self.prepare = prepare
+        self.generate = generate
+        self.is_idle = is_idle
+        self.top_k = top_k
+        self.min_prob = min_prob
+        self.max_inflight = max_inflight
+        self.per_minute = per_minute
+        self._pending = deque(maxlen=PREFETCH_QUEUE)
+        self._cond = threading.Condition()
+        self._inflight = {}           # cache key -> guess being generated
+        self._done = OrderedDict()    # cache key -> claimed?
+        self._last_guess = {}         # session id -> predicted commands
+        self._spent = deque()         # start times of generations in the last minute
+        self._thread = None
+        self.counters = Counter()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="llm-prefetch", daemon=True)
+                self._thread.start()
+
+    # --- session side ------------------------------------------------------
+
+    def after_command(self, st, session_id):
+        """Learn from the line just run, then queue guesses for the next one."""
+        history = [normalize_cmd(c) for c in st.history[-(self.model.order + 1):]]
+        if not history:
+            return
+        guessed = self._last_guess.pop(session_id, None)
+        if guessed:
+            self._count("predictions_checked")
+            self._count("predictions_right", history[-1] in guessed)
+        self.model.observe(history[:-1], history[-1])
+
+        guesses = [(c, p) for c, p in self.model.predict(history, self.top_k) if p >= self.min_prob]
+        self._last_guess[session_id] = {c for c, _ in guesses}
+        self._drop_session(session_id)  # whatever it had queued is stale now
+        for cmd, _ in guesses:
+            if not is_llm_bound(st, cmd):
+                self._count("skipped_local")
+                continue
+            prepared = self.prepare(st, cmd)
+            if prepared is None:
+                self._count("skipped_cached")
+                continue
+            key, request = prepared
+            with self._cond:
+                if key in self._inflight or key in self._done:
+                    self.counters["skipped_cached"] += 1
+                    continue
+                if len(self._pending) == self._pending.maxlen:
+                    self.counters["dropped_queue"] += 1
+                self._pending.append(_Guess(session_id, cmd, key, request))
+                self.counters["queued"] += 1
+                self._cond.notify()
+        self._ensure_started()
+
+    def session_end(self, session_id):
+        self._last_guess.pop(session_id, None)
+        self._drop_session(session_id)
+
+    def _drop_session(self, session_id):
+        with self._cond:
+            self._pending = deque((g for g in self._pending if g.session_id != session_id),
+                                  maxlen=PREFETCH_QUEUE)
+
+    def _count(self, name: str, n: int = 1):
+        with self._cond:
+            self.counters[name] += n
+
+    # --- request side ------------------------------------------------------
+
+    def on_cache_hit(self, key: str):
+        with self._cond:
+            if self._done.get(key) is False:
+                self._done[key] = True
+                self.counters["hits"] += 1
+
+    def on_cache_miss(self, key: str):
+        with self._cond:
+            if key in self._inflight:
+                self.counters["late"] += 1  # the scheduler joins it if the prompt matches
+
+    # --- worker ------------------------------------------------------------
+
+    def _budget_ok(self) -> bool:
+        now = time.monotonic()
+        while self._spent and now - self._spent[0] > 60:
+            self._spent.popleft()
+        return (len(self._inflight) < self.max_inflight and len(self._spent) < self.per_minute
+                and self.is_idle())
+
+    def _next_guess(self):
+        with self._cond:
+            while True:
+                while self._pending and time.monotonic() - self._pending[0].queued > PREFETCH_MAX_AGE:
+                    self._pending.popleft()
+                    self.counters["expired"] += 1
+                if self._pending and self._budget_ok():
+                    guess = self._pending.pop()  # newest first
+                    self._inflight[guess.key] = guess
+                    self._spent.append(time.monotonic())
+                    return guess
+                # re-check the budget regularly: the scheduler doesn't notify us
+                self._cond.wait(0.05 if self._pending else None)
+
+    def _worker(self):
+        while True:
+            guess = self._next_guess()
+            try:
+                ok = self.generate(guess.request)
+            except Exception:
+                ok = False
+            with self._cond:
+                self._inflight.pop(guess.key, None)
+                self.counters["generated" if ok else "failed"] += 1
+                if ok:
+                    self._done[guess.key] = False
+                    while len(self._done) > TRACKED_KEYS:
+                        self._done.popitem(last=False)
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            c = dict(self.counters)
+            unclaimed = sum(1 for claimed in self._done.values() if not claimed)
+            pending = len(self._pending)
+            inflight = len(self._inflight)
+        generated = c.get("generated", 0)
+        checked = c.get("predictions_checked", 0)
+        return {
+            **c,
+            "pending": pending,
+            "inflight": inflight,
+            "unclaimed": unclaimed,
+            "wasted": generated - c.get("hits", 0),
+            "prefetch_hit_rate": round(c.get("hits", 0) / generated, 4) if generated else 0.0,
+            "prediction_accuracy": round(c.get("predictions_right", 0) / checked, 4) if checked else 0.0,
+        }
+
+
+def main():
+    from log_writer import iter_events
+
+    parser = argparse.ArgumentParser(description="Next-command model for speculative LLM prefetch.")
+    parser.add_argument("--train", nargs="?", const=str(EVENT_LOG), default=None, metavar="EVENT_LOG")
+    parser.add_argument("--since", default=None, help="ISO timestamp")
+    parser.add_argument("--model", default=str(MODEL_PATH))
+    parser.add_argument("--predict", default=None, help="show the guesses after this command (use ';;' between commands)")
+    args = parser.parse_args()
+
+    if args.train:
+        t0 = time.perf_counter()
+        model = NextCommandModel().train(iter_events(Path(args.train), since=args.since))
+        model.save(Path(args.model))
+        print(f"model: {len(model.counts)} contexts -> {args.model} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    model = NextCommandModel.load(Path(args.model))
+    if args.predict:
+        previous = [normalize_cmd(c.strip()) for c in args.predict.split(";;")]
+        for cmd, p in model.predict(previous, 5):
+            print(f"{p:6.1%}  {cmd}")
+
+
+if __name__ == "__main__":
+    main()
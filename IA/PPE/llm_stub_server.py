@@ -0,0 +1,171 @@
+"""
+Local deterministic LLM stub server.
+
+Speaks just enough of the Ollama (/api/generate), OpenAI
+(/v1/chat/completions) and llama.cpp (/completion) HTTP APIs, streaming or
+not, to run the honeypot end to end without a model. Answers come from
+llm_backends.StubModel: canned per-command output with a configurable
+latency distribution, so backends can be compared under identical load.
+
+    python llm_stub_server.py --port 11434 --latency lognormal:-1.0,0.5
+    python honeypot_ssh.py --llm-backend ollama --llm-url http://127.0.0.1:11434/api/generate
+"""
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import StubModel
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real servers
+    model: StubModel = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- plumbing --------------------------------------------------------
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def _send_json(self, obj: dict):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # --- routes ----------------------------------------------------------
+
+    def do_POST(self):
+        body = self._body()
+        if self.path.startswith("/api/generate"):
+            self._ollama(body)
+        elif self.path.startswith("/v1/chat/completions"):
+            self._openai(body)
+        elif self.path.startswith("/completion"):
+            self._llamacpp(body)
+        else:
+            self.send_error(404)
+
+    def _ollama(self, body):
+        prompt = body.get("prompt", "")
+        evaluated, context = self.model.evaluate(prompt, body.get("system", ""), body.get("context"))
+        stats = {"prompt_eval_count": evaluated}
+        if not body.get("stream", True):
+            text = "".join(self.model.stream(prompt, evaluated))
+            n = len(self.model.tokenize(text))
+            self._send_json({"model": body.get("model"), "response": text, "done": True,
+                             "eval_count": n, "context": context + [0] * n, **stats})
+            return
+        self._start_chunked("application/x-ndjson")
+        n = 0
+        for token in self.model.stream(prompt, evaluated):
+            n += 1
+            self._chunk(json.dumps({"response": token, "done": False}).encode() + b"\n")
+        final = {"response": "", "done": True, "eval_count": n, "context": context + [0] * n, **stats}
+        self._chunk(json.dumps(final).encode() + b"\n")
+        self._end_chunked()
+
+    def _openai(self, body):
+        messages = body.get("messages") or []
+        prompt = messages[-1].get("content", "") if messages else ""
+        system = "".join(m.get("content", "") for m in messages[:-1])
+        evaluated, _ = self.model.evaluate(prompt, system)
+        usage = {"prompt_tokens": evaluated}
+        created = int(time.time())
+        if not body.get("stream"):
+            text = "".join(self.model.stream(prompt, evaluated))
+            usage["completion_tokens"] = len(self.model.tokenize(text))
+            self._send_json({"object": "chat.completion", "created": created, "model": body.get("model"),
+                             "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                          "finish_reason": "stop"}],
+                             "usage": usage})
+            return
+        self._start_chunked("text/event-stream")
+        n = 0
+        for token in self.model.stream(prompt, evaluated):
+            n += 1
+            event = {"object": "chat.completion.chunk", "created": created,
+                     "choices": [{"index": 0, "delta": {"content": token}}]}
+            self._chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+        usage["completion_tokens"] = n
+        self._chunk(b"data: " + json.dumps({"choices": [], "usage": usage}).encode() + b"\n\n")
+        self._chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _llamacpp(self, body):
+        prompt = body.get("prompt", "")
+        evaluated = self.model.count_tokens(prompt)
+        if not body.get("stream"):
+            text = "".join(self.model.stream(prompt, evaluated))
+            self._send_json({"content": text, "stop": True, "tokens_evaluated": evaluated,
+                             "tokens_predicted": len(self.model.tokenize(text))})
+            return
+        self._start_chunked("text/event-stream")
+        n = 0
+        for token in self.model.stream(prompt, evaluated):
+            n += 1
+            self._chunk(b"data: " + json.dumps({"content": token, "stop": False}).encode() + b"\n\n")
+        final = {"content": "", "stop": True, "tokens_evaluated": evaluated, "tokens_predicted": n}
+        self._chunk(b"data: " + json.dumps(final).encode() + b"\n\n")
+        self._end_chunked()
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # pooled keep-alive clients just drop idle connections on exit
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(host: str, port: int, model: StubModel) -> ThreadingHTTPServer:
+    handler = type("BoundStubHandler", (StubHandler,), {"model": model})
+    server = StubHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", default="fixed:0.2", help="time to first token distribution (seconds)")
+    parser.add_argument("--token-latency", default="fixed:0.01", help="delay between tokens (seconds)")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="seconds per evaluated prompt token")
+    parser.add_argument("--responses", default=None, help="JSON file {command: output}")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    kw = {"latency": args.latency, "token_latency": args.token_latency, "seed": args.seed,
+          "prefill_latency": args.prefill_latency}
+    model = StubModel.from_file(args.responses, **kw) if args.responses else StubModel(**kw)
+    server = make_server(args.host, args.port, model)
+    print(f"[+] LLM stub listening on {args.host}:{args.port} (latency={args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+"""
+Background writer for the JSONL event log.
+
+Session threads only do a non-blocking put() on a bounded queue; a single
+writer thread owns the file handle, serializes entries in batches, flushes
+after every batch and fsyncs periodically. When the queue is full the event
+is dropped and counted; the writer then records a `log_dropped` entry so
+the gap is visible in the log itself.
+
+Rotation: the active file is rolled over when it exceeds ROTATE_MAX_BYTES or
+when the hour/day changes (ROTATE_WHEN). Closed segments are renamed to
+`<stem>-<start>.jsonl` and described right away in `<stem>.index.jsonl`:
+
+    {"segment": "...jsonl.gz", "first_ts": ..., "last_ts": ..., "events": N, "sids": [...]}
+
+then compressed in the background (gzip, or zstd when the `zstandard`
+package is installed); the entry is renamed once the compressed file is
+complete. Readers open only the segments covering the time range or session
+they need (see `find_segments` / `iter_events`). At startup, closed segments
+left uncompressed or unindexed by a crash are indexed and compressed.
+
+A failed write (full disk, rotation error, ...) is logged and the file
+reopened for one retry; if that fails too the batch is dropped and counted
+like a full queue, and the writer carries on with the next one.
+"""
+import atexit
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+import metrics
+
+QUEUE_SIZE = 10000       # events buffered in memory before we start dropping
+BATCH_SIZE = 512         # max events serialized per write()
+FLUSH_INTERVAL = 0.5     # seconds the writer waits for more events before flushing
+FSYNC_INTERVAL = 2.0     # seconds between fsync() calls
+RETRY_DELAY = 1.0        # pause after a batch was lost to a write error
+
+ROTATE_MAX_BYTES = 64 * 1024 * 1024   # 0 disables size-based rotation
+ROTATE_WHEN = "day"                   # "hour", "day" or None
+COMPRESSION = "gzip"                  # "gzip", "zstd" or None
+
+LOG_FD_ENV = "HONEYPOT_LOG_FD"        # pipe to the supervisor, in worker processes
+
+_STOP = object()
+
+WRITE_LAG = metrics.histogram("honeypot_log_write_lag_seconds",
+                              "Age of the oldest event of a batch when it reaches the file")
+WRITE_BATCH = metrics.histogram("honeypot_log_write_seconds", "Time to serialize and write one batch")
+
+_PERIOD_FORMATS = {"hour": "%Y%m%d%H", "day": "%Y%m%d"}
+
+log = logging.getLogger("honeypot.log_writer")  # not utils.get_logger: utils imports this module
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _period(when, t: float):
+    fmt = _PERIOD_FORMATS.get(when)
+    return datetime.fromtimestamp(t, timezone.utc).strftime(fmt) if fmt else None
+
+
+class _Segment:
+    """What we know about the active file, for the index entry."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.first_ts = None
+        self.last_ts = None
+        self.events = 0
+        self.sids = set()
+
+    def add(self, entry: dict):
+        ts = entry.get("ts")
+        if ts:
+            if self.first_ts is None:
+                self.first_ts = ts
+            self.last_ts = ts
+        sid = entry.get("sid")
+        if sid:
+            self.sids.add(sid)
+        self.events += 1
+
+
+def _index_entry(name: str, segment: _Segment) -> dict:
+    return {
+        "segment": name,
+        "first_ts": segment.first_ts,
+        "last_ts": segment.last_ts,
+        "events": segment.events,
+        "sids": sorted(segment.sids),
+    }
+
+
+class EventLogWriter:
+    def __init__(self, path: Path, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, fsync_interval: float = FSYNC_INTERVAL,
+                 max_bytes: int = ROTATE_MAX_BYTES, rotate_when=ROTATE_WHEN, compression=COMPRESSION):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.stem + ".index.jsonl")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.rotate_when = rotate_when
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        self.compression = compression
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._compressors = []
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.write_errors = 0
+        self._dropped_reported = 0
+        self._oldest = None  # monotonic time of the first event queued since the last batch
+        self.last_lag = 0.0
+        self._f = None
+        self._size = 0
+        self._segment = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self, entry: dict) -> bool:
+        """Queue one event; never blocks. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(entry)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0):
+        """Flush what is queued and stop the writer thread."""
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        for t in self._compressors:
+            t.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+        }
+
+    # --- writer thread ---------------------------------------------------
+
+    def _drain(self, first):
+        batch = [first]
+        stop = False
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _dropped_entry(self):
+        with self._lock:
+            n = self.dropped - self._dropped_reported
+            self._dropped_reported = self.dropped
+        if n <= 0:
+            return None
+        return {"ts": _utc_now(), "type": "log_dropped", "count": n}
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._f is None:
+            self._recover_segments()
+        self._f = self.path.open("a", encoding="utf-8")
+        self._size = self._f.tell()
+        started = self.path.stat().st_mtime if self._size else time.time()
+        self._segment = _Segment(started)
+        if self._size:
+            # resuming an existing file: rebuild its index entry once
+            with self.path.open("r", encoding="utf-8") as old:
+                for line in old:
+                    try:
+                        self._segment.add(json.loads(line))
+                    except ValueError:
+                        continue
+            self._segment.started = min(started, self._ts_epoch(self._segment.first_ts, started))
+
+    @staticmethod
+    def _ts_epoch(ts, default: float) -> float:
+        try:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            return default
+
+    def _should_rotate(self, now: float) -> bool:
+        if not self._segment or not self._segment.events:
+            return False
+        if self.max_bytes and self._size >= self.max_bytes:
+            return True
+        return _period(self.rotate_when, self._segment.started) != _period(self.rotate_when, now)
+
+    def _rotate(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        stamp = datetime.fromtimestamp(self._segment.started, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        closed = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        n = 1
+        while closed.exists() or Path(str(closed) + ".gz").exists() or Path(str(closed) + ".zst").exists():
+            closed = self.path.with_name(f"{self.path.stem}-{stamp}.{n}{self.path.suffix}")
+            n += 1
+        os.replace(self.path, closed)
+        # indexed now, in rotation order; renamed in the index once compressed
+        self._append_index(_index_entry(closed.name, self._segment))
+        self._compress_later(closed)
+        self.rotations += 1
+        self._open()
+
+    def _compress_later(self, closed: Path):
+        if not self.compression:
+            return
+        t = threading.Thread(target=self._compress_segment, args=(closed,), name="log-compress", daemon=True)
+        t.start()
+        self._compressors = [c for c in self._compressors if c.is_alive()] + [t]
+
+    def _compress_segment(self, closed: Path):
+        """Compress a closed segment (off the writer thread), then point its
+        index entry at the compressed file; the plain one goes last."""
+        final = Path(str(closed) + (".zst" if self.compression == "zstd" else ".gz"))
+        try:
+            if self.compression == "zstd":
+                with closed.open("rb") as src, final.open("wb") as dst:
+                    zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+            else:
+                with closed.open("rb") as src, gzip.open(final, "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+        except OSError:
+            return  # stays indexed uncompressed, retried at the next start
+        self._rename_in_index(closed.name, final.name)
+        try:
+            closed.unlink()
+        except OSError:
+            pass
+
+    def _append_index(self, entry: dict):
+        with self._index_lock, self.index_path.open("a", encoding="utf-8") as idx:
+            idx.write(json.dumps(entry) + "\n")
+
+    def _rename_in_index(self, old: str, new: str):
+        with self._index_lock:
+            entries = read_index(self.path)
+            for entry in entries:
+                if entry.get("segment") == old:
+                    entry["segment"] = new
+            tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+            with tmp.open("w", encoding="utf-8") as idx:
+                idx.writelines(json.dumps(e) + "\n" for e in entries)
+            os.replace(tmp, self.index_path)
+
+    def _recover_segments(self):
+        """Closed segments a crash left behind: indexed if they aren't, and
+        compressed; a plain copy whose compressed file is indexed is removed."""
+        indexed = {e.get("segment") for e in read_index(self.path)}
+        for closed in sorted(self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}")):
+            if any(closed.name + ext in indexed for ext in (".gz", ".zst")):
+                closed.unlink()  # crashed between the index update and the unlink
+                continue
+            if closed.name not in indexed:
+                segment = _Segment(closed.stat().st_mtime)
+                with closed.open("r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        try:
+                            segment.add(json.loads(line))
+                        except ValueError:
+                            continue
+                self._append_index(_index_entry(closed.name, segment))
+            self._compress_later(closed)
+
+    def _write_batch(self, batch):
+        now = time.time()
+        if self._should_rotate(now):
+            self._rotate()
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch)
+        self._f.write(data)
+        self._f.flush()
+        self._size += len(data.encode("utf-8"))
+        for e in batch:
+            self._segment.add(e)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _attempt(self, action, *args) -> bool:
+        """Run one step of the writer; on error reopen the file and try once
+        more. False if it failed both times."""
+        for _ in range(2):
+            try:
+                action(*args)
+                return True
+            except Exception as e:
+                self.write_errors += 1
+                log.warning("event log %s failed on %s: %r", action.__name__.strip("_"), self.path, e)
+                self._reopen()
+        return False
+
+    def _reopen(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except Exception:
+                pass  # the buffered tail is lost with the batch
+        try:
+            self._open()
+        except Exception as e:
+            log.warning("event log %s can't be reopened: %r", self.path, e)
+
+    def _lost(self, batch, dropped):
+        """Count a batch that couldn't be written as dropped; its own
+        log_dropped entry is reported again with the next one."""
+        with self._lock:
+            self.dropped += len(batch) - (1 if dropped else 0)
+            if dropped:
+                self._dropped_reported -= dropped["count"]
+
+    def _run(self):
+        self._attempt(self._open)
+        last_fsync = time.monotonic()
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    first = None
+                if first is _STOP:
+                    break
+
+                oldest, self._oldest = self._oldest, None
+                batch, stop = self._drain(first) if first is not None else ([], False)
+                dropped = self._dropped_entry()
+                if dropped:
+                    batch.append(dropped)
+
+                if batch:
+                    with WRITE_BATCH.time():
+                        ok = self._attempt(self._write_batch, batch)
+                    if not ok:
+                        self._lost(batch, dropped)
+                        time.sleep(RETRY_DELAY)
+                    elif oldest is not None:
+                        self.last_lag = time.monotonic() - oldest
+                        WRITE_LAG.observe(self.last_lag)
+                elif self._should_rotate(time.time()):
+                    # idle over a period boundary: still close the segment
+                    self._attempt(self._rotate)
+
+                now = time.monotonic()
+                if now - last_fsync >= self.fsync_interval:
+                    self._attempt(self._sync)
+                    last_fsync = now
+                if stop:
+                    break
+
+            # drain whatever arrived after the stop marker
+            rest = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    rest.append(item)
+            if rest and not self._attempt(self._write_batch, rest):
+                self._lost(rest, None)
+            self._attempt(self._flush)
+        finally:
+            if self._f is not None:
+                try:
+                    self._f.close()
+                except Exception:
+                    pass
+
+    def _flush(self):
+        self._f.flush()
+        self._sync()
+
+    def _sync(self):
+        os.fsync(self._f.fileno())
+
+
+class PipeWriter(EventLogWriter):
+    """Same queue and batching, but the events go to a pipe: a worker of the
+    multi-process mode (supervisor.py), whose supervisor merges every
+    worker's pipe into the one event log (rotation, index)."""
+
+    def __init__(self, fd: int, **kw):
+        super().__init__(Path(f"pipe-{fd}"), **kw)
+        self.fd = fd
+
+    def _open(self):
+        self._f = os.fdopen(self.fd, "w", encoding="utf-8")
+
+    def _should_rotate(self, now: float) -> bool:
+        return False
+
+    def _sync(self):
+        pass
+
+    def _reopen(self):
+        pass  # a pipe can't be reopened: the failed batch is just dropped
+
+    def _write_batch(self, batch):
+        try:
+            self._f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch))
+            self._f.flush()
+        except (OSError, ValueError):  # supervisor gone
+            with self._lock:
+                self.dropped += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+metrics.gauge("honeypot_log_queue_depth", "Events waiting for the log writer",
+              fn=lambda: _writer._queue.qsize() if _writer is not None else None)
+metrics.gauge("honeypot_log_dropped", "Events dropped because the writer queue was full",
+              fn=lambda: _writer.dropped if _writer is not None else None)
+
+
+def get_writer(path: Path) -> EventLogWriter:
+    """Process-wide writer for `path`, started on first use and closed at exit.
+
+    In a worker process (LOG_FD_ENV set by supervisor.py) events go to the
+    supervisor's pipe instead.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                fd = os.environ.get(LOG_FD_ENV)
+                _writer = (PipeWriter(int(fd)) if fd else EventLogWriter(path)).start()
+                atexit.register(_writer.close)
+    return _writer
+
+
+# =========================
+# READERS
+# =========================
+def open_segment(path: Path):
+    """Open a (possibly compressed) JSONL segment as text."""
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path.name}: install 'zstandard' to read zstd segments")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(path.open("rb")), encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def read_index(path: Path) -> list:
+    """Index entries for the event log at `path` (oldest first)."""
+    path = Path(path)
+    index_path = path.with_name(path.stem + ".index.jsonl")
+    if not index_path.exists():
+        return []
+    with index_path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def segment_path(path: Path, entry: dict) -> Path:
+    """File of an index entry; the compressed one if the entry still names
+    the plain file it was made from."""
+    seg = Path(path).with_name(entry["segment"])
+    if not seg.exists():
+        for ext in (".gz", ".zst"):
+            if Path(str(seg) + ext).exists():
+                return Path(str(seg) + ext)
+    return seg
+
+
+def find_segments(path: Path, since: str = None, until: str = None, sid: str = None) -> list:
+    """Segment files that may hold events in [since, until] (ISO ts) and/or for `sid`.
+
+    The active (not yet rotated) file is always included last since it is
+    not in the index yet.
+    """
+    path = Path(path)
+    out = []
+    for seg in read_index(path):
+        if since and seg.get("last_ts") and seg["last_ts"] < since:
+            continue
+        if until and seg.get("first_ts") and seg["first_ts"] > until:
+            continue
+        if sid and sid not in seg.get("sids", ()):
+            continue
+        out.append(segment_path(path, seg))
+    if path.exists():
+        out.append(path)
+    return out
+
+
+def iter_events(path: Path, since: str = None, until: str = None, sid: str = None):
+    """Yield events from the relevant segments only, filtered by ts / sid."""
+    for seg in find_segments(path, since, until, sid):
+        with open_segment(seg) as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue
+                ts = e.get("ts", "")
+                if since and ts < since:
+                    continue
+                if until and ts > until:
+                    continue
+                if sid and e.get("sid") != sid:
+                    continue
+                yield e
@@ -0,0 +1,427 @@
+"""
+Process metrics in the Prometheus text format, served on a local /metrics.
+
+Modules declare their metrics at import time and record on the hot path:
+
+    COMMANDS = metrics.counter("honeypot_commands_total", "Command lines run")
+    COMMANDS.inc()
+    LLM_SECONDS = metrics.histogram("honeypot_llm_seconds", "...", ("source",))
+    LLM_SECONDS.labels("model").observe(1.8)
+
+Recording is a lock + an addition (histograms: + a bisect over fixed
+buckets); nothing is formatted until a scrape. Values that already live
+elsewhere (queue depths, cache sizes) are gauges with a callback, read only
+when /metrics is requested.
+
+Percentiles come from the histogram buckets on the Prometheus side, e.g.
+`histogram_quantile(0.95, rate(honeypot_llm_seconds_bucket[5m]))`;
+`python metrics.py --url http://127.0.0.1:PORT/metrics` prints a quick
+summary (rates need two scrapes, see --interval) without a Prometheus server.
+"""
+import argparse
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = "127.0.0.1"   # local only: the honeypot's SSH port is the exposed one
+METRICS_PORT = 0             # off by default (--metrics-port); 9100 would clash with node_exporter
+
+# seconds; LLM answers take 0.1..30 s, local commands well under a millisecond
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+# =========================
+# METRIC TYPES
+# =========================
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child for these label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        """The unlabelled child, for metrics without labels."""
+        return self.labels()
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.expose(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self.value += n
+
+    def dec(self, n: float = 1):
+        with self._lock:
+            self.value -= n
+
+    def set(self, v: float):
+        self.value = v
+
+    def expose(self, name, labelnames, values):
+        return [f"{name}{_labels_text(labelnames, values)} {_num(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, n: float = 1):
+        self._default().inc(n)
+
+
+class Gauge(_Metric):
+    """A value set by the code, or read from `fn()` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, n: float = 1):
+        self._default().inc(n)
+
+    def dec(self, n: float = 1):
+        self._default().dec(n)
+
+    def set(self, v: float):
+        self._default().set(v)
+
+    def expose(self) -> list:
+        if self.fn is None:
+            return super().expose()
+        try:
+            v = self.fn()
+        except Exception:
+            return []  # the component isn't there (disabled, not started)
+        if v is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_num(v)}"]
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def expose(self, name, labelnames, values):
+        lines = []
+        with self._lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        acc = 0
+        for bound, c in zip(self.bounds + (float("inf"),), counts):
+            acc += c
+            le = 'le="' + _num(bound) + '"'
+            lines.append(f"{name}_bucket{_labels_text(labelnames, values, le)} {acc}")
+        lines.append(f"{name}_sum{_labels_text(labelnames, values)} {_num(total)}")
+        lines.append(f"{name}_count{_labels_text(labelnames, values)} {n}")
+        return lines
+
+
+class _Timer:
+    """`with HIST.time():` observes the block's duration in seconds."""
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, v: float):
+        self._default().observe(v)
+
+    def time(self):
+        return self._default().time()
+
+
+# =========================
+# REGISTRY
+# =========================
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name: str, *args, **kw):
+    """Get-or-create, so a module can be reloaded or imported twice."""
+    with _registry_lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, *args, **kw)
+        elif not isinstance(m, cls):
+            raise ValueError(f"metric {name} already registered as a {m.kind}")
+        return m
+
+
+def counter(name: str, help: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: tuple = (), fn=None) -> Gauge:
+    g = _register(Gauge, name, help, labelnames)
+    if fn is not None:
+        g.fn = fn
+    return g
+
+
+def histogram(name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labelnames, buckets)
+
+
+_sources = []
+
+
+def add_source(fn):
+    """Also expose what `fn()` returns, [(label text, exposition text)]: the
+    workers' own /metrics in the multi-process mode (supervisor.py)."""
+    _sources.append(fn)
+
+
+def exposition() -> str:
+    """All registered metrics in the Prometheus text format."""
+    with _registry_lock:
+        ms = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for m in ms:
+        lines.extend(m.expose())
+    text = "\n".join(lines) + "\n"
+    if not _sources:
+        return text
+    parts = [("", text)]
+    for fn in _sources:
+        try:
+            parts.extend(fn())
+        except Exception:
+            pass
+    return merge_expositions(parts)
+
+
+def merge_expositions(parts) -> str:
+    """Several expositions as one: a family seen in several parts gets one
+    HELP/TYPE and all the samples, each tagged with its part's labels."""
+    families = {}  # name -> (header lines, sample lines)
+    for extra, text in parts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith(("# HELP ", "# TYPE ")):
+                family = families.setdefault(line.split(" ", 3)[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+                continue
+            if not line or line.startswith("#") or family is None:
+                continue
+            if extra:
+                key, _, value = line.rpartition(" ")
+                key = key[:-1] + "," + extra + "}" if key.endswith("}") else key + "{" + extra + "}"
+                line = key + " " + value
+            family[1].append(line)
+    lines = []
+    for name in sorted(families):
+        lines.extend(families[name][0])
+        lines.extend(families[name][1])
+    return "\n".join(lines) + "\n"
+
+
+PROCESS_START = gauge("honeypot_start_time_seconds", "Unix time the process started")
+PROCESS_START.set(time.time())
+
+
+# =========================
+# HTTP ENDPOINT
+# =========================
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per scrape is noise
+
+
+def serve(host: str = METRICS_HOST, port: int | None = METRICS_PORT):
+    """Start the /metrics endpoint on a daemon thread; None if port is 0 or
+    can't be bound (logged).
+    port=None takes any free port (see server.server_address)."""
+    if port == 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port or 0), _Handler)
+    except OSError as e:
+        # no metrics is no reason to keep the sensor down
+        logging.getLogger("honeypot.metrics").warning("metrics endpoint %s:%s unavailable: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# =========================
+# CLI
+# =========================
+def parse_exposition(text: str) -> dict:
+    """{(name, labels text): value} for the sample lines."""
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.rpartition(" ")
+        name, _, labels = key.partition("{")
+        out[(name, labels.rstrip("}"))] = float(value)
+    return out
+
+
+def bucket_quantile(samples: dict, name: str, q: float, labels: str = "") -> float | None:
+    """histogram_quantile() over one scrape (since process start)."""
+    buckets = []
+    for (n, lab), v in samples.items():
+        if n != name + "_bucket":
+            continue
+        parts = dict(p.split("=", 1) for p in lab.split(",") if "=" in p)
+        le = parts.pop("le").strip('"')
+        rest = ",".join(f"{k}={v2}" for k, v2 in parts.items())
+        if rest == labels:
+            buckets.append((float("inf") if le == "+Inf" else float(le), v))
+    buckets.sort()
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_bound, prev_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return prev_bound
+            return prev_bound + (bound - prev_bound) * ((rank - prev_count) / max(count - prev_count, 1e-9))
+        prev_bound, prev_count = bound, count
+    return None
+
+
+def main():
+    from urllib.request import urlopen
+
+    parser = argparse.ArgumentParser(description="Summarize a running honeypot's /metrics.")
+    parser.add_argument("--url", required=True, help="the honeypot's endpoint, e.g. http://127.0.0.1:9180/metrics")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between the two scrapes used for rates")
+    args = parser.parse_args()
+
+    def scrape():
+        with urlopen(args.url, timeout=5) as r:
+            return parse_exposition(r.read().decode("utf-8"))
+
+    a = scrape()
+    time.sleep(args.interval)
+    b = scrape()
+
+    def rate(key):
+        return (b.get(key, 0.0) - a.get(key, 0.0)) / args.interval
+
+    routes = {lab.split('"')[1]: v for (n, lab), v in b.items() if n == "honeypot_routes_total"}
+    total_routes = sum(routes.values())
+    print(f"active sessions   {b.get(('honeypot_sessions_active', ''), 0):.0f}")
+    print(f"commands/s        {rate(('honeypot_commands_total', '')):.2f}")
+    print("routes            " + (", ".join(f"{k} {v / total_routes:.1%}" for k, v in sorted(routes.items()))
+                                  if total_routes else "-"))
+    for source in ("model", "cache", "corpus"):
+        lab = f'source="{source}"'
+        if not b.get(("honeypot_llm_seconds_count", lab)):
+            continue
+        p50, p95, p99 = (bucket_quantile(b, "honeypot_llm_seconds", q, lab) for q in (0.5, 0.95, 0.99))
+        print(f"llm {source:<13} p50 {p50 * 1000:.0f} ms  p95 {p95 * 1000:.0f} ms  p99 {p99 * 1000:.0f} ms "
+              f"({b[('honeypot_llm_seconds_count', lab)]:.0f})")
+    lag = bucket_quantile(b, "honeypot_log_write_lag_seconds", 0.95)
+    if lag is not None:
+        print(f"log write lag p95 {lag * 1000:.0f} ms, queued {b.get(('honeypot_log_queue_depth', ''), 0):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Command routing: one table decides where each command goes.
+
+Every stage of a line (see shell.py) is tokenized once and its command name
+looked up in a RoutingTable compiled at startup:
+
+    local   native emulation (commands.py), falls back to the LLM when the
+            handler can't answer
+    canned  fixed output from the routing file, no model involved
+    deny    fast failure (`bash: curl: command not found` by default);
+            only for the names a routing file lists, nothing is denied by
+            default: a box without sed or bash gives the honeypot away
+    llm     everything else
+
+Names are matched on their basename (`/usr/bin/wget` is `wget`). Exact names
+are a dict lookup; glob entries (`python*`) are merged into one precompiled
+regex that is only tried on a miss, and its answers are memoized. Exact names
+win over globs.
+
+A deployment can override the defaults with a JSON file (`--routes`):
+
+    {
+      "deny": ["curl", "wget", "python*"],
+      "llm": ["ps"],
+      "canned": {"sudo": {"stderr": "{user} is not in the sudoers file.  This incident will be reported.\\n",
+                          "exit_code": 1}},
+      "deny_message": "bash: {name}: command not found\\n"
+    }
+
+A canned entry has "output" (stdout), "stderr" and "exit_code"; a plain
+string is its output. The deny_message goes to stderr. Canned texts and
+deny_message may use {name}, {user}, {hostname}, {cwd}, {home} and {ip}.
+"""
+import fnmatch
+import json
+import re
+import threading
+from pathlib import Path
+
+import commands
+from commands import QUOTE_ERROR, is_assignment, run_argv, split_command
+from fs_engine import SessionState
+
+LOCAL = "local"
+CANNED = "canned"
+DENY = "deny"
+LLM = "llm"
+ROUTES = (LOCAL, CANNED, DENY, LLM)
+
+# Too long or too complex to fake well. Still sent to the model by default;
+# a deployment that would rather fail fast lists them under "deny" in its
+# routing file (exit DENY_EXIT_CODE with DENY_MESSAGE)
+COMMAND_BLACKLIST = [
+    "curl", "wget", "nc", "ncat", "socat", "telnet",  # Network tools
+    "sed", "awk", "perl", "python", "ruby", "bash",   # Interpreters/scripting
+    "find", "locate", "updatedb",                      # Search tools
+    "tar", "gzip", "bzip2", "zip", "unzip",           # Compression
+    "gcc", "g++", "make", "cmake",                     # Compilation
+    "docker", "kubectl", "systemctl", "journalctl",   # System admin
+    "ssh", "scp", "rsync",                             # Remote tools
+    "nm", "objdump", "strings",                        # Binary analysis
+]
+DENY_MESSAGE = "bash: {name}: command not found\n"
+DENY_EXIT_CODE = 127
+
+PATTERN_MEMO_MAX = 4096  # glob lookups remembered per table (names are attacker-chosen)
+
+
+class Decision:
+    """Where one command went, and what it answered."""
+    __slots__ = ("name", "argv", "route", "output", "exit_code", "error")
+
+    def __init__(self, name: str, argv: list, route: str, output: str = None, exit_code: int = None,
+                 error: str = ""):
+        self.name = name
+        self.argv = argv
+        self.route = route
+        self.output = output
+        self.exit_code = exit_code
+        self.error = error  # stderr of a canned or denied command
+
+    def __repr__(self):
+        return f"Decision({self.name!r}, {self.route})"
+
+
+class RoutingTable:
+    def __init__(self, routes: dict, canned: dict = None, deny_message: str = DENY_MESSAGE,
+                 deny_exit_code: int = DENY_EXIT_CODE):
+        """`routes` maps names or globs to a route, later globs win; exact
+        names always win over globs."""
+        self.canned = {}
+        for name, spec in (canned or {}).items():
+            if isinstance(spec, str):
+                spec = {"output": spec}
+            self.canned[name] = (spec.get("output", ""), int(spec.get("exit_code", 0)), spec.get("stderr", ""))
+        self.deny_message = deny_message
+        self.deny_exit_code = deny_exit_code
+
+        self.exact = {}
+        globs = []
+        for name, where in routes.items():
+            if where not in ROUTES:
+                raise ValueError(f"unknown route {where!r} for {name!r}")
+            if any(c in name for c in "*?["):
+                globs.append((name, where))
+            else:
+                self.exact[name] = where
+        self._glob_re = None
+        self._glob_hits = {}
+        if globs:
+            parts = []
+            for i, (name, where) in enumerate(globs):
+                parts.append(f"(?P<g{i}>{fnmatch.translate(name)})")
+                self._glob_hits[f"g{i}"] = (where, name)
+            self._glob_re = re.compile("|".join(reversed(parts)))
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    def lookup(self, name: str) -> tuple[str, str]:
+        """(route, key): key is the table entry that matched, for canned output."""
+        where = self.exact.get(name)
+        if where is not None:
+            return where, name
+        if self._glob_re is None:
+            return LLM, name
+        hit = self._memo.get(name)
+        if hit is None:
+            m = self._glob_re.match(name)
+            hit = self._glob_hits[m.lastgroup] if m else (LLM, name)
+            with self._memo_lock:
+                if len(self._memo) >= PATTERN_MEMO_MAX:
+                    self._memo.clear()
+                self._memo[name] = hit
+        return hit
+
+
+def default_table(overrides: dict = None) -> RoutingTable:
+    """Native commands are local, the rest goes to the LLM; `overrides` (the
+    content of a routing file) is applied on top, llm entries last."""
+    overrides = overrides or {}
+    canned = overrides.get("canned", {})
+    routes = dict.fromkeys(commands.COMMANDS, LOCAL)
+    for where in (LOCAL, DENY):
+        for name in overrides.get(where, []):
+            routes.pop(name, None)  # re-insert: later globs win
+            routes[name] = where
+    for name in canned:
+        routes.pop(name, None)
+        routes[name] = CANNED
+    for name in overrides.get(LLM, []):
+        routes.pop(name, None)
+        routes[name] = LLM
+    return RoutingTable(
+        routes,
+        canned=canned,
+        deny_message=overrides.get("deny_message", DENY_MESSAGE),
+        deny_exit_code=int(overrides.get("deny_exit_code", DENY_EXIT_CODE)),
+    )
+
+
+def load_routes(path) -> RoutingTable:
+    with Path(path).open("r", encoding="utf-8") as f:
+        return default_table(json.load(f))
+
+
+TABLE = default_table()
+
+
+def configure(path=None) -> RoutingTable:
+    """Install the routing table (defaults, or defaults + the file at `path`)."""
+    global TABLE
+    TABLE = load_routes(path) if path else default_table()
+    return TABLE
+
+
+def _fill(st: SessionState, template: str, name: str) -> str:
+    fields = {"name": name, "user": st.user, "hostname": st.hostname, "cwd": st.cwd,
+              "home": st.home, "ip": st.fake_ip}
+    for k, v in fields.items():
+        template = template.replace("{" + k + "}", v)
+    return template
+
+
+# =========================
+# ROUTE + DISPATCH
+# =========================
+def route(st: SessionState, line: str, table: RoutingTable = None) -> Decision:
+    """Tokenize a single command once and pick its route."""
+    table = table or TABLE
+    try:
+        argv = split_command(st, line)
+    except ValueError:
+        return Decision("<syntax>", None, LOCAL, "", 2, QUOTE_ERROR)
+    if not argv:
+        return Decision("", argv, LOCAL)
+    name = argv[0].rsplit("/", 1)[-1] if "/" in argv[0] else argv[0]
+    where, key = table.lookup(name)
+    if where == CANNED:
+        output, code, error = table.canned[key]
+        return Decision(name, argv, CANNED, _fill(st, output, name), code, _fill(st, error, name))
+    if where == DENY:
+        return Decision(name, argv, DENY, "", table.deny_exit_code, _fill(st, table.deny_message, name))
+    if where == LOCAL or is_assignment(argv):
+        return Decision(name, argv, LOCAL)
+    return Decision(name, argv, LLM)
+
+
+def dispatch(st: SessionState, d: Decision, stdin: str = None) -> tuple[str | None, int | None, str]:
+    """Answer a Decision without the model: (stdout, exit code, stderr);
+    (None, None, "") leaves it to the LLM (and turns a local miss into an
+    LLM route)."""
+    if d.output is not None:
+        if d.route in (CANNED, DENY):
+            commands.record(d.name, True)
+        return d.output, d.exit_code, d.error
+    if d.route != LOCAL:
+        commands.record("<other>", False)
+        return None, None, ""
+    if d.argv and d.argv[0] != d.name and "/" in d.argv[0]:
+        d.argv = [d.name] + d.argv[1:]  # /bin/ls -> ls for the handler lookup
+    out, code, err = run_argv(st, d.argv, stdin)
+    if out is None:
+        d.route = LLM
+    return out, code, err
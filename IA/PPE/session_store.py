@@ -0,0 +1,253 @@
+"""
+Session persistence: what the attacker changed, not the whole filesystem.
+
+A session's FS is a LayeredFS over the shared base image (fs_engine.py), so
+its state is fully described by the overlay: the nodes it created or
+modified (`upper`) and the base paths it deleted (`whiteouts`). That diff,
+the new history lines and a few metadata fields make one record.
+
+Records go to `logs/sessions/<sid>.jsonl.gz`, one gzip member per record
+(gzip readers see a single JSON-lines stream):
+
+    {"kind": "checkpoint", "ts", "sid", "user", "hostname", "cwd",
+     "history": [...new commands...], "history_len", "fs": {"upper": {...}, "whiteouts": [...]}}
+    ...
+    {"kind": "final", ...}
+
+`fs` is the complete diff at that point (small: it grows with what the
+attacker writes), `history` only what was typed since the previous record.
+A checkpoint is taken every CHECKPOINT_COMMANDS commands or CHECKPOINT_INTERVAL
+seconds, so a crash loses at most that much.
+
+The session thread only snapshots the overlay (a dict copy of the touched
+nodes); JSON encoding, compression and disk I/O happen on a writer thread
+behind a bounded queue, as for the event log (log_writer.py).
+
+load_session() merges the records back; `python session_store.py <file>`
+prints the result.
+"""
+import argparse
+import atexit
+import gzip
+import json
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+from fs_engine import SessionState, split_path
+from utils import LOG_DIR, utc_now
+
+SESSIONS_DIR = LOG_DIR / "sessions"
+CHECKPOINT_COMMANDS = 20     # commands between two mid-session checkpoints
+CHECKPOINT_INTERVAL = 60.0   # seconds between two mid-session checkpoints
+QUEUE_SIZE = 1000            # records waiting for the writer before we drop
+COMPRESS_LEVEL = 6
+
+_STOP = object()
+
+
+def fs_diff(st: SessionState) -> dict:
+    """The session's changes against the base image (JSON serializable)."""
+    fs = st.fs
+    # a deleted directory whites out everything below it: keep the top paths only
+    whiteouts = sorted(p for p in fs.whiteouts if split_path(p)[0] not in fs.whiteouts)
+    return {"upper": {p: n.to_dict() for p, n in fs.upper.items()}, "whiteouts": whiteouts}
+
+
+class _Progress:
+    """What the store already wrote for one session."""
+    __slots__ = ("history_len", "fs_version", "commands", "at")
+
+    def __init__(self):
+        self.history_len = 0  # SessionState.commands_added at the last record
+        self.fs_version = -1
+        self.commands = 0
+        self.at = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self, directory: Path = SESSIONS_DIR, queue_size: int = QUEUE_SIZE,
+                 checkpoint_commands: int = CHECKPOINT_COMMANDS, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.directory = Path(directory)
+        self.checkpoint_commands = checkpoint_commands
+        self.checkpoint_interval = checkpoint_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self.records = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def path_for(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.jsonl.gz"
+
+    # --- session side ------------------------------------------------------
+
+    def after_command(self, st: SessionState, session_id: str) -> bool:
+        """Checkpoint if enough commands or time went by; True if one was queued."""
+        with self._lock:
+            prog = self._progress.setdefault(session_id, _Progress())
+            prog.commands += 1
+            due = (prog.commands >= self.checkpoint_commands
+                   or time.monotonic() - prog.at >= self.checkpoint_interval)
+        return self.checkpoint(st, session_id) if due else False
+
+    def checkpoint(self, st: SessionState, session_id: str, kind: str = "checkpoint", on_done=None) -> bool:
+        """Snapshot now, write later. Nothing is queued for an unchanged
+        session, except the final record."""
+        with self._lock:
+            prog = self._progress.setdefault(session_id, _Progress())
+            new = st.commands_added - prog.history_len
+            unchanged = new == 0 and prog.fs_version == st.fs.version
+            if unchanged and kind != "final":
+                prog.commands, prog.at = 0, time.monotonic()
+                return False
+            record = {
+                "kind": kind,
+                "ts": utc_now(),
+                "sid": session_id,
+                "user": st.user,
+                "hostname": st.hostname,
+                "cwd": st.cwd,
+                "remote_ip": st.remote_ip,
+                # the tail of the capped history; what `history -c` cleared before a record is gone
+                "history": st.history[-new:] if new else [],
+                "history_len": st.commands_added,
+                "fs": fs_diff(st),
+            }
+            if kind == "final":
+                self._progress.pop(session_id, None)
+            try:
+                self._queue.put_nowait((self.path_for(session_id), record, on_done))
+            except queue.Full:
+                # progress stays put: the next checkpoint sends these lines again
+                self.dropped += 1
+                return False
+            prog.history_len, prog.fs_version = st.commands_added, st.fs.version
+            prog.commands, prog.at = 0, time.monotonic()
+            return True
+
+    def finish(self, st: SessionState, session_id: str, on_done=None) -> bool:
+        """Final record at session end; `on_done(path, error)` runs on the writer thread."""
+        return self.checkpoint(st, session_id, "final", on_done)
+
+    # --- writer thread -----------------------------------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            self._write(*item)
+
+    def _write(self, path: Path, record: dict, on_done):
+        error = None
+        try:
+            data = gzip.compress((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                                 .encode("utf-8"), COMPRESS_LEVEL)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("ab") as f:
+                f.write(data)
+            self.records += 1
+            self.bytes += len(data)
+        except Exception as e:
+            self.failed += 1
+            error = e
+        if on_done is not None:
+            try:
+                on_done(path, error)
+            except Exception:
+                pass
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued and stop the writer thread."""
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "records": self.records,
+            "bytes": self.bytes,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "open_sessions": len(self._progress),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> SessionStore:
+    """Process-wide store, started on first use and flushed at exit."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore().start()
+                atexit.register(_store.close)
+    return _store
+
+
+# =========================
+# READERS
+# =========================
+def load_session(path: Path) -> dict:
+    """Records of one session file merged: the last record's state, the
+    whole history, and whether the session ended cleanly."""
+    path = Path(path)
+    if path.suffix == ".json":  # former full dumps
+        with path.open("r", encoding="utf-8") as f:
+            dump = json.load(f)
+        dump.setdefault("complete", True)
+        return dump
+    merged, history = {}, []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                history.extend(record.pop("history", []))
+                merged.update(record)
+        except (EOFError, OSError):
+            pass  # crashed mid-write: keep the complete records
+    merged["history"] = history
+    merged["complete"] = merged.get("kind") == "final"
+    return merged
+
+
+def iter_sessions(directory: Path = SESSIONS_DIR):
+    """load_session() for every session file (new and former format)."""
+    directory = Path(directory)
+    for path in sorted(directory.glob("*.jsonl.gz")) + sorted(directory.glob("*.json")):
+        try:
+            yield load_session(path)
+        except (OSError, ValueError):
+            continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a saved session (history + FS diff).")
+    parser.add_argument("path", help="logs/sessions/<sid>.jsonl.gz")
+    args = parser.parse_args()
+    json.dump(load_session(Path(args.path)), sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Shell front end: operators, pipes and redirects in front of the emulators.
+
+A line is split (respecting quotes and backslashes) into pipelines joined by
+`;`, `&`, `&&` and `||`, each pipeline into stages joined by `|`, and each
+stage into its words and redirects (`>`, `>>`, `<`, `2>`, `2>&1`, `&>`).
+Each stage is routed once (routing.py: local emulator, canned answer, deny
+or LLM) and run with the previous stage's output as stdin, exit codes drive `&&` / `||` (and `$?`), and redirects read and write
+the session's virtual FS.
+
+Only what the emulators can't answer goes to the LLM: a single command, the
+whole pipeline when one of its stages is unknown (the model has to see the
+pipe to answer it), or the whole line for constructs we don't model
+(command substitution, loops, here-docs).
+
+execute() is a generator so both server modes can drive it: it yields an
+LLMRequest whenever the model is needed and is sent back (output, exit_code).
+run_sync() is the blocking driver.
+"""
+import re
+import threading
+import time
+
+from commands import expand_vars
+from fs_engine import SessionState, fs_exists, fs_is_dir, fs_read_file, fs_write_file, norm_path, split_path
+from routing import LLM, dispatch, route
+
+# constructs left to the LLM as a whole line
+_WHOLE_LINE_RE = re.compile(r"\$\(|`|<<|<\(|>\(")
+_WHOLE_LINE_WORDS = {"for", "while", "until", "if", "case", "function", "select", "{", "(", "[[", "(("}
+
+_OP_RE = re.compile(r"(\d?)(>>|>&|>|<)|&>|&&|\|\||[|;&]")
+_WORD_END = " \t|;&<>"
+
+
+class ShellSyntaxError(ValueError):
+    pass
+
+
+class Redirect:
+    __slots__ = ("fd", "op", "target")
+
+    def __init__(self, fd: int, op: str, target: str):
+        self.fd = fd          # 0 stdin, 1 stdout, 2 stderr, -1 both (&>)
+        self.op = op          # "<", ">", ">>" or ">&" (target is then a fd number)
+        self.target = target
+
+    def __repr__(self):
+        return f"Redirect({self.fd}{self.op}{self.target})"
+
+
+class Stage:
+    __slots__ = ("text", "redirects")
+
+    def __init__(self, text: str, redirects: list):
+        self.text = text            # the command as typed, redirects removed
+        self.redirects = redirects
+
+    def __repr__(self):
+        return f"Stage({self.text!r}, {self.redirects})"
+
+
+class Pipeline:
+    __slots__ = ("stages", "connector")
+
+    def __init__(self, stages: list, connector: str = None):
+        self.stages = stages
+        self.connector = connector  # operator before this pipeline, None for the first
+
+    @property
+    def text(self) -> str:
+        return " | ".join(s.text for s in self.stages)
+
+    def __repr__(self):
+        return f"Pipeline({self.connector!r}, {self.stages})"
+
+
+class LLMRequest:
+    __slots__ = ("cmd", "to_terminal", "argv")
+
+    def __init__(self, cmd: str, to_terminal: bool = True, argv: list = None):
+        self.cmd = cmd
+        self.argv = argv  # already split, when `cmd` is a single command
+        # the answer goes straight to the client: the driver may stream it and
+        # must make sure it gets written, the executor won't write it again
+        self.to_terminal = to_terminal
+
+
+# =========================
+# PARSER
+# =========================
+def tokenize(line: str):
+    """Yield (kind, value, raw): kind is "word", "op" or "redir"; a word's
+    value has its quotes removed, raw is the text as typed."""
+    i, n = 0, len(line)
+    while i < n:
+        if line[i] in " \t":
+            i += 1
+            continue
+        if line[i] == "#":
+            return
+        m = _OP_RE.match(line, i)
+        if m:
+            tok = m.group(0)
+            i = m.end()
+            yield ("op" if tok in ("|", "||", "&&", ";", "&") else "redir"), tok, tok
+            continue
+        start, word = i, []
+        while i < n and line[i] not in _WORD_END:
+            c = line[i]
+            if c == "\\" and i + 1 < n:
+                word.append(line[i + 1])
+                i += 2
+            elif c == "'":
+                j = line.find("'", i + 1)
+                if j < 0:
+                    raise ShellSyntaxError("unexpected EOF while looking for matching `''")
+                word.append(line[i + 1:j])
+                i = j + 1
+            elif c == '"':
+                j = i + 1
+                while j < n and line[j] != '"':
+                    j += 2 if line[j] == "\\" else 1
+                if j >= n:
+                    raise ShellSyntaxError("unexpected EOF while looking for matching `\"'")
+                word.append(line[i + 1:j])
+                i = j + 1
+            else:
+                word.append(c)
+                i += 1
+        yield "word", "".join(word), line[start:i]
+
+
+def _redirect(tok: str, target: str) -> Redirect:
+    if tok == "&>":
+        return Redirect(-1, ">", target)
+    fd, op = _OP_RE.fullmatch(tok).groups()
+    return Redirect(int(fd) if fd else (0 if op == "<" else 1), op, target)
+
+
+def parse(line: str) -> list:
+    """Line -> [Pipeline]; ShellSyntaxError where bash would complain."""
+    pipelines, stages = [], []
+    words, redirects = [], []
+    connector, pending = None, None
+
+    def end_stage(tok):
+        if not words and not redirects:
+            raise ShellSyntaxError(f"syntax error near unexpected token `{tok}'")
+        stages.append(Stage(" ".join(words), list(redirects)))
+        words.clear()
+        redirects.clear()
+
+    for kind, value, raw in tokenize(line):
+        if pending is not None:
+            if kind != "word":
+                raise ShellSyntaxError(f"syntax error near unexpected token `{value}'")
+            redirects.append(_redirect(pending, value))
+            pending = None
+        elif kind == "word":
+            words.append(raw)
+        elif kind == "redir":
+            pending = value
+        elif value == "|":
+            end_stage(value)
+        else:
+            end_stage(value)
+            pipelines.append(Pipeline(stages, connector))
+            stages, connector = [], value
+    if pending is not None:
+        raise ShellSyntaxError("syntax error near unexpected token `newline'")
+    if words or redirects:
+        end_stage("newline")
+    if stages:
+        pipelines.append(Pipeline(stages, connector))
+    elif connector in ("&&", "||"):
+        raise ShellSyntaxError("syntax error: unexpected end of file")
+    return pipelines
+
+
+def needs_whole_line(line: str) -> bool:
+    """Constructs we don't model: the LLM gets the line as typed."""
+    unquoted = re.sub(r"'[^']*'", "''", line)
+    if _WHOLE_LINE_RE.search(unquoted):
+        return True
+    words = unquoted.split(None, 1)
+    return bool(words) and (words[0] in _WHOLE_LINE_WORDS or words[0].startswith("("))
+
+
+# =========================
+# STATS
+# =========================
+_stats_lock = threading.Lock()
+_stats = {"lines": 0, "local_lines": 0, "stages": 0, "local_stages": 0, "llm_calls": 0}
+
+
+def _count(**kw):
+    with _stats_lock:
+        for k, v in kw.items():
+            _stats[k] += v
+
+
+def line_stats() -> dict:
+    """Lines answered without any LLM call, and LLM calls per line."""
+    with _stats_lock:
+        s = dict(_stats)
+    s["local_line_rate"] = round(s["local_lines"] / s["lines"], 4) if s["lines"] else 0.0
+    s["llm_calls_per_line"] = round(s["llm_calls"] / s["lines"], 4) if s["lines"] else 0.0
+    return s
+
+
+# =========================
+# REDIRECTS
+# =========================
+def _write_target(st: SessionState, target: str, text: str, append: bool):
+    """`> target` / `>> target`; returns bash's error message or None."""
+    if target == "/dev/null":
+        return None
+    target = expand_vars(st, target)
+    path = norm_path(st, target)
+    if fs_is_dir(st, path):
+        return f"bash: {target}: Is a directory\n"
+    if not fs_is_dir(st, split_path(path)[0]):
+        return f"bash: {target}: No such file or directory\n"
+    if append and fs_exists(st, path):
+        text = (fs_read_file(st, path) or "") + text
+    ok, err = fs_write_file(st, path, text)
+    return None if ok else f"bash: {target}: {err}\n"
+
+
+def _stdin_for(st: SessionState, stage: Stage, piped: str):
+    """(stdin, error): `< file` replaces the pipe."""
+    for r in stage.redirects:
+        if r.op == "<":
+            if r.target == "/dev/null":
+                piped = ""
+                continue
+            target = expand_vars(st, r.target)
+            path = norm_path(st, target)
+            if not fs_exists(st, path):
+                return None, f"bash: {target}: No such file or directory\n"
+            if fs_is_dir(st, path):
+                return None, f"bash: {target}: Is a directory\n"
+            piped = fs_read_file(st, path) or ""
+    return piped, None
+
+
+def _route(st: SessionState, redirects: list, out: str, err: str, emit) -> tuple:
+    """Apply output redirects: returns (stdout left for the pipe/terminal,
+    failed). stderr that isn't redirected goes to the terminal right away."""
+    failed = False
+    for r in redirects:
+        if r.op == ">&":
+            if r.fd == 2 and r.target == "1":
+                out, err = out + err, ""
+            elif r.fd == 1 and r.target == "2":
+                out, err = "", err + out
+            continue
+        if r.op not in (">", ">>"):
+            continue
+        if r.fd == -1:
+            text, out, err = out + err, "", ""
+        elif r.fd == 1:
+            text, out = out, ""
+        elif r.fd == 2:
+            text, err = err, ""
+        else:
+            continue
+        problem = _write_target(st, r.target, text, r.op == ">>")
+        if problem:
+            emit(problem)
+            failed = True
+    emit(err)
+    return out, failed
+
+
+def _stdout_redirected(stage: Stage) -> bool:
+    return any(r.op in (">", ">>") and r.fd in (1, -1) for r in stage.redirects)
+
+
+# =========================
+# EXECUTOR
+# =========================
+def execute(st: SessionState, line: str, write):
+    """Run `line`, sending terminal output to `write` as it is produced.
+
+    Generator: yields LLMRequest, expects (output, exit_code) back, returns
+    (all terminal output, exit code of the last pipeline).
+    """
+    shown = []
+    st.exited = False
+    st.routes = []
+
+    def emit(text: str):
+        if text:
+            shown.append(text)
+            write(text)
+
+    if needs_whole_line(line):
+        st.routes.append({"cmd": "<line>", "route": LLM, "ms": 0.0})
+        out, code = yield LLMRequest(expand_vars(st, line))
+        shown.append(out)
+        st.last_exit = code
+        _count(lines=1, stages=1, llm_calls=1)
+        return "".join(shown), code
+
+    try:
+        pipelines = parse(line)
+    except ShellSyntaxError as e:
+        emit(f"bash: {e}\n")
+        st.last_exit = 2
+        _count(lines=1, local_lines=1)
+        return "".join(shown), 2
+
+    code = st.last_exit
+    stages_run = local_stages = llm_calls = 0
+    for pl in pipelines:
+        if (pl.connector == "&&" and code != 0) or (pl.connector == "||" and code == 0):
+            continue
+        piped = None
+        last = pl.stages[-1]
+        for stage in pl.stages:
+            stages_run += 1
+            stdin, problem = _stdin_for(st, stage, piped)
+            if problem:
+                emit(problem)
+                code, piped = 1, ""
+                continue
+            t0 = time.perf_counter()
+            decision = route(st, stage.text)
+            out, code, err = dispatch(st, decision, stdin)
+            st.routes.append({"cmd": decision.name, "route": decision.route,
+                              "ms": round((time.perf_counter() - t0) * 1000, 3)})
+            if out is None:
+                # one unknown stage and the model answers for the whole pipe
+                to_terminal = not _stdout_redirected(last)
+                if len(pl.stages) > 1:
+                    req = LLMRequest(expand_vars(st, pl.text), to_terminal)
+                else:
+                    req = LLMRequest(expand_vars(st, stage.text), to_terminal, decision.argv)
+                out, code = yield req
+                llm_calls += 1
+                if to_terminal:
+                    shown.append(out)
+                    out = ""  # still create/truncate the other redirect targets
+                _, failed = _route(st, last.redirects, out, "", emit)
+                code = 1 if failed else code
+                break
+            local_stages += 1
+            stdout, failed = _route(st, stage.redirects, out, err, emit)
+            if failed:
+                code = 1
+            if stage is last:
+                emit(stdout)
+            piped = stdout
+            if st.exited:
+                break
+        st.last_exit = code
+        if st.exited:
+            break
+
+    _count(lines=1, local_lines=int(llm_calls == 0), stages=stages_run, local_stages=local_stages,
+           llm_calls=llm_calls)
+    return "".join(shown), code
+
+
+def run_sync(st: SessionState, line: str, write, llm) -> tuple[str, int]:
+    """Drive execute() with a blocking `llm(request) -> (output, exit_code)`."""
+    gen = execute(st, line, write)
+    try:
+        req = next(gen)
+        while True:
+            req = gen.send(llm(req))
+    except StopIteration as done:
+        return done.value
@@ -0,0 +1,225 @@
+"""
+What a connection costs before the shell: host keys, key exchange, auth.
+
+Most connections are credential-stuffing bots that never get a shell, so
+the handshake, not the emulation, is what pegs the CPU under a flood:
+
+- Host keys are loaded (or generated) once at startup. Ed25519 and ECDSA
+  signatures cost a fraction of a 2048-bit RSA one; every configured key is
+  offered and the client picks, so modern clients get the cheap one and old
+  ones still find RSA.
+- Fast mode (`--fast-handshake`) only offers the cheap key exchanges
+  (FAST_KEX: curve25519 / ECDH, group14 as the legacy fallback) and ciphers;
+  the 4096-bit DH of group16 is by far the most expensive thing a client can
+  ask for.
+- A connection is dropped after AUTH_MAX_ATTEMPTS failed passwords (OpenSSH's
+  MaxAuthTries), and its handler slot freed right away instead of waiting
+  for a channel that will never come.
+- In fast mode, an address that failed THROTTLE_FAILURES times within
+  THROTTLE_WINDOW seconds is turned away at accept() for THROTTLE_BLOCK
+  seconds: no key exchange at all.
+
+HoneypotTransport measures the CPU its own thread spends up to the first
+NEWKEYS (the key exchange) and in total, exported through metrics.py.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+import paramiko
+
+import metrics
+
+# key type -> file, next to the historical RSA key
+HOSTKEY_FILES = {
+    "ed25519": Path("hostkey_ed25519"),
+    "ecdsa": Path("hostkey_ecdsa"),
+    "rsa": Path("hostkey_rsa"),
+}
+HOSTKEY_TYPES = ("ed25519", "rsa")   # offered host keys; the first one the client supports is used
+
+# Fast mode: offered key exchanges and ciphers, cheapest first
+FAST_KEX = (
+    "curve25519-sha256", "curve25519-sha256@libssh.org",
+    "ecdh-sha2-nistp256",
+    "diffie-hellman-group14-sha256",   # old clients without elliptic curves
+)
+FAST_CIPHERS = ("aes128-gcm@openssh.com", "aes128-ctr", "aes256-gcm@openssh.com", "aes256-ctr")
+
+AUTH_MAX_ATTEMPTS = 6        # failed passwords before the connection is closed
+THROTTLE_FAILURES = 30       # failed passwords per address within THROTTLE_WINDOW ...
+THROTTLE_WINDOW = 60.0       # ... seconds
+THROTTLE_BLOCK = 120.0       # seconds the address is then refused at accept()
+
+HANDSHAKE_SECONDS = metrics.histogram("honeypot_handshake_seconds", "SSH negotiation wall time (until auth can start)")
+KEX_CPU = metrics.counter("honeypot_kex_cpu_seconds_total", "Transport thread CPU spent in the key exchange",
+                          ("host_key",))
+TRANSPORT_CPU = metrics.counter("honeypot_transport_cpu_seconds_total",
+                                "Transport thread CPU by how the connection ended", ("outcome",))
+REJECTED = metrics.counter("honeypot_connections_rejected_total", "Connections refused before the key exchange")
+
+
+# =========================
+# HOST KEYS
+# =========================
+def _generate(kind: str, path: Path):
+    if kind == "rsa":
+        paramiko.RSAKey.generate(2048).write_private_key_file(str(path))
+    elif kind == "ecdsa":
+        paramiko.ECDSAKey.generate(bits=256).write_private_key_file(str(path))
+    elif kind == "ed25519":
+        # paramiko can read Ed25519 keys but not create them
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+        pem = Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.OpenSSH, serialization.NoEncryption())
+        path.write_bytes(pem)
+        path.chmod(0o600)
+    else:
+        raise ValueError(f"unknown host key type {kind!r} (expected one of {', '.join(HOSTKEY_FILES)})")
+
+
+def _load(kind: str, path: Path) -> paramiko.PKey:
+    cls = {"rsa": paramiko.RSAKey, "ecdsa": paramiko.ECDSAKey, "ed25519": paramiko.Ed25519Key}[kind]
+    return cls(filename=str(path))
+
+
+def load_host_keys(types=HOSTKEY_TYPES) -> list:
+    """The configured host keys, generated on first use; load once, share
+    between all transports."""
+    keys = []
+    for kind in types:
+        if kind not in HOSTKEY_FILES:
+            raise ValueError(f"unknown host key type {kind!r} (expected one of {', '.join(HOSTKEY_FILES)})")
+        path = HOSTKEY_FILES[kind]
+        if not path.exists():
+            _generate(kind, path)
+        keys.append(_load(kind, path))
+    return keys
+
+
+# =========================
+# TRANSPORT
+# =========================
+def _disabled(offered: tuple, supported) -> list:
+    return [name for name in supported if name not in offered]
+
+
+class HoneypotTransport(paramiko.Transport):
+    """Transport that accounts for the CPU of its own thread: key exchange
+    (up to the first NEWKEYS) and total, by how far the client got. When the
+    thread ends it sets the server object's `wakeup` event, if it has one."""
+
+    def __init__(self, sock, host_keys: list, fast: bool = False):
+        disabled = {}
+        if fast:
+            disabled = {"kex": _disabled(FAST_KEX, self._preferred_kex),
+                        "ciphers": _disabled(FAST_CIPHERS, self._preferred_ciphers)}
+        super().__init__(sock, disabled_algorithms=disabled)
+        for key in host_keys:
+            self.add_server_key(key)
+        self.kex_cpu = None
+        self._cpu0 = 0.0
+
+    def run(self):
+        self._cpu0 = time.thread_time()
+        try:
+            super().run()
+        finally:
+            TRANSPORT_CPU.labels(self.outcome()).inc(time.thread_time() - self._cpu0)
+            wakeup = getattr(self.server_object, "wakeup", None)
+            if wakeup is not None:
+                wakeup.set()
+
+    def outcome(self) -> str:
+        if self.is_authenticated():
+            return "authenticated"
+        if getattr(self.server_object, "auth_failures", 0):
+            return "auth_failed"
+        return "no_auth"
+
+    def _activate_outbound(self):
+        super()._activate_outbound()
+        if self.kex_cpu is None:
+            self.kex_cpu = time.thread_time() - self._cpu0
+            KEX_CPU.labels(self.host_key_type or "unknown").inc(self.kex_cpu)
+
+    def start_server(self, event=None, server=None):
+        t0 = time.perf_counter()
+        super().start_server(event, server)
+        HANDSHAKE_SECONDS.observe(time.perf_counter() - t0)
+
+
+def async_kex_algs(fast: bool):
+    """FAST_KEX in asyncssh terms (() = asyncssh defaults)."""
+    if not fast:
+        return ()
+    from asyncssh.kex import get_kex_algs
+    supported = {alg.decode("ascii") for alg in get_kex_algs()}
+    return [name for name in FAST_KEX if name in supported]
+
+
+# =========================
+# AUTH THROTTLE
+# =========================
+class AuthThrottle:
+    """Per-address failed-password counter; an address over the limit is
+    refused at accept() for a while. Disabled when `failures` is 0."""
+
+    def __init__(self, failures: int = THROTTLE_FAILURES, window: float = THROTTLE_WINDOW,
+                 block: float = THROTTLE_BLOCK):
+        self.failures = failures
+        self.window = window
+        self.block = block
+        self._fails = defaultdict(deque)
+        self._blocked = {}
+        self._lock = threading.Lock()
+
+    def failed(self, ip: str) -> bool:
+        """Record a failed password; True if `ip` just got blocked."""
+        if not self.failures:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if len(self._fails) > 10000:
+                # forget addresses that stopped trying
+                self._fails = defaultdict(deque, {k: d for k, d in self._fails.items() if now - d[-1] <= self.window})
+            fails = self._fails[ip]
+            fails.append(now)
+            while fails and now - fails[0] > self.window:
+                fails.popleft()
+            if len(fails) < self.failures:
+                return False
+            del self._fails[ip]
+            self._blocked[ip] = now + self.block
+            if len(self._blocked) > 10000:
+                self._blocked = {k: t for k, t in self._blocked.items() if t > now}
+            return True
+
+    def allowed(self, ip: str) -> bool:
+        """Cheap check before the key exchange."""
+        until = self._blocked.get(ip)
+        if until is None:
+            return True
+        if time.monotonic() >= until:
+            with self._lock:
+                self._blocked.pop(ip, None)
+            return True
+        REJECTED.inc()
+        return False
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._fails), "blocked": len(self._blocked)}
+
+
+throttle = AuthThrottle(0)   # off until configure(fast=True)
+
+
+def configure(fast: bool = False, max_attempts: int = AUTH_MAX_ATTEMPTS,
+              failures: int = THROTTLE_FAILURES) -> AuthThrottle:
+    """Per-connection attempt limit, and the process-wide throttle (fast mode only)."""
+    global throttle, AUTH_MAX_ATTEMPTS
+    AUTH_MAX_ATTEMPTS = max_attempts
+    throttle = AuthThrottle(failures if fast else 0)
+    return throttle
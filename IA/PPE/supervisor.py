@@ -0,0 +1,274 @@
+"""
+Multi-process mode (``python honeypot_ssh.py --workers N``).
+
+paramiko's crypto runs under the GIL: one honeypot process never uses more
+than one core for its handshakes, however many threads it has. The
+supervisor runs N worker processes instead, each a complete honeypot
+(``honeypot_ssh.py`` with the same arguments plus ``--worker-index``):
+
+- Listening: every worker binds the port itself with SO_REUSEPORT and the
+  kernel spreads the connections; where SO_REUSEPORT doesn't exist, the
+  supervisor binds once and the workers inherit the socket (``--listen-fd``)
+  and share its accept queue.
+- Host keys are loaded (generated on first run) here, before any worker
+  starts: they all present the same fingerprint.
+- Event log: a worker doesn't write the log file, its events go down a pipe
+  (log_writer.PipeWriter) and the supervisor writes them all to the one
+  event log, with rotation and index as before.
+- Metrics: each worker serves /metrics on a free local port, the
+  supervisor's endpoint includes them tagged worker="i",generation="g".
+- SIGHUP reloads: a new generation of workers is started (re-reading the
+  corpus, routing table, prefetch model and code), and once it is up the old
+  one gets DRAIN_SIGNAL: it stops accepting and exits when its sessions have
+  ended (honeypot_ssh.DRAIN_TIMEOUT at most). A worker that dies is
+  restarted, with a backoff if it keeps dying.
+- SIGTERM / SIGINT stop the workers and flush the log.
+
+Each worker has its own LLM scheduler (llm_adapter.LLM_SCHEDULER_WORKERS
+generations at once): the model server sees up to N times that.
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+import metrics
+import ssh_handshake
+from log_writer import LOG_FD_ENV, get_writer
+from utils import EVENT_LOG, get_logger
+
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT")   # else the workers inherit one listening socket
+READY_TIMEOUT = 60.0         # seconds a new worker gets to start listening
+STOP_TIMEOUT = 10.0          # seconds between SIGTERM and SIGKILL on shutdown
+RESPAWN_DELAY = 1.0          # first restart delay of a crashing worker, doubled up to ...
+RESPAWN_MAX_DELAY = 60.0     # ... this while it keeps dying within MIN_UPTIME
+MIN_UPTIME = 30.0
+SCRAPE_TIMEOUT = 2.0
+
+WORKERS_UP = metrics.gauge("honeypot_workers", "Worker processes serving (multi-process mode)")
+RESTARTS = metrics.counter("honeypot_worker_restarts_total", "Worker processes started again", ("reason",))
+
+log = get_logger("supervisor")
+
+
+# =========================
+# WORKERS
+# =========================
+class Worker:
+    """One worker process and the thread copying its events to the log."""
+
+    def __init__(self, index: int, generation: int, cmd: list, listen_fd: int | None, writer):
+        self.index = index
+        self.generation = generation
+        self.ready = threading.Event()
+        self.metrics_port = None
+        self.started = time.monotonic()
+        read_fd, write_fd = os.pipe()
+        pass_fds = (write_fd,) if listen_fd is None else (write_fd, listen_fd)
+        try:
+            self.proc = subprocess.Popen(cmd + ["--worker-index", str(index)], pass_fds=pass_fds,
+                                         env={**os.environ, LOG_FD_ENV: str(write_fd)})
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self._pump = threading.Thread(target=self._copy_events, args=(read_fd, writer),
+                                      name=f"worker-{index}-log", daemon=True)
+        self._pump.start()
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+    def _copy_events(self, fd: int, writer):
+        with os.fdopen(fd, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("type") == "worker_ready":
+                    self.metrics_port = entry.get("metrics_port")
+                    self.ready.set()
+                writer.write(entry)
+
+    def signal(self, signum: int):
+        try:
+            self.proc.send_signal(signum)
+        except ProcessLookupError:
+            pass
+
+    def scrape(self, host: str):
+        if not self.metrics_port or self.proc.poll() is not None:
+            return None
+        with urlopen(f"http://{host}:{self.metrics_port}/metrics", timeout=SCRAPE_TIMEOUT) as r:
+            return r.read().decode("utf-8")
+
+    def join(self, timeout: float = None):
+        """Wait for the pipe's EOF: every event of the worker is in the log."""
+        self._pump.join(timeout)
+
+
+class Supervisor:
+    def __init__(self, cmd: list, workers: int, listen_fd: int | None, metrics_host: str,
+                 drain_signal: int = signal.SIGUSR1):
+        self.cmd = cmd
+        self.drain_signal = drain_signal
+        self.n = workers
+        self.listen_fd = listen_fd
+        self.metrics_host = metrics_host
+        self.writer = get_writer(EVENT_LOG)
+        self.generation = 0
+        self.workers = {}        # index -> Worker of the current generation
+        self.draining = []       # workers of older generations, finishing their sessions
+        self.exited = []         # waiting for the rest of their events
+        self._backoff = {}       # index -> (delay, respawn at)
+        self._reload = threading.Event()
+        self._stop = threading.Event()
+
+    def spawn(self, index: int) -> Worker:
+        w = Worker(index, self.generation, self.cmd, self.listen_fd, self.writer)
+        log.info("worker %d started (pid %d, generation %d)", index, w.pid, self.generation)
+        return w
+
+    def start(self) -> bool:
+        """First generation; False if it didn't come up."""
+        self.generation = 1
+        self.workers = {i: self.spawn(i) for i in range(self.n)}
+        return self._wait_ready(self.workers.values())
+
+    def _wait_ready(self, workers) -> bool:
+        deadline = time.monotonic() + READY_TIMEOUT
+        for w in workers:
+            while not w.ready.wait(0.2):
+                if w.proc.poll() is not None or time.monotonic() > deadline or self._stop.is_set():
+                    return False
+        return True
+
+    def reload(self):
+        """New generation up first, then the old one drains."""
+        self.generation += 1
+        new = {i: self.spawn(i) for i in range(self.n)}
+        if not self._wait_ready(new.values()):
+            log.error("generation %d failed to start, keeping generation %d", self.generation, self.generation - 1)
+            for w in new.values():
+                w.signal(signal.SIGKILL)
+                w.proc.wait()
+                self.exited.append(w)
+            return
+        old, self.workers = self.workers, new
+        self._backoff.clear()
+        for w in old.values():
+            w.signal(self.drain_signal)
+            self.draining.append(w)
+        RESTARTS.labels("reload").inc(len(new))
+        log.info("generation %d serving, %d old workers draining", self.generation, len(old))
+
+    def poll(self):
+        """Restart the workers that died; collect the drained ones."""
+        now = time.monotonic()
+        for w in [w for w in self.draining if w.proc.poll() is not None]:
+            self.draining.remove(w)
+            self.exited.append(w)
+            log.info("worker %d of generation %d drained (exit %s)", w.index, w.generation, w.proc.returncode)
+        for index, w in list(self.workers.items()):
+            if w.proc.poll() is None:
+                continue
+            delay, at = self._backoff.get(index, (0.0, None))
+            if at is None:
+                delay = RESPAWN_DELAY if now - w.started >= MIN_UPTIME else min(max(delay * 2, RESPAWN_DELAY),
+                                                                               RESPAWN_MAX_DELAY)
+                self._backoff[index] = (delay, now + delay)
+                log.warning("worker %d (pid %d) exited with %s, restarting in %.0f s",
+                            index, w.pid, w.proc.returncode, delay)
+            elif now >= at:
+                self.exited.append(w)
+                self.workers[index] = self.spawn(index)
+                self._backoff[index] = (delay, None)
+                RESTARTS.labels("exit").inc()
+        for w in [w for w in self.exited if not w._pump.is_alive()]:
+            self.exited.remove(w)
+
+    def stop(self):
+        workers = list(self.workers.values()) + self.draining
+        for w in workers:
+            w.signal(signal.SIGTERM)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for w in workers:
+            try:
+                w.proc.wait(max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                w.signal(signal.SIGKILL)
+                w.proc.wait()
+        for w in workers + self.exited:
+            w.join(STOP_TIMEOUT)
+
+    def serving(self) -> int:
+        return sum(1 for w in self.workers.values() if w.ready.is_set() and w.proc.poll() is None)
+
+    def worker_metrics(self) -> list:
+        parts = []
+        for w in list(self.workers.values()) + self.draining:
+            try:
+                text = w.scrape(self.metrics_host)
+            except OSError:
+                continue
+            if text:
+                parts.append((f'worker="{w.index}",generation="{w.generation}"', text))
+        return parts
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: self._reload.set())
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self._stop.set())
+        try:
+            while not self._stop.wait(0.5):
+                if self._reload.is_set():
+                    self._reload.clear()
+                    self.reload()
+                self.poll()
+        finally:
+            self.stop()
+
+
+# =========================
+# ENTRY POINT
+# =========================
+def run_supervisor(args, argv: list):
+    """`honeypot_ssh.py --workers N` lands here (args: its parsed arguments)."""
+    from honeypot_ssh import DRAIN_SIGNAL, make_listen_socket
+
+    key_types = tuple(t.strip() for t in args.host_keys.split(",") if t.strip())
+    host_keys = ssh_handshake.load_host_keys(key_types)
+
+    cmd = [sys.executable, str(Path(sys.argv[0]).resolve())] + list(argv)
+    listen_sock = None
+    if not REUSE_PORT:
+        listen_sock = make_listen_socket(args.host, args.port)
+        cmd += ["--listen-fd", str(listen_sock.fileno())]
+    metrics_server = metrics.serve(args.metrics_host, args.metrics_port)
+
+    sup = Supervisor(cmd, args.workers, listen_sock.fileno() if listen_sock else None, args.metrics_host,
+                     DRAIN_SIGNAL)
+    WORKERS_UP.fn = sup.serving
+    metrics.add_source(sup.worker_metrics)
+
+    print(f"[+] Supervisor: {args.workers} workers on {args.host}:{args.port} "
+          f"({'SO_REUSEPORT' if REUSE_PORT else 'shared listening socket'}), pid {os.getpid()}")
+    print(f"[i] Host keys: {', '.join(k.get_name() for k in host_keys)}")
+    if metrics_server is not None:
+        print(f"[i] Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics (all workers)")
+    print("[i] kill -HUP to restart the workers gracefully")
+
+    if not sup.start():
+        log.error("workers failed to start")
+        sup.stop()
+        sys.exit(1)
+    sup.run()
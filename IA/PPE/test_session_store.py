@@ -0,0 +1,45 @@
+"""
+Session records keep every command: `python -m pytest test_session_store.py`
+(or `python -m unittest test_session_store`).
+"""
+import tempfile
+import unittest
+
+from fs_engine import SessionState
+from session_store import SessionStore, load_session
+
+
+class CheckpointHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SessionStore(self.tmp.name, checkpoint_commands=20).start()
+        self.st = SessionState("user", "/home/user", "honeypot")
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def run_commands(self, cmds):
+        for cmd in cmds:
+            self.st.add_history(cmd)
+            self.store.after_command(self.st, "sid")
+
+    def saved_history(self):
+        self.store.finish(self.st, "sid")
+        self.store.close()
+        return load_session(self.store.path_for("sid"))["history"]
+
+    def test_past_the_history_cap(self):
+        cmds = [f"cmd{i}" for i in range(700)]  # SessionState keeps the last 500
+        self.run_commands(cmds)
+        self.assertEqual(self.saved_history(), cmds)
+
+    def test_history_clear(self):
+        self.run_commands([f"cmd{i}" for i in range(40)])
+        self.st.history.clear()  # `history -c`, after a checkpoint
+        self.run_commands(["after0", "after1", "after2"])
+        self.assertEqual(self.saved_history()[-4:], ["cmd39", "after0", "after1", "after2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,23 @@
+import logging
+import threading
+import time
 from pathlib import Path
-import json
 from datetime import datetime, timezone
 
+import metrics
+from log_writer import get_writer
+
 LOG_DIR = Path("logs")
+EVENT_LOG = LOG_DIR / "honeypot_sessions.jsonl"
+
+# Console diagnostics (not the event log): level, and per call site a burst of
+# LOG_BURST messages then LOG_RATE per second; the rest is counted, not printed.
+LOG_LEVEL = "INFO"
+LOG_RATE = 5.0
+LOG_BURST = 20
+
+EVENTS = metrics.counter("honeypot_events_total", "Events handed to the event log", ("type",))
+LOG_SUPPRESSED = metrics.counter("honeypot_log_suppressed_total", "Console messages dropped by the rate limit")
 
 def utc_now() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
@@ -10,9 +25,9 @@ def utc_now() -> str:
 def log_event(session_id: str, client_addr, event_type: str, data: dict):
     """
     Log event in simplified JSONL format.
+    The entry is handed to the background writer (see log_writer.py): this
+    never touches the disk and never blocks the session.
     """
-    LOG_DIR.mkdir(exist_ok=True)
-    
     entry = {
         "ts": utc_now(),
         "sid": session_id,
@@ -29,14 +44,92 @@ def log_event(session_id: str, client_addr, event_type: str, data: dict):
         entry["cmd"] = data.get("cmd", "")
         entry["out"] = data.get("output", "")[:500]  # limit output length
         entry["code"] = data.get("exit_code", 0)
+        if "routes" in data:
+            entry["routes"] = data["routes"]  # routing.py decision + dispatch ms per command
     else:
         entry.update(data or {})
 
-    with (LOG_DIR / "honeypot_sessions.jsonl").open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    EVENTS.labels(event_type).inc()
+    get_writer(EVENT_LOG).write(entry)
 
 def to_crlf(s: str) -> str:
     if s is None:
         return ""
     s = s.replace("\r\n", "\n").replace("\r", "\n")
     return s.replace("\n", "\r\n")
+
+class CrlfStream:
+    """Incremental to_crlf() for text that arrives in pieces.
+
+    A trailing "\r" is held back until the next piece, since it may be the
+    first half of a "\r\n" split across two chunks.
+    """
+
+    def __init__(self):
+        self._cr = False
+
+    def feed(self, s: str) -> str:
+        if not s:
+            return ""
+        if self._cr:
+            s = "\r" + s
+            self._cr = False
+        if s.endswith("\r"):
+            s = s[:-1]
+            self._cr = True
+        return to_crlf(s)
+
+    def flush(self) -> str:
+        if self._cr:
+            self._cr = False
+            return "\r\n"
+        return ""
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site (file, line): a flood of auth attempts or
+    LLM calls can't turn the console into the bottleneck. The next message
+    that gets through says how many were dropped."""
+
+    def __init__(self, rate: float = LOG_RATE, burst: int = LOG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._sites = {}  # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [float(self.burst), now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                LOG_SUPPRESSED.inc()
+                return False
+            site[0] -= 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+_log_handler = None
+
+def configure_logging(level: str = LOG_LEVEL, rate: float = LOG_RATE, burst: int = LOG_BURST):
+    """Leveled, rate-limited console output for every `honeypot.*` logger."""
+    global _log_handler
+    root = logging.getLogger("honeypot")
+    if _log_handler is None:
+        _log_handler = logging.StreamHandler()
+        _log_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(_log_handler)
+        root.propagate = False
+    for f in list(_log_handler.filters):
+        _log_handler.removeFilter(f)
+    _log_handler.addFilter(RateLimitFilter(rate, burst))
+    root.setLevel(level.upper())
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"honeypot.{name}")